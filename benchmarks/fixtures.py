@@ -0,0 +1,157 @@
+"""
+Deterministic synthetic data for the benchmarks. Everything is generated
+from a seeded `Random`, so the same arguments always give the same data.
+"""
+from math import cos, pi, sin
+from random import Random
+
+FIRST_NAMES = ('Jo', 'Alex', 'Chris', 'Sam', 'Ali', 'Nia', 'Dafydd', 'Siân', 'Zoë', 'Łukasz')
+LAST_NAMES = ('Smith', 'Jones', 'Patel', 'Williams', 'O’Brien', 'Nguyen', 'Evans', 'Kowalski')
+TOWNS = ('London', 'Leeds', 'Bristol', 'Cardiff', 'Belfast', 'Glasgow', 'Swansea')
+COUNTRIES = ('France', 'Fiji', 'Germany', 'Japan', 'Brazil')
+DOMAINS = ('example.com', 'example.gov.uk', 'mail.example.co.uk', 'example.org', 'xn--r8jz45g.example')
+POSTCODE_LETTERS = 'ABDEFGHJLNPQRSTUWXYZ'
+
+SMS_MESSAGES = {
+    'pure GSM': 'Your appointment is at 10:30am on Monday 4 January. Reply STOP to cancel. ' * 4,
+    'Welsh': 'Mae eich apwyntiad am 10:30yb ddydd Llun. Diolch yn fawr – gŵyl, tŷ, â, ŵ, ŷ. ' * 4,
+    'emoji heavy': 'Congratulations 🎉🎉 your parcel 📦 is on its way 🚚 – see you soon 👋😀 ' * 4,
+}
+
+TEMPLATE_CONTENT = (
+    'Dear ((name)),\n'
+    '\n'
+    '# Your application\n'
+    '\n'
+    'Your reference number is ((reference)). We received it on ((date)).\n'
+    '\n'
+    '* check your details at https://www.gov.uk/apply\n'
+    '* contact us if anything is wrong - we’re here to help\n'
+    '\n'
+    '^ Do not reply to this message.\n'
+    '\n'
+    '((show_extra??Thanks for using the “new” service.))\n'
+    '\n'
+    'The team'
+)
+
+TEMPLATE_VALUES = {
+    'name': 'Jo Smith',
+    'reference': 'ABC-123',
+    'date': '12 March 2021',
+    'show_extra': 'yes',
+    'address line 1': 'Jo Smith',
+    'address line 2': '1 Example Street',
+    'address line 3': 'London',
+    'postcode': 'SW1A 1AA',
+}
+
+
+def make_name(random):
+    return '{} {}'.format(random.choice(FIRST_NAMES), random.choice(LAST_NAMES))
+
+
+def make_uk_postcode(random):
+    return '{}{} {}{}'.format(
+        random.choice(('N', 'E', 'SW', 'SE', 'W', 'CF', 'BT', 'G')),
+        random.randrange(1, 20),
+        random.randrange(1, 10),
+        ''.join(random.choice(POSTCODE_LETTERS) for _ in range(2)),
+    )
+
+
+def make_phone_number(random):
+    return random.choice((
+        lambda: '07{:09d}'.format(random.randrange(10 ** 9)),
+        lambda: '+44 7{:03d} {:06d}'.format(random.randrange(1000), random.randrange(10 ** 6)),
+        lambda: '(+44) 07{:03d}-{:03d}-{:03d}'.format(*(random.randrange(1000) for _ in range(3))),
+        lambda: '+1 202 555 {:04d}'.format(random.randrange(10_000)),
+        lambda: '+33 6 {:08d}'.format(random.randrange(10 ** 8)),
+        lambda: '0800 {:06d}'.format(random.randrange(10 ** 6)),  # not a mobile
+        lambda: '07{:05d}'.format(random.randrange(10 ** 5)),  # too short
+    ))()
+
+
+def make_email_address(random):
+    return random.choice((
+        lambda: '{}.{}@{}'.format(
+            random.choice(FIRST_NAMES), random.choice(LAST_NAMES), random.choice(DOMAINS)
+        ).lower(),
+        lambda: 'user+{}@{}'.format(random.randrange(10_000), random.choice(DOMAINS)),
+        lambda: ' padded{}@{} '.format(random.randrange(100), random.choice(DOMAINS)),
+        lambda: 'no.at.sign.{}'.format(random.choice(DOMAINS)),  # invalid
+        lambda: 'double..dot@{}'.format(random.choice(DOMAINS)),  # invalid
+    ))()
+
+
+def make_postal_address(random):
+    lines = [
+        make_name(random),
+        '{} Example Street'.format(random.randrange(1, 1000)),
+        random.choice(TOWNS),
+    ]
+    if random.random() < 0.2:
+        lines.append(random.choice(COUNTRIES))
+    else:
+        lines.append(make_uk_postcode(random))
+    return '\n'.join(lines)
+
+
+def make_phone_numbers(count, seed=0):
+    random = Random(seed)
+    return [make_phone_number(random) for _ in range(count)]
+
+
+def make_email_addresses(count, seed=0):
+    random = Random(seed)
+    return [make_email_address(random) for _ in range(count)]
+
+
+def make_postal_addresses(count, seed=0):
+    random = Random(seed)
+    return [make_postal_address(random) for _ in range(count)]
+
+
+def make_sms_csv(number_of_rows, seed=0):
+    random = Random(seed)
+    return 'phone number,name,reference\n' + '\n'.join(
+        '{},{},{}'.format(make_phone_number(random), make_name(random), random.randrange(10 ** 6))
+        for _ in range(number_of_rows)
+    )
+
+
+def make_email_csv(number_of_rows, seed=0):
+    random = Random(seed)
+    return 'email address,name,reference\n' + '\n'.join(
+        '{},{},{}'.format(make_email_address(random), make_name(random), random.randrange(10 ** 6))
+        for _ in range(number_of_rows)
+    )
+
+
+def make_letter_csv(number_of_rows, seed=0):
+    random = Random(seed)
+    return 'address line 1,address line 2,address line 3,postcode\n' + '\n'.join(
+        make_postal_address(random).replace('\n', ',')
+        for _ in range(number_of_rows)
+    )
+
+
+def make_polygons(count=20, points_per_polygon=200, seed=0):
+    """
+    Roughly circular, jagged polygons of a few kilometres across, spread
+    over London
+    """
+    random = Random(seed)
+    polygons = []
+    for _ in range(count):
+        centre_x, centre_y = random.uniform(-0.5, 0.3), random.uniform(51.3, 51.7)
+        radius = random.uniform(0.005, 0.03)
+        polygon = [
+            [
+                centre_x + radius * random.uniform(0.7, 1.3) * cos(2 * pi * point / points_per_polygon),
+                centre_y + radius * random.uniform(0.7, 1.3) * sin(2 * pi * point / points_per_polygon),
+            ]
+            for point in range(points_per_polygon)
+        ]
+        polygons.append(polygon + polygon[:1])
+    return polygons
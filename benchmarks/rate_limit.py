@@ -0,0 +1,60 @@
+"""
+Compares `RedisClient.exceeded_rate_limit`, which keeps a sorted set with
+a member for every request, with `exceeded_scripted_rate_limit`, which
+keeps a constant amount of state per key in a Lua script.
+
+Needs a Redis server which it’s safe to write test keys to. Run from the
+root of the repo with:
+
+    REDIS_URL=redis://localhost:6379/15 python benchmarks/rate_limit.py
+"""
+import os
+import sys
+from time import perf_counter
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notifications_utils.clients.redis.redis_client import (  # noqa: E402
+    RedisClient,
+)
+
+LIMITERS = {
+    'sorted set': lambda redis_client, key, limit: redis_client.exceeded_rate_limit(key, limit, 60),
+    'gcra': lambda redis_client, key, limit: redis_client.exceeded_scripted_rate_limit(key, limit, 60),
+    'sliding window': lambda redis_client, key, limit: redis_client.exceeded_scripted_rate_limit(
+        key, limit, 60, algorithm='sliding-window',
+    ),
+}
+
+
+def main():
+    app = Flask(__name__)
+    app.config['REDIS_ENABLED'] = True
+    app.config['REDIS_URL'] = os.environ.get('REDIS_URL', 'redis://localhost:6379/15')
+
+    with app.app_context():
+        redis_client = RedisClient()
+        redis_client.init_app(app)
+
+        sys.stdout.write('{:<16} {:>8} {:>14} {:>14}\n'.format('limiter', 'limit', 'per request', 'key size'))
+        for limit in (100, 3_000, 50_000):
+            for name, exceeded_rate_limit in LIMITERS.items():
+                key = 'rate-limit-benchmark-{}-{}'.format(name.replace(' ', '-'), limit)
+                redis_client.delete(key)
+                start = perf_counter()
+                for _ in range(limit):
+                    exceeded_rate_limit(redis_client, key, limit)
+                elapsed = perf_counter() - start
+                sys.stdout.write('{:<16} {:>8} {:>12.1f}µs {:>8} bytes\n'.format(
+                    name,
+                    limit,
+                    elapsed / limit * 1_000_000,
+                    redis_client.redis_store.memory_usage(key),
+                ))
+                redis_client.delete(key)
+
+
+if __name__ == '__main__':
+    main()
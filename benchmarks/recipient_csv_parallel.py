@@ -0,0 +1,58 @@
+"""
+Shows how validating a big letter spreadsheet scales with the number of
+processes used by `RecipientCSV(max_workers=…)`.
+
+Run from the root of the repo with:
+
+    python benchmarks/recipient_csv_parallel.py --rows 100000
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fixtures import make_letter_csv  # noqa: E402
+
+from notifications_utils.recipients import RecipientCSV  # noqa: E402
+from notifications_utils.template import LetterImageTemplate  # noqa: E402
+
+
+def time_validation(file_data, max_workers):
+    recipients = RecipientCSV(
+        file_data,
+        template=LetterImageTemplate(
+            {'content': 'Dear ((address line 1))', 'subject': 'Hello', 'template_type': 'letter'},
+            image_url='https://example.com',
+            page_count=1,
+        ),
+        # More than one worker always stores rows in columns, so the
+        # single worker baseline does too
+        columnar=True,
+        max_workers=max_workers,
+    )
+    start = perf_counter()
+    recipients.has_errors
+    return perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    file_data = make_letter_csv(args.rows)
+    serial_time = None
+
+    sys.stdout.write('{:>8} {:>10} {:>8}\n'.format('workers', 'seconds', 'speedup'))
+
+    for max_workers in range(1, args.max_workers + 1):
+        elapsed = time_validation(file_data, max_workers)
+        serial_time = serial_time or elapsed
+        sys.stdout.write('{:>8} {:>10.2f} {:>7.2f}x\n'.format(max_workers, elapsed, serial_time / elapsed))
+
+
+if __name__ == '__main__':
+    main()
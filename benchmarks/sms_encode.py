@@ -0,0 +1,44 @@
+"""
+Compares `SanitiseSMS.encode`, which uses a translation table, with
+encoding one character at a time using `SanitiseSMS.encode_char`.
+
+Run from the root of the repo with:
+
+    python benchmarks/sms_encode.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notifications_utils.sanitise_text import SanitiseSMS  # noqa: E402
+
+MESSAGES = {
+    'pure GSM': 'Your appointment is at 10:30am on Monday 4 January. Reply STOP to cancel. ' * 4,
+    'Welsh': 'Mae eich apwyntiad am 10:30yb ddydd Llun. Diolch yn fawr – gŵyl, tŷ, â, ŵ, ŷ. ' * 4,
+    'emoji heavy': 'Congratulations 🎉🎉 your parcel 📦 is on its way 🚚 – see you soon 👋😀 ' * 4,
+}
+
+
+def encode_one_character_at_a_time(content):
+    return ''.join(SanitiseSMS.encode_char(char) for char in content)
+
+
+def main():
+    number = 2_000
+    sys.stdout.write('{:<12} {:>16} {:>16} {:>8}\n'.format('input', 'per character', 'table', 'speedup'))
+    for name, message in MESSAGES.items():
+        assert SanitiseSMS.encode(message) == encode_one_character_at_a_time(message)
+        per_character = timeit.timeit(lambda: encode_one_character_at_a_time(message), number=number)
+        table = timeit.timeit(lambda: SanitiseSMS.encode(message), number=number)
+        sys.stdout.write('{:<12} {:>14.2f}µs {:>14.2f}µs {:>7.1f}x\n'.format(
+            name,
+            per_character / number * 1_000_000,
+            table / number * 1_000_000,
+            per_character / table,
+        ))
+
+
+if __name__ == '__main__':
+    main()
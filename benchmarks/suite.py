@@ -0,0 +1,415 @@
+"""
+Times the hot paths in notifications_utils, using deterministic synthetic
+data, so the results of two runs can be compared.
+
+Run from the root of the repo with:
+
+    python benchmarks/suite.py --save baseline.json
+
+then, after making a change:
+
+    python benchmarks/suite.py --compare baseline.json
+
+which exits with a status of 1 if anything got slower by more than the
+threshold (10% by default), compared with the median time in the
+baseline as well as the fastest. Timings on a busy machine are noisy,
+so anything which looks slower is timed again, up to `--retries` times,
+before it counts. Use `--filter` to run a subset of the benchmarks by
+name, and `--quick` to skip the slowest ones.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import re
+import sys
+from datetime import datetime
+from statistics import median
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fixtures  # noqa: E402
+
+from notifications_utils.logging import (  # noqa: E402
+    LOG_FORMAT,
+    TIME_FORMAT,
+    JSONFormatter,
+)
+from notifications_utils.polygons import Polygons  # noqa: E402
+from notifications_utils.postal_address import PostalAddress  # noqa: E402
+from notifications_utils.recipients import (  # noqa: E402
+    InvalidEmailError,
+    InvalidPhoneError,
+    RecipientCSV,
+    validate_email_address,
+    validate_email_addresses,
+    validate_phone_number,
+    validate_phone_numbers,
+)
+from notifications_utils.sanitise_text import SanitiseSMS  # noqa: E402
+from notifications_utils.template import (  # noqa: E402
+    BroadcastMessageTemplate,
+    BroadcastPreviewTemplate,
+    EmailPreviewTemplate,
+    HTMLEmailTemplate,
+    LetterImageTemplate,
+    LetterPreviewTemplate,
+    LetterPrintTemplate,
+    PlainTextEmailTemplate,
+    SMSBodyPreviewTemplate,
+    SMSMessageTemplate,
+    SMSPreviewTemplate,
+)
+from notifications_utils.version import __version__  # noqa: E402
+
+# Each benchmark is a function which does any setup, then returns a
+# function which does the work being timed
+BENCHMARKS = {}
+
+# Benchmarks skipped by `--quick`
+SLOW_BENCHMARKS = set()
+
+
+def benchmark(name, slow=False):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if slow:
+            SLOW_BENCHMARKS.add(name)
+        return setup
+    return register
+
+
+def register_recipient_csv_benchmarks():
+
+    templates = {
+        'sms': lambda: SMSMessageTemplate({'content': 'Hello ((name)), ref ((reference))', 'template_type': 'sms'}),
+        'email': lambda: PlainTextEmailTemplate({
+            'content': 'Hello ((name)), ref ((reference))', 'subject': 'Hello', 'template_type': 'email',
+        }),
+        'letter': lambda: LetterImageTemplate(
+            {'content': 'Dear ((address line 1))', 'subject': 'Hello', 'template_type': 'letter'},
+            image_url='https://example.com',
+            page_count=1,
+        ),
+    }
+    make_csv = {
+        'sms': fixtures.make_sms_csv,
+        'email': fixtures.make_email_csv,
+        'letter': fixtures.make_letter_csv,
+    }
+
+    for template_type, template in templates.items():
+        for number_of_rows in (1_000, 10_000, 100_000):
+
+            def setup(template_type=template_type, template=template, number_of_rows=number_of_rows):
+                file_data = make_csv[template_type](number_of_rows)
+                return lambda: RecipientCSV(
+                    file_data,
+                    template=template(),
+                    allow_international_sms=True,
+                    allow_international_letters=True,
+                ).has_errors
+
+            benchmark(
+                'RecipientCSV.has_errors[{}-{}]'.format(template_type, number_of_rows),
+                slow=number_of_rows >= 100_000,
+            )(setup)
+
+
+@benchmark('RecipientCSV.allowed_to_send_to[sms-1000]')
+def check_recipient_csv_against_whitelist():
+    file_data = fixtures.make_sms_csv(1_000)
+    # Every row is checked, because every recipient is in the whitelist
+    whitelist = [line.split(',')[0] for line in file_data.splitlines()[1:]]
+    return lambda: RecipientCSV(
+        file_data,
+        template=SMSMessageTemplate({'content': 'Hello ((name))', 'template_type': 'sms'}),
+        whitelist=whitelist,
+        allow_international_sms=True,
+    ).allowed_to_send_to
+
+
+def register_template_benchmarks():
+
+    email = {'content': fixtures.TEMPLATE_CONTENT, 'subject': 'About ((reference))', 'template_type': 'email'}
+    letter = dict(email, template_type='letter')
+    sms = {'content': fixtures.TEMPLATE_CONTENT, 'template_type': 'sms'}
+    broadcast = dict(sms, template_type='broadcast')
+    date = datetime(2021, 3, 12)
+
+    templates = (
+        (SMSMessageTemplate, sms, {'prefix': 'Service name'}),
+        (SMSBodyPreviewTemplate, sms, {}),
+        (SMSPreviewTemplate, sms, {'prefix': 'Service name'}),
+        (BroadcastMessageTemplate, broadcast, {}),
+        (BroadcastPreviewTemplate, broadcast, {}),
+        (PlainTextEmailTemplate, email, {}),
+        (HTMLEmailTemplate, email, {}),
+        (EmailPreviewTemplate, email, {}),
+        (LetterPreviewTemplate, letter, {'contact_block': 'Contact us\n0800 000 000', 'date': date}),
+        (LetterPrintTemplate, letter, {'contact_block': 'Contact us\n0800 000 000', 'date': date}),
+        (LetterImageTemplate, letter, {'image_url': 'https://example.com', 'page_count': 2, 'postage': 'second'}),
+    )
+
+    for template_class, template, kwargs in templates:
+
+        def setup(template_class=template_class, template=template, kwargs=kwargs):
+            return lambda: str(template_class(template, fixtures.TEMPLATE_VALUES, **kwargs))
+
+        benchmark('{}.__str__'.format(template_class.__name__))(setup)
+
+
+def register_sms_encode_benchmarks():
+    for name, message in fixtures.SMS_MESSAGES.items():
+        benchmark('SanitiseSMS.encode[{}]'.format(name))(
+            lambda message=message: lambda: SanitiseSMS.encode(message)
+        )
+
+
+def _validate_all(validate, error, values, **kwargs):
+    for value in values:
+        try:
+            validate(value, **kwargs)
+        except error:
+            pass
+
+
+@benchmark('validate_email_address[1000]')
+def validate_email_addresses_one_at_a_time():
+    email_addresses = fixtures.make_email_addresses(1_000)
+    return lambda: _validate_all(validate_email_address, InvalidEmailError, email_addresses)
+
+
+@benchmark('validate_email_addresses[1000]')
+def validate_email_addresses_in_bulk():
+    email_addresses = fixtures.make_email_addresses(1_000)
+    return lambda: validate_email_addresses(email_addresses)
+
+
+@benchmark('validate_phone_number[1000]')
+def validate_phone_numbers_one_at_a_time():
+    phone_numbers = fixtures.make_phone_numbers(1_000)
+    return lambda: _validate_all(validate_phone_number, InvalidPhoneError, phone_numbers, international=True)
+
+
+@benchmark('validate_phone_numbers[1000]')
+def validate_phone_numbers_in_bulk():
+    phone_numbers = fixtures.make_phone_numbers(1_000)
+    return lambda: validate_phone_numbers(phone_numbers, international=True)
+
+
+@benchmark('PostalAddress.normalised[1000]')
+def normalise_postal_addresses():
+    addresses = fixtures.make_postal_addresses(1_000)
+
+    def normalise():
+        for address in addresses:
+            PostalAddress(address, allow_international_letters=True).normalised
+
+    return normalise
+
+
+@benchmark('Polygons.smooth')
+def smooth_polygons():
+    polygons = fixtures.make_polygons()
+    # `smooth` is a cached property, so each run needs a new instance
+    return lambda: Polygons(polygons).smooth
+
+
+@benchmark('Polygons.simplify')
+def simplify_polygons():
+    polygons = fixtures.make_polygons()
+    return lambda: Polygons(polygons).simplify
+
+
+@benchmark('JSONFormatter.format[1000]')
+def format_log_records():
+    formatter = JSONFormatter(LOG_FORMAT, TIME_FORMAT)
+    records = []
+    for i in range(1_000):
+        record = logging.LogRecord('app', logging.INFO, __file__, i, 'Processed notification %s', (i,), None)
+        record.__dict__.update(app_name='api', request_id='no-request-id', service_id='no-service-id')
+        records.append(record)
+
+    def format_all():
+        for record in records:
+            formatter.format(record)
+
+    return format_all
+
+
+register_recipient_csv_benchmarks()
+register_template_benchmarks()
+register_sms_encode_benchmarks()
+
+
+def time_function(function, repeat, minimum_time=0.2):
+    """
+    Like `timeit`, works out how many times to call `function` so that
+    each timing takes at least `minimum_time`, then returns the time per
+    call for each of `repeat` timings
+    """
+    number = 1
+    while True:
+        elapsed = _time_calls(function, number)
+        if elapsed >= minimum_time:
+            break
+        number = max(number * 2, int(number * minimum_time / max(elapsed, 1e-9)))
+    return number, [elapsed / number] + [
+        _time_calls(function, number) / number for _ in range(repeat - 1)
+    ]
+
+
+def _time_calls(function, number):
+    # Like `timeit`, garbage collection is turned off while timing
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        return perf_counter() - start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+
+def run(names, repeat):
+    results = {}
+    for name in names:
+        try:
+            number, timings = time_function(BENCHMARKS[name](), repeat)
+        except Exception as e:
+            # One broken benchmark shouldn’t stop the rest from running
+            sys.stdout.write('{:<55} {}: {}\n'.format(name, type(e).__name__, e))
+            continue
+        results[name] = {
+            'min': min(timings),
+            'median': median(timings),
+            'number': number,
+            'repeat': repeat,
+        }
+        sys.stdout.write('{:<55} {:>12} {:>12}\n'.format(
+            name, format_seconds(results[name]['min']), format_seconds(results[name]['median'])
+        ))
+    return results
+
+
+def time_slower_benchmarks_again(baseline, results, threshold, repeat, rounds):
+    """
+    Other processes on the machine can only make a benchmark slower, so
+    anything which looks slower than the baseline is timed again, up to
+    `rounds` more times, and its fastest time kept. A slowdown which is
+    just noise rarely lasts that long.
+    """
+    for _ in range(rounds):
+        slower = [
+            name for name, result in results.items()
+            if name in baseline and _has_regressed(baseline[name], result, threshold)
+        ]
+        if not slower:
+            return
+        sys.stdout.write('\nTiming {} again\n'.format(', '.join(slower)))
+        for name, result in run(slower, repeat).items():
+            if result['min'] < results[name]['min']:
+                results[name] = result
+
+
+def _change(baseline_result, result):
+    return result['min'] / baseline_result['min'] - 1
+
+
+def _has_regressed(baseline_result, result, threshold):
+    # The fastest time has to be slower than the baseline’s median, not
+    # just its fastest, so a lucky baseline timing doesn’t count
+    return result['min'] / baseline_result['median'] - 1 > threshold
+
+
+def compare(baseline, results, threshold):
+    """
+    Compares the fastest time for each benchmark with the baseline, and
+    returns the names of any which have slowed down by more than
+    `threshold`, compared with both the fastest and the median time in the
+    baseline
+    """
+    regressions = []
+    sys.stdout.write('\n{:<55} {:>12} {:>12} {:>9}\n'.format('benchmark', 'baseline', 'current', 'change'))
+    for name, result in results.items():
+        if name not in baseline:
+            sys.stdout.write('{:<55} {:>12} {:>12}\n'.format(name, '-', format_seconds(result['min'])))
+            continue
+        change = _change(baseline[name], result)
+        regressed = _has_regressed(baseline[name], result, threshold)
+        if regressed:
+            regressions.append(name)
+        sys.stdout.write('{:<55} {:>12} {:>12} {:>+8.1%}{}\n'.format(
+            name,
+            format_seconds(baseline[name]['min']),
+            format_seconds(result['min']),
+            change,
+            '  REGRESSION' if regressed else '',
+        ))
+    return regressions
+
+
+def format_seconds(seconds):
+    for unit, multiplier in (('s', 1), ('ms', 1e3), ('µs', 1e6)):
+        if seconds * multiplier >= 1:
+            return '{:.2f}{}'.format(seconds * multiplier, unit)
+    return '{:.0f}ns'.format(seconds * 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help='only run benchmarks whose name matches this regular expression')
+    parser.add_argument('--quick', action='store_true', help='skip the slowest benchmarks')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE', help='save the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare the results with a JSON baseline')
+    parser.add_argument('--threshold', type=float, default=0.1, help='slowdown to flag, as a fraction')
+    parser.add_argument(
+        '--retries', type=int, default=5, help='how many more times to time anything slower than the baseline',
+    )
+    parser.add_argument('--list', action='store_true', help='list the benchmarks without running them')
+    args = parser.parse_args()
+
+    names = [
+        name for name in BENCHMARKS
+        if (not args.filter or re.search(args.filter, name))
+        and not (args.quick and name in SLOW_BENCHMARKS)
+    ]
+
+    if args.list:
+        sys.stdout.write('\n'.join(names) + '\n')
+        return 0
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+    sys.stdout.write('{:<55} {:>12} {:>12}\n'.format('benchmark', 'min', 'median'))
+    results = run(names, args.repeat)
+
+    if args.compare:
+        time_slower_benchmarks_again(baseline, results, args.threshold, args.repeat, args.retries)
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump({
+                'version': __version__,
+                'python': platform.python_version(),
+                'results': results,
+            }, baseline_file, indent=2, sort_keys=True)
+
+    if args.compare:
+        if compare(baseline, results, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,6 +10,16 @@ hostname_part = re.compile(r'^(xn-|[a-z0-9]+)(-[a-z0-9]+)*$', re.IGNORECASE)
 tld_part = re.compile(r'^([a-z]{2,63}|xn--([a-z0-9]+-)*[a-z0-9]+)$', re.IGNORECASE)
 VALID_LOCAL_CHARS = r"a-zA-Z0-9.!#$%&'*+/=?^_`{|}~\-"
 EMAIL_REGEX_PATTERN = r'^[{}]+@([^.@][^@\s]+)$'.format(VALID_LOCAL_CHARS)
+email_regex = re.compile(EMAIL_REGEX_PATTERN)
+# The same checks as `hostname_part` on every part of an ASCII hostname
+# and `tld_part` on the last, plus the limits on the length of each part
+# and the whole hostname, as a single pattern
+ascii_hostname = re.compile(
+    r'(?=.{1,253}\Z)'
+    r'(?:(?=[a-z0-9-]{1,63}\.)(?:xn-|[a-z0-9]+)(?:-[a-z0-9]+)*\.)+'
+    r'(?=[a-z0-9-]{1,63}\Z)(?:[a-z]{2,63}|xn--(?:[a-z0-9]+-)*[a-z0-9]+)\Z',
+    re.IGNORECASE,
+)
 email_with_smart_quotes_regex = re.compile(
     # matches wider than an email - everything between an at sign and the nearest whitespace
     r'(^|\s)\S+@\S+(\s|$)',
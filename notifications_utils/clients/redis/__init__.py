@@ -1,8 +1,12 @@
 import json
 from contextlib import suppress
 from datetime import datetime, timedelta
-from functools import wraps
+from functools import partial, wraps
 from inspect import signature
+from threading import Lock
+from time import monotonic, sleep
+
+from cachetools import LRUCache
 
 
 def daily_limit_cache_key(service_id):
@@ -13,12 +17,52 @@ def rate_limit_cache_key(service_id, api_key_type):
     return "{}-{}".format(str(service_id), api_key_type)
 
 
+class _RedisLockHeld(Exception):
+    """
+    Raised instead of waiting while another process holds the Redis lock,
+    when there’s a stale response to return instead
+    """
+
+
 class RequestCache():
+    """
+    Decorators which cache the responses of API client methods in Redis,
+    and delete them when something changes.
+
+    By default every call goes to Redis. Optionally:
+    - `local_ttl` also keeps decoded responses in this process for that
+      many seconds, up to `local_maxsize` of them. Other processes can’t
+      tell this process when a response changes, so keep it short.
+    - `stale_ttl` lets a response which has been in this process for
+      less than `local_ttl + stale_ttl` seconds be returned while
+      another thread refreshes it, instead of waiting.
+    - `lock_timeout` means that when a response isn’t in Redis, only one
+      process calls the API, for up to that many seconds. The others
+      wait for the response to appear in Redis, or return a stale
+      response if they have one.
+
+    With a local cache, only one thread per process refreshes each
+    response at a time. Responses from the local cache are shared
+    between callers, so they mustn’t be changed.
+    """
 
     TTL = int(timedelta(days=7).total_seconds())
 
-    def __init__(self, redis_client):
+    # How often to check Redis while another process holds the lock
+    LOCK_POLL_INTERVAL = 0.05
+
+    # Threads refreshing different responses only wait for each other if
+    # the responses’ keys hash to the same one of this many locks
+    NUMBER_OF_LOCAL_LOCKS = 64
+
+    def __init__(self, redis_client, local_ttl=None, local_maxsize=1024, stale_ttl=0, lock_timeout=None):
         self.redis_client = redis_client
+        self.local_ttl = local_ttl
+        self.stale_ttl = stale_ttl
+        self.lock_timeout = lock_timeout
+        self.local_cache = LRUCache(maxsize=local_maxsize) if local_ttl is not None else None
+        self._local_cache_lock = Lock()
+        self._refresh_locks = [Lock() for _ in range(self.NUMBER_OF_LOCAL_LOCKS)]
 
     @staticmethod
     def _get_argument(argument_name, client_method, args, kwargs):
@@ -51,20 +95,106 @@ class RequestCache():
             @wraps(client_method)
             def new_client_method(*args, **kwargs):
                 redis_key = RequestCache._make_key(key_format, client_method, args, kwargs)
-                cached = self.redis_client.get(redis_key)
-                if cached:
-                    return json.loads(cached.decode('utf-8'))
-                api_response = client_method(*args, **kwargs)
-                self.redis_client.set(
-                    redis_key,
-                    json.dumps(api_response),
-                    ex=self.TTL,
-                )
-                return api_response
+                call_client_method = partial(client_method, *args, **kwargs)
+                if self.local_cache is None:
+                    return self._get_from_redis_or_client_method(redis_key, call_client_method)
+                return self._get_from_local_cache_or_refresh(redis_key, call_client_method)
 
             return new_client_method
         return _set
 
+    def _get_from_local_cache(self, redis_key):
+        """
+        Returns the response and whether it’s fresh, or `None` and `False`
+        if there’s nothing in the local cache which can be used
+        """
+        with self._local_cache_lock:
+            api_response, stored_at = self.local_cache.get(redis_key, (None, None))
+        if stored_at is None:
+            return None, False
+        age = monotonic() - stored_at
+        if age < self.local_ttl:
+            return api_response, True
+        if age < self.local_ttl + self.stale_ttl:
+            return api_response, False
+        return None, False
+
+    def _get_from_local_cache_or_refresh(self, redis_key, call_client_method):
+
+        api_response, fresh = self._get_from_local_cache(redis_key)
+        if fresh:
+            return api_response
+
+        stale = api_response
+        refresh_lock = self._refresh_locks[hash(redis_key) % len(self._refresh_locks)]
+
+        # Return a stale response rather than wait for another thread
+        # to refresh it
+        if not refresh_lock.acquire(blocking=stale is None):
+            return stale
+
+        try:
+            api_response, fresh = self._get_from_local_cache(redis_key)
+            if fresh:
+                # Another thread refreshed it while this one was waiting
+                return api_response
+            try:
+                api_response = self._get_from_redis_or_client_method(
+                    redis_key, call_client_method, has_stale=stale is not None,
+                )
+            except _RedisLockHeld:
+                # The stale response keeps the time it was stored, so it’s
+                # refreshed once the other process has put a new one in Redis
+                return stale
+            with self._local_cache_lock:
+                self.local_cache[redis_key] = (api_response, monotonic())
+            return api_response
+        finally:
+            refresh_lock.release()
+
+    def _get_from_redis_or_client_method(self, redis_key, call_client_method, has_stale=False):
+
+        cached = self.redis_client.get(redis_key)
+        if cached:
+            return json.loads(cached.decode('utf-8'))
+
+        lock_key = '{}-lock'.format(redis_key)
+        lock_token = None
+
+        if self.lock_timeout is not None:
+            lock_token = self.redis_client.acquire_lock(lock_key, int(self.lock_timeout * 1000))
+            if lock_token is None:
+                if has_stale:
+                    raise _RedisLockHeld
+                with suppress(LookupError):
+                    return self._wait_for_redis(redis_key)
+
+        try:
+            api_response = call_client_method()
+            self.redis_client.set(
+                redis_key,
+                json.dumps(api_response),
+                ex=self.TTL,
+            )
+        finally:
+            if lock_token is not None:
+                self.redis_client.release_lock(lock_key, lock_token)
+
+        return api_response
+
+    def _wait_for_redis(self, redis_key):
+        """
+        Waits up to `lock_timeout` seconds for another process to put a
+        response in Redis, and raises `LookupError` if it doesn’t
+        """
+        give_up_at = monotonic() + self.lock_timeout
+        while monotonic() < give_up_at:
+            sleep(self.LOCK_POLL_INTERVAL)
+            cached = self.redis_client.get(redis_key)
+            if cached:
+                return json.loads(cached.decode('utf-8'))
+        raise LookupError(redis_key)
+
     def delete(self, key_format):
 
         def _delete(client_method):
@@ -76,6 +206,9 @@ class RequestCache():
                 finally:
                     redis_key = self._make_key(key_format, client_method, args, kwargs)
                     self.redis_client.delete(redis_key)
+                    if self.local_cache is not None:
+                        with self._local_cache_lock:
+                            self.local_cache.pop(redis_key, None)
                 return api_response
 
             return new_client_method
@@ -1,6 +1,9 @@
 import numbers
 import uuid
-from time import time
+from collections import namedtuple
+from itertools import chain
+from threading import Thread
+from time import monotonic, time
 
 from flask import current_app
 from flask_redis import FlaskRedis
@@ -34,6 +37,14 @@ def prepare_value(val):
         raise ValueError('cannot cast {} to a string'.format(type(val)))
 
 
+deleted_keys = namedtuple('DeletedKeys', ['count', 'seconds'])
+
+RATE_LIMIT_ALGORITHMS = {
+    'gcra': 'gcra-rate-limit',
+    'sliding-window': 'sliding-window-rate-limit',
+}
+
+
 class RedisClient:
     redis_store = FlaskRedis()
     active = False
@@ -62,6 +73,76 @@ class RedisClient:
             """
         )
 
+        # Generic cell rate algorithm (GCRA). Spaces requests out evenly, allowing a burst of up to `limit`
+        # requests. Rejected requests aren’t counted. KEYS[1] is the rate limit key. ARGV is the limit, the interval
+        # in seconds and the current time in seconds.
+        # Stores the time of the last request and how far ahead of an even spacing of requests the key is, as
+        # whole microseconds multiplied by the limit. Each request adds one interval to that, and it goes down by
+        # the limit for each microsecond that passes. Keeping to whole numbers means rounding can’t build up over
+        # a burst, so a burst of exactly `limit` requests is allowed.
+        self.scripts['gcra-rate-limit'] = self.redis_store.register_script(
+            """
+            local limit = tonumber(ARGV[1])
+            local interval = math.floor(tonumber(ARGV[2]) * 1000000 + 0.5)
+            local now = math.floor(tonumber(ARGV[3]) * 1000000)
+            local stored = redis.call('hmget', KEYS[1], 'time', 'ahead')
+            local ahead = 0
+            if stored[1] and stored[2] then
+                now = math.max(now, tonumber(stored[1]))
+                ahead = math.max(tonumber(stored[2]) - (now - tonumber(stored[1])) * limit, 0)
+            end
+            ahead = ahead + interval
+            if ahead > interval * limit then
+                return 1
+            end
+            redis.call('hmset', KEYS[1], 'time', string.format('%d', now), 'ahead', string.format('%d', ahead))
+            redis.call('pexpire', KEYS[1], math.ceil(ahead / limit / 1000))
+            return 0
+            """
+        )
+
+        # Approximate sliding window. Stores counts for the current and previous fixed windows, and weights the
+        # previous count by how much of the previous window is still inside the sliding window. Like the sorted set
+        # version, rejected requests are counted. Takes the same arguments as the GCRA script.
+        self.scripts['sliding-window-rate-limit'] = self.redis_store.register_script(
+            """
+            local limit = tonumber(ARGV[1])
+            local interval = tonumber(ARGV[2])
+            local now = tonumber(ARGV[3])
+            local window = math.floor(now / interval)
+            local stored = redis.call('hmget', KEYS[1], 'window', 'current', 'previous')
+            local current = tonumber(stored[2]) or 0
+            local previous = tonumber(stored[3]) or 0
+            if tonumber(stored[1]) ~= window then
+                if tonumber(stored[1]) == window - 1 then
+                    previous = current
+                else
+                    previous = 0
+                end
+                current = 0
+            end
+            current = current + 1
+            redis.call('hmset', KEYS[1], 'window', window, 'current', current, 'previous', previous)
+            redis.call('pexpire', KEYS[1], math.ceil(interval * 2000))
+            local elapsed = now - window * interval
+            if previous * (interval - elapsed) / interval + current > limit then
+                return 1
+            end
+            return 0
+            """
+        )
+
+        # Deletes a lock, but only if it still holds the token it was set to. KEYS[1] is the lock key and ARGV[1]
+        # the token. If the lock expired and another process took it, that process’s lock is left alone.
+        self.scripts['release-lock'] = self.redis_store.register_script(
+            """
+            if redis.call('get', KEYS[1]) == ARGV[1] then
+                return redis.call('del', KEYS[1])
+            end
+            return 0
+            """
+        )
+
     def delete_cache_keys_by_pattern(self, pattern):
         r"""
         Deletes all keys matching a given pattern, and returns how many keys were deleted.
@@ -74,11 +155,68 @@ class RedisClient:
         * h[a-b]llo matches hallo and hbllo
 
         Use \ to escape special characters if you want to match them verbatim
+
+        KEYS blocks Redis until it has looked at every key. To avoid that,
+        use `scan_and_delete_cache_keys_by_pattern` instead.
         """
         if self.active:
             return self.scripts['delete-keys-by-pattern'](args=[pattern])
         return 0
 
+    def scan_and_delete_cache_keys_by_pattern(self, pattern, count=1000, in_background=False, raise_exception=False):
+        """
+        Like `delete_cache_keys_by_pattern`, but without blocking Redis
+        while it looks through every key. It uses SCAN to look at about
+        `count` keys at a time. Each batch of matching keys is deleted
+        with UNLINK, which frees the memory in the background. The UNLINK
+        is pipelined with the next SCAN, so each batch is one round trip.
+
+        Returns a `DeletedKeys` of how many keys were deleted and how many
+        seconds it took, which is also logged. If `in_background` is set,
+        the deletion happens in a new thread, and the thread is returned.
+        """
+        if not self.active:
+            return deleted_keys(0, 0.0)
+
+        if in_background:
+            app = current_app._get_current_object()
+
+            def delete_in_app_context():
+                with app.app_context():
+                    self.__scan_and_delete(pattern, count, raise_exception)
+
+            thread = Thread(target=delete_in_app_context, daemon=True)
+            thread.start()
+            return thread
+
+        return self.__scan_and_delete(pattern, count, raise_exception)
+
+    def __scan_and_delete(self, pattern, count, raise_exception):
+        pattern = prepare_value(pattern)
+        start = monotonic()
+        deleted = 0
+
+        try:
+            cursor, keys = self.redis_store.scan(0, match=pattern, count=count)
+            while keys or cursor:
+                pipe = self.redis_store.pipeline(transaction=False)
+                if keys:
+                    pipe.unlink(*keys)
+                if cursor:
+                    pipe.scan(cursor, match=pattern, count=count)
+                results = pipe.execute()
+                if keys:
+                    deleted += results[0]
+                cursor, keys = results[-1] if cursor else (0, [])
+        except Exception as e:
+            self.__handle_exception(e, raise_exception, 'scan-and-delete', pattern)
+
+        result = deleted_keys(deleted, monotonic() - start)
+        current_app.logger.info('Deleted {} keys matching {} in {:.3f} seconds'.format(
+            result.count, pattern, result.seconds
+        ))
+        return result
+
     def exceeded_rate_limit(self, cache_key, limit, interval, raise_exception=False):
         """
         Rate limiting.
@@ -127,6 +265,34 @@ class RedisClient:
         else:
             return False
 
+    def exceeded_scripted_rate_limit(self, cache_key, limit, interval, algorithm='gcra', raise_exception=False):
+        """
+        Takes the same arguments as `exceeded_rate_limit` and, like it,
+        allows at most `limit` requests in any `interval`, but uses one Lua
+        script instead of a sorted set with a member for every request. Each key takes the same memory whatever
+        the limit, and checking the limit is one round trip.
+
+        `algorithm` is either:
+        - `gcra`, which spaces requests out evenly but allows a burst of
+          up to `limit` at once, and doesn’t count rejected requests
+        - `sliding-window`, which estimates the count in the last
+          `interval` from fixed windows, and counts rejected requests
+
+        If redis is inactive, or we get an exception, allow the request.
+        """
+        if algorithm not in RATE_LIMIT_ALGORITHMS:
+            raise ValueError('algorithm must be one of {}'.format(', '.join(RATE_LIMIT_ALGORITHMS)))
+        cache_key = prepare_value(cache_key)
+        if self.active:
+            try:
+                return self.scripts[RATE_LIMIT_ALGORITHMS[algorithm]](
+                    keys=[cache_key],
+                    args=[limit, interval, time()],
+                ) == 1
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, '{}-rate-limit'.format(algorithm), cache_key)
+        return False
+
     def set(self, key, value, ex=None, px=None, nx=False, xx=False, raise_exception=False):
         key = prepare_value(key)
         value = prepare_value(value)
@@ -136,6 +302,61 @@ class RedisClient:
             except Exception as e:
                 self.__handle_exception(e, raise_exception, 'set', key)
 
+    def set_many(self, mapping, ex=None, chunk_size=None, raise_exception=False):
+        """
+        Sets every key in `mapping` to its value. `ex` is the number of
+        seconds until every key expires, or a dictionary of the number of
+        seconds for each key. MSET can’t set an expiry, so this pipelines
+        a SET for each key.
+        """
+        expiries = ex if isinstance(ex, dict) else dict.fromkeys(mapping, ex)
+        items = [
+            (prepare_value(key), prepare_value(value), expiries.get(key))
+            for key, value in mapping.items()
+        ]
+        keys = [key for key, _, _ in items]
+
+        def add_to_pipeline(pipe, start, end):
+            for key, value, expiry in items[start:end]:
+                pipe.set(key, value, ex=expiry)
+
+        if self.active:
+            self.__execute_in_chunks('set_many', keys, add_to_pipeline, chunk_size, raise_exception)
+
+    def acquire_lock(self, key, px, raise_exception=False):
+        """
+        Sets `key` to a random token if it isn’t already set, to expire
+        after `px` milliseconds. Returns the token if the lock was taken,
+        or `None` if something else holds it. Returns a token if redis is
+        inactive, or we get an exception, so that callers carry on as if
+        there was nothing else holding the lock.
+
+        Pass the token to `release_lock` to release the lock.
+        """
+        key = prepare_value(key)
+        token = uuid.uuid4().hex
+        if self.active:
+            try:
+                if not self.redis_store.set(key, token, px=px, nx=True):
+                    return None
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, 'acquire_lock', key)
+        return token
+
+    def release_lock(self, key, token, raise_exception=False):
+        """
+        Deletes a lock taken by `acquire_lock`, unless it has expired and
+        been taken again with a different token. Returns whether the lock
+        was deleted.
+        """
+        key = prepare_value(key)
+        if self.active:
+            try:
+                return self.scripts['release-lock'](keys=[key], args=[token]) == 1
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, 'release_lock', key)
+        return False
+
     def incr(self, key, raise_exception=False):
         key = prepare_value(key)
         if self.active:
@@ -144,6 +365,24 @@ class RedisClient:
             except Exception as e:
                 self.__handle_exception(e, raise_exception, 'incr', key)
 
+    def incr_many(self, keys, chunk_size=None, raise_exception=False):
+        """
+        Increments each of `keys` by one. Returns a list of the new
+        values, in the same order as `keys`.
+        """
+        keys = [prepare_value(key) for key in keys]
+
+        def add_to_pipeline(pipe, start, end):
+            for key in keys[start:end]:
+                pipe.incr(key)
+
+        if self.active:
+            results = self.__execute_in_chunks('incr_many', keys, add_to_pipeline, chunk_size, raise_exception)
+            if results is not None:
+                return results
+
+        return [None] * len(keys)
+
     def get(self, key, raise_exception=False):
         key = prepare_value(key)
         if self.active:
@@ -154,6 +393,24 @@ class RedisClient:
 
         return None
 
+    def get_many(self, keys, chunk_size=None, raise_exception=False):
+        """
+        Gets the values of `keys`, with an MGET for each chunk. Returns a
+        list in the same order as `keys`, with `None` for any key that
+        isn’t set.
+        """
+        keys = [prepare_value(key) for key in keys]
+
+        def add_to_pipeline(pipe, start, end):
+            pipe.mget(keys[start:end])
+
+        if self.active:
+            results = self.__execute_in_chunks('get_many', keys, add_to_pipeline, chunk_size, raise_exception)
+            if results is not None:
+                return list(chain.from_iterable(results))
+
+        return [None] * len(keys)
+
     def decrement_hash_value(self, key, value, raise_exception=False):
         return self.increment_hash_value(key, value, raise_exception, incr_by=-1)
 
@@ -166,6 +423,28 @@ class RedisClient:
             except Exception as e:
                 self.__handle_exception(e, raise_exception, 'increment_hash_value', key)
 
+    def increment_hash_values(self, keys_and_values, incr_by=1, chunk_size=None, raise_exception=False):
+        """
+        Like `increment_hash_value`, for each `(key, value)` pair in
+        `keys_and_values`. Returns a list of the new counts, in the same
+        order as `keys_and_values`.
+        """
+        items = [(prepare_value(key), prepare_value(value)) for key, value in keys_and_values]
+        keys = [key for key, _ in items]
+
+        def add_to_pipeline(pipe, start, end):
+            for key, value in items[start:end]:
+                pipe.hincrby(key, value, incr_by)
+
+        if self.active:
+            results = self.__execute_in_chunks(
+                'increment_hash_values', keys, add_to_pipeline, chunk_size, raise_exception
+            )
+            if results is not None:
+                return results
+
+        return [None] * len(keys)
+
     def get_all_from_hash(self, key, raise_exception=False):
         key = prepare_value(key)
         if self.active:
@@ -200,6 +479,32 @@ class RedisClient:
             except Exception as e:
                 self.__handle_exception(e, raise_exception, 'delete', ', '.join(keys))
 
+    def __execute_in_chunks(self, operation, keys, add_to_pipeline, chunk_size, raise_exception):
+        """
+        Calls `add_to_pipeline(pipe, start, end)` to add the commands for
+        `keys[start:end]` to a pipeline, and executes it once for each
+        `chunk_size` keys, so that a big batch doesn’t hold up every
+        other client. Pipelines aren’t transactions, so each command runs
+        as soon as it reaches Redis.
+
+        Returns the results of every command, or `None` if there was an
+        error, in which case any later chunks aren’t executed.
+        """
+        results = []
+        chunk_size = chunk_size or max(len(keys), 1)
+
+        for start in range(0, len(keys), chunk_size):
+            end = min(start + chunk_size, len(keys))
+            try:
+                pipe = self.redis_store.pipeline(transaction=False)
+                add_to_pipeline(pipe, start, end)
+                results.extend(pipe.execute())
+            except Exception as e:
+                self.__handle_exception(e, raise_exception, operation, ', '.join(map(str, keys[start:end])))
+                return None
+
+        return results
+
     def __handle_exception(self, e, raise_exception, operation, key_name):
         current_app.logger.exception('Redis error performing {} on {}'.format(operation, key_name))
         if raise_exception:
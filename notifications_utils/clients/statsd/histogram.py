@@ -0,0 +1,61 @@
+from math import ceil, log
+
+
+class Histogram():
+    """
+    Counts values in buckets whose bounds grow by a factor of `growth`,
+    like an HDR histogram. Percentiles are within about half of
+    `growth - 1` of the true value, whatever the range of values, and
+    the number of buckets can’t be more than `log(highest / lowest) /
+    log(growth)`, so memory is bounded. Values outside the range are
+    counted in the first or last bucket.
+    """
+
+    def __init__(self, lowest=0.001, highest=3_600_000, growth=1.02):
+        self.lowest = lowest
+        self.growth = growth
+        self._log_growth = log(growth)
+        self.max_index = ceil(log(highest / lowest) / self._log_growth)
+        self.buckets = {}
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        index = self._index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        return min(ceil(log(value / self.lowest) / self._log_growth), self.max_index)
+
+    def percentile(self, percentile):
+        """
+        Returns the value which `percentile` percent of values are less
+        than or equal to, or `None` if there aren’t any values
+        """
+        if not self.count:
+            return None
+        rank = max(ceil(self.count * percentile / 100), 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                break
+        # The first and last buckets have no lower or upper bound, so
+        # the best guess is the lowest or highest value seen
+        if index == 0:
+            return self.min
+        if index == self.max_index:
+            return self.max
+        # Otherwise the middle of the bucket, by ratio, but never
+        # outside the range of values actually seen
+        return min(max(self.lowest * self.growth ** (index - 0.5), self.min), self.max)
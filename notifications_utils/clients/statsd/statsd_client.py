@@ -1,11 +1,18 @@
+import atexit
+import os
 import random
 import time
+from datetime import timedelta
 from socket import AF_INET, SOCK_DGRAM, gethostbyname, socket
+from threading import Event, Lock, Thread
+from weakref import WeakSet
 
 import cachetools.func
 from flask import current_app
 from statsd.client.base import StatsClientBase
 
+from notifications_utils.clients.statsd.histogram import Histogram
+
 
 def time_monotonic_with_jitter():
     jitter = random.uniform(-3, 3)
@@ -44,11 +51,163 @@ class NotifyStatsClient(StatsClientBase):
             pass
 
 
+# Buffered clients which haven’t been closed yet
+_buffered_clients = WeakSet()
+
+
+def _start_buffered_clients_after_fork():
+    # A forked process gets a copy of each buffer but not the flushing thread
+    for client in list(_buffered_clients):
+        client._start()
+
+
+def _close_buffered_clients():
+    for client in list(_buffered_clients):
+        client.close()
+
+
+os.register_at_fork(after_in_child=_start_buffered_clients_after_fork)
+atexit.register(_close_buffered_clients)
+
+
+class BufferedNotifyStatsClient(NotifyStatsClient):
+    """
+    Instead of sending a datagram for every metric, adds up counters and
+    packs metrics into datagrams of up to `max_datagram_size` bytes, one
+    per line. They’re sent when there’s more than a datagram’s worth,
+    every `flush_interval` seconds from a background thread, and when
+    the process exits.
+
+    With `aggregate_timings`, timings are also kept in a histogram for
+    each stat instead of being sent one by one. Each flush sends, for
+    every stat timed since the last flush:
+    - `<stat>.count` and `<stat>.sum`, as counters, so they add up
+      across processes
+    - `<stat>.p50`, `<stat>.p95` and `<stat>.p99`, as gauges, which are
+      for this process only
+    Histograms are dropped once they’ve been sent, so only stats timed
+    since the last flush use memory. No more than `max_aggregated_stats`
+    are kept at once, and timings for any more are sent one by one.
+    """
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(
+        self,
+        host,
+        port,
+        prefix,
+        app,
+        flush_interval=1,
+        max_datagram_size=1432,
+        aggregate_timings=False,
+        max_aggregated_stats=1000,
+    ):
+        super().__init__(host, port, prefix)
+        self._app = app
+        self._flush_interval = flush_interval
+        self._max_datagram_size = max_datagram_size
+        self._aggregate_timings = aggregate_timings
+        self._max_aggregated_stats = max_aggregated_stats
+        self._start()
+        _buffered_clients.add(self)
+
+    def _start(self):
+        self._lock = Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._lines = []
+        self._size = 0
+        self._closed = Event()
+        self._flusher = Thread(target=self._flush_every_interval, daemon=True)
+        self._flusher.start()
+
+    def incr(self, stat, count=1, rate=1):
+        if rate < 1:
+            # Sampled counts can’t be added together, so send them as they are
+            return super().incr(stat, count, rate)
+        with self._lock:
+            self._counters[stat] = self._counters.get(stat, 0) + count
+
+    def timing(self, stat, delta, rate=1):
+        if not self._aggregate_timings or rate < 1:
+            return super().timing(stat, delta, rate)
+        if isinstance(delta, timedelta):
+            delta = delta.total_seconds() * 1000
+        with self._lock:
+            histogram = self._histograms.get(stat)
+            if histogram is None and len(self._histograms) < self._max_aggregated_stats:
+                histogram = self._histograms[stat] = Histogram()
+            if histogram is not None:
+                histogram.add(delta)
+                return
+        # Too many different stats to aggregate them all
+        super().timing(stat, delta, rate)
+
+    def _after(self, data):
+        if not data:
+            return
+        with self._lock:
+            self._lines.append(data)
+            self._size += len(data) + 1
+            if self._size <= self._max_datagram_size:
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines = [
+                self._prepare(stat, '{}|c'.format(count), 1) for stat, count in self._counters.items()
+            ] + self._lines + [
+                line for stat, histogram in self._histograms.items() for line in self._summarise(stat, histogram)
+            ]
+            self._counters, self._histograms, self._lines, self._size = {}, {}, [], 0
+
+        # `_send` logs errors using `current_app`, which isn’t available
+        # in the background thread
+        with self._app.app_context():
+            for datagram in self._pack(lines):
+                self._send(datagram)
+
+    def _summarise(self, stat, histogram):
+        yield self._prepare('{}.count'.format(stat), '{}|c'.format(histogram.count), 1)
+        yield self._prepare('{}.sum'.format(stat), '{:.6f}|c'.format(histogram.sum), 1)
+        for percentile in self.PERCENTILES:
+            yield self._prepare(
+                '{}.p{}'.format(stat, percentile), '{:.6f}|g'.format(histogram.percentile(percentile)), 1
+            )
+
+    def _pack(self, lines):
+        datagram, size = [], 0
+        for line in lines:
+            if datagram and size + len(line) > self._max_datagram_size:
+                yield '\n'.join(datagram)
+                datagram, size = [], 0
+            datagram.append(line)
+            size += len(line) + 1
+        if datagram:
+            yield '\n'.join(datagram)
+
+    def _flush_every_interval(self):
+        while not self._closed.wait(self._flush_interval):
+            self.flush()
+
+    def close(self):
+        _buffered_clients.discard(self)
+        self._closed.set()
+        self.flush()
+
+
 class StatsdClient():
     def __init__(self):
         self.statsd_client = None
 
     def init_app(self, app, *args, **kwargs):
+        if isinstance(self.statsd_client, BufferedNotifyStatsClient):
+            # Send anything the client being replaced has buffered, and
+            # stop its thread
+            self.statsd_client.close()
+
         app.statsd_client = self
         self.active = app.config.get('STATSD_ENABLED')
         self.namespace = "{}.notifications.{}.".format(
@@ -56,7 +215,18 @@ class StatsdClient():
             app.config.get('NOTIFY_APP_NAME')
         )
 
-        if self.active:
+        if self.active and (app.config.get('STATSD_BUFFERED') or app.config.get('STATSD_AGGREGATE_TIMINGS')):
+            self.statsd_client = BufferedNotifyStatsClient(
+                app.config.get('STATSD_HOST'),
+                app.config.get('STATSD_PORT'),
+                prefix=app.config.get('STATSD_PREFIX'),
+                app=app,
+                flush_interval=app.config.get('STATSD_FLUSH_INTERVAL', 1),
+                max_datagram_size=app.config.get('STATSD_MAX_DATAGRAM_SIZE', 1432),
+                aggregate_timings=bool(app.config.get('STATSD_AGGREGATE_TIMINGS')),
+                max_aggregated_stats=app.config.get('STATSD_MAX_AGGREGATED_STATS', 1000),
+            )
+        elif self.active:
             self.statsd_client = NotifyStatsClient(
                 app.config.get('STATSD_HOST'),
                 app.config.get('STATSD_PORT'),
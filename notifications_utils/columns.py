@@ -1,8 +1,13 @@
 from collections import OrderedDict
-from functools import lru_cache
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
 
 from orderedset import OrderedSet
 
+from notifications_utils.formatters import strip_and_remove_obscure_whitespace
+
 
 class Columns(OrderedDict):
 
@@ -88,20 +93,32 @@ class Row(Columns):
         self.allow_international_letters = allow_international_letters
 
         if template:
-            template.values = row_dict
             self.template_type = template.template_type
-            # we do not validate email size for CSVs to avoid performance issues
-            if self.template_type == "email":
-                self.message_too_long = False
-            else:
-                self.message_too_long = template.is_message_too_long()
-            self.message_empty = template.is_message_empty()
+            self.message_too_long, self.message_empty = self.check_message(template, row_dict)
 
         super().__init__(OrderedDict(
             (key, Cell(key, value, error_fn, self.placeholders))
             for key, value in row_dict.items()
         ))
 
+    @staticmethod
+    def check_message(template, row_dict):
+        template.values = row_dict
+        # we do not validate email size for CSVs to avoid performance issues
+        if template.template_type == "email":
+            message_too_long = False
+        else:
+            message_too_long = template.is_message_too_long()
+        return message_too_long, template.is_message_empty()
+
+    @staticmethod
+    def make_postal_address(recipient_and_personalisation, allow_international_letters):
+        from notifications_utils.postal_address import PostalAddress
+        return PostalAddress.from_personalisation(
+            recipient_and_personalisation,
+            allow_international_letters=allow_international_letters,
+        )
+
     def __getitem__(self, key):
         return super().__getitem__(key) if key in self else Cell()
 
@@ -146,10 +163,9 @@ class Row(Columns):
 
     @property
     def as_postal_address(self):
-        from notifications_utils.postal_address import PostalAddress
-        return PostalAddress.from_personalisation(
+        return self.make_postal_address(
             self.recipient_and_personalisation,
-            allow_international_letters=self.allow_international_letters,
+            self.allow_international_letters,
         )
 
     @property
@@ -193,3 +209,346 @@ class Cell():
     @property
     def recipient_error(self):
         return self.error not in {None, self.missing_field_error}
+
+
+class ColumnarRows(Sequence):
+    """
+    `ColumnarRows` stores the cells of a spreadsheet column by column,
+    rather than as a `Row` for each line. This means whitespace can be
+    stripped, and values validated, once per column instead of once per
+    cell. Values which appear many times in a column (for example
+    the same blank cell) are only validated once.
+
+    It behaves like a list of `Row` objects, but each `Row` is only
+    created when it is asked for by index.
+
+    Checks which need a whole row (message length and postal address)
+    can be spread across a pool of processes by setting `max_workers`
+    to more than 1. Rows are sent to the pool in chunks of `chunk_size`
+    and the results put back together in the original order.
+    """
+
+    chunk_size = 5_000
+
+    def __init__(
+        self,
+        column_headers,
+        rows_as_lists_of_columns,
+        *,
+        max_rows,
+        error_fn,
+        recipient_column_headers,
+        placeholders,
+        template,
+        allow_international_letters,
+        max_workers=1,
+    ):
+        self.column_headers = column_headers
+        self.max_workers = max_workers
+        self.max_rows = max_rows
+        self.error_fn = error_fn
+        self.recipient_column_headers = recipient_column_headers
+        self.placeholders = placeholders
+        self.template = template
+        self.allow_international_letters = allow_international_letters
+
+        length_of_column_headers = len(column_headers)
+        self.length = 0
+        self.extra_cells = {}
+        rows_to_keep = []
+
+        for index, row in enumerate(rows_as_lists_of_columns):
+            self.length = index + 1
+            if index >= max_rows:
+                continue
+            if len(row) > length_of_column_headers:
+                self.extra_cells[index] = row[length_of_column_headers:]
+                row = row[:length_of_column_headers]
+            elif len(row) < length_of_column_headers:
+                # Cells missing from the end of a row are `None`, to tell
+                # them apart from cells which are present but empty
+                row = row + [None] * (length_of_column_headers - len(row))
+            rows_to_keep.append(row)
+
+        self.number_of_rows_kept = len(rows_to_keep)
+        self.columns = self._merge_columns_with_the_same_name([
+            list(map(_strip_cell, column)) for column in zip(*rows_to_keep)
+        ] or [[] for _ in column_headers])
+        # The same column could appear under different names, for
+        # example `Name` and `name`. Like `Row`, the last one wins.
+        self.columns_by_key = Columns(OrderedDict(
+            (column_name, (column_name, values)) for column_name, values in self.columns.items()
+        ))
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('row index out of range')
+        if index >= self.max_rows:
+            return None
+        return Row(
+            self.get_row_dict(index),
+            index=index,
+            error_fn=self.error_fn,
+            recipient_column_headers=self.recipient_column_headers,
+            placeholders=self.placeholders,
+            template=self.template,
+            allow_international_letters=self.allow_international_letters,
+        )
+
+    def _merge_columns_with_the_same_name(self, columns):
+        # Columns with exactly the same name are combined in the same way
+        # as `RecipientCSV.get_rows` combines them: the last recipient
+        # column wins, other columns are collected into a list
+        merged = OrderedDict()
+        for column_name, values in zip(self.column_headers, columns):
+            if column_name not in merged:
+                merged[column_name] = [value or None for value in values]
+                continue
+            is_recipient_column = Columns.make_key(column_name) in Columns.from_keys(self.recipient_column_headers)
+            merged[column_name] = [
+                _merge_cells(existing, value, is_recipient_column)
+                for existing, value in zip(merged[column_name], values)
+            ]
+        return merged
+
+    def get_row_dict(self, index):
+        row_dict = OrderedDict(
+            (column_name, values[index]) for column_name, values in self.columns.items()
+        )
+        if index in self.extra_cells:
+            row_dict[None] = self.extra_cells[index]
+        return row_dict
+
+    @property
+    def recipients(self):
+        """
+        The same as getting `row.recipient` for every row, without
+        creating any `Row` objects
+        """
+        columns = [
+            self.columns_by_key.get(Columns.make_key(column), (None, [None] * self.number_of_rows_kept))[1]
+            for column in self.recipient_column_headers
+        ]
+        if len(columns) == 1:
+            return columns[0]
+        return list(map(list, zip(*columns)))
+
+    @property
+    def errors(self):
+        if not hasattr(self, '_errors'):
+            self._errors = [
+                _get_errors_for_column(self.error_fn, column_name, values)
+                for column_name, values in self.columns_by_key.values()
+            ]
+        return self._errors
+
+    def indexes_where(self, attr):
+        return (
+            index for index, flag in enumerate(self.flags[attr]) if flag
+        )
+
+    @property
+    def flags(self):
+        """
+        The same as checking `has_error`, `has_bad_recipient`,
+        `has_missing_data`, `message_too_long` and `message_empty` for
+        every row, without creating any `Row` objects.
+        """
+        if not hasattr(self, '_flags'):
+            self._flags = self._get_flags()
+        return self._flags
+
+    def _get_flags(self):
+
+        errors_by_row = list(zip(*self.errors)) or [()] * self.number_of_rows_kept
+        first_recipient_column_key = Columns.make_key(self.recipient_column_headers[0])
+        recipient_errors = dict(zip(self.columns_by_key, self.errors)).get(
+            first_recipient_column_key, [None] * self.number_of_rows_kept
+        )
+
+        flags = {
+            'has_missing_data': [
+                Cell.missing_field_error in row_errors for row_errors in errors_by_row
+            ],
+            'has_bad_recipient': [
+                error not in {None, Cell.missing_field_error} for error in recipient_errors
+            ],
+        }
+        (
+            flags['message_too_long'],
+            flags['message_empty'],
+            has_bad_postal_address,
+        ) = map(list, zip(*self._check_rows())) if self.number_of_rows_kept else ([], [], [])
+
+        if self.template and self.template.template_type == 'letter':
+            flags['has_bad_recipient'] = has_bad_postal_address
+
+        flags['has_error'] = [
+            any(flags_for_row) or any(row_errors)
+            for row_errors, flags_for_row in zip(errors_by_row, zip(
+                flags['message_too_long'], flags['message_empty'], has_bad_postal_address,
+            ))
+        ]
+
+        return flags
+
+    def _check_rows(self):
+
+        if not self.template:
+            return [(False, False, False)] * self.number_of_rows_kept
+
+        check_rows = partial(_check_rows, self.template, self.allow_international_letters)
+
+        if self.max_workers <= 1:
+            return check_rows(map(self.get_row_dict, range(self.number_of_rows_kept)))
+
+        chunks = (
+            list(map(self.get_row_dict, range(start, min(start + self.chunk_size, self.number_of_rows_kept))))
+            for start in range(0, self.number_of_rows_kept, self.chunk_size)
+        )
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            # `map` gives back results in the same order the chunks went in
+            return list(chain.from_iterable(executor.map(check_rows, chunks)))
+
+
+class RowValidator():
+    """
+    `RowValidator` checks one line of a spreadsheet at a time, giving the
+    same flags as a `Row` without creating one. Like `ColumnarRows`, it
+    remembers the error for each value in each column, so values which
+    appear many times are only validated once. It stops remembering new
+    values for a column once it has `max_values_remembered` of them, so
+    memory use doesn’t grow with the length of the spreadsheet.
+    """
+
+    max_values_remembered = 1_000
+
+    def __init__(
+        self,
+        column_headers,
+        *,
+        error_fn,
+        recipient_column_headers,
+        template,
+        allow_international_letters,
+    ):
+        # Like `Row`, when more than one column has the same key only
+        # the last one is checked
+        columns = Columns.from_keys(column_headers)
+        self.column_names = list(columns.values())
+        self.recipient_column_names = [columns.get(column) for column in recipient_column_headers]
+        self.error_fn = error_fn
+        self.template = template
+        self.allow_international_letters = allow_international_letters
+        self.errors_by_column = {}
+
+    def get_error(self, column_name, value):
+        errors_by_value = self.errors_by_column.setdefault(column_name, {})
+        cache_key = _get_cache_key(value)
+        if cache_key in errors_by_value:
+            return errors_by_value[cache_key]
+        error = self.error_fn(column_name, value)
+        if len(errors_by_value) < self.max_values_remembered:
+            errors_by_value[cache_key] = error
+        return error
+
+    def get_flags(self, row_dict):
+        """
+        The same as checking `has_error`, `has_bad_recipient`,
+        `has_missing_data`, `message_too_long` and `message_empty` on a
+        `Row` made from `row_dict`
+        """
+        errors = {
+            column_name: self.get_error(column_name, row_dict[column_name])
+            for column_name in self.column_names + ([None] if None in row_dict else [])
+        }
+
+        if self.template:
+            (message_too_long, message_empty, has_bad_postal_address), = _check_rows(
+                self.template, self.allow_international_letters, [row_dict]
+            )
+        else:
+            message_too_long, message_empty, has_bad_postal_address = False, False, False
+
+        first_recipient_column = self.recipient_column_names[0]
+
+        if self.template and self.template.template_type == 'letter':
+            has_bad_recipient = has_bad_postal_address
+        elif first_recipient_column is None:
+            has_bad_recipient = False
+        else:
+            has_bad_recipient = errors[first_recipient_column] not in {None, Cell.missing_field_error}
+
+        return {
+            'has_error': message_too_long or message_empty or has_bad_postal_address or any(errors.values()),
+            'has_bad_recipient': has_bad_recipient,
+            'has_missing_data': Cell.missing_field_error in errors.values(),
+            'message_too_long': message_too_long,
+            'message_empty': message_empty,
+        }
+
+    def get_recipient(self, row_dict):
+        """
+        The same as `Row.recipient` for a `Row` made from `row_dict`
+        """
+        columns = [
+            row_dict[column_name] if column_name is not None else None
+            for column_name in self.recipient_column_names
+        ]
+        return columns[0] if len(columns) == 1 else columns
+
+
+def _check_rows(template, allow_international_letters, row_dicts):
+    # This is a module-level function so it can be pickled and sent to
+    # other processes
+    results = []
+    for row_dict in row_dicts:
+        message_too_long, message_empty = Row.check_message(template, row_dict)
+        has_bad_postal_address = template.template_type == 'letter' and not Row.make_postal_address(
+            Columns(row_dict),
+            allow_international_letters,
+        ).valid
+        results.append((message_too_long, message_empty, has_bad_postal_address))
+    return results
+
+
+def _strip_cell(value):
+    if value is None:
+        return None
+    return strip_and_remove_obscure_whitespace(value)
+
+
+def _merge_cells(existing, value, is_recipient_column):
+    if is_recipient_column and value is not None:
+        return value or None
+    value = value or None
+    if not existing:
+        return value
+    if isinstance(existing, list):
+        return existing + [value]
+    return [existing, value]
+
+
+def _get_errors_for_column(error_fn, column_name, values):
+    errors_by_value = {}
+    errors = []
+    for value in values:
+        cache_key = _get_cache_key(value)
+        if cache_key not in errors_by_value:
+            errors_by_value[cache_key] = error_fn(column_name, value)
+        errors.append(errors_by_value[cache_key])
+    return errors
+
+
+def _get_cache_key(value):
+    # Cells from columns with the same name are lists, which can’t be
+    # dictionary keys
+    return tuple(value) if isinstance(value, list) else value
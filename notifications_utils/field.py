@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 from flask import Markup
 from orderedset import OrderedSet
@@ -10,6 +11,7 @@ from notifications_utils.formatters import (
     strip_html,
     unescaped_formatted_list,
 )
+from notifications_utils.profiling import profiled
 
 
 class Placeholder:
@@ -112,8 +114,7 @@ class Field:
     def values(self, value):
         self._values = Columns(value) if value else {}
 
-    def format_match(self, match):
-        placeholder = Placeholder.from_match(match)
+    def format_placeholder(self, placeholder):
 
         if self.redact_missing_personalisation:
             return self.placeholder_tag_redacted
@@ -128,8 +129,7 @@ class Field:
             placeholder.name
         )
 
-    def replace_match(self, match):
-        placeholder = Placeholder.from_match(match)
+    def replace_placeholder(self, placeholder):
         replacement = self.values.get(placeholder.name)
 
         if placeholder.is_conditional() and replacement is not None:
@@ -137,9 +137,9 @@ class Field:
 
         replaced_value = self.get_replacement(placeholder)
         if replaced_value is not None:
-            return self.get_replacement(placeholder)
+            return replaced_value
 
-        return self.format_match(match)
+        return self.format_placeholder(placeholder)
 
     def get_replacement(self, placeholder):
         replacement = self.values.get(placeholder.name)
@@ -165,11 +165,16 @@ class Field:
             )
         return unescaped_formatted_list(replacement, before_each='', after_each='')
 
+    def _join(self, render_placeholder):
+        literals, placeholders = compile_field(self.content, self.sanitizer)
+        pieces = [None] * (len(literals) + len(placeholders))
+        pieces[0::2] = literals
+        pieces[1::2] = map(render_placeholder, placeholders)
+        return ''.join(pieces)
+
     @property
     def _raw_formatted(self):
-        return re.sub(
-            self.placeholder_pattern, self.format_match, self.sanitizer(self.content)
-        )
+        return self._join(self.format_placeholder)
 
     @property
     def formatted(self):
@@ -180,16 +185,13 @@ class Field:
         if not getattr(self, 'content', ''):
             return set()
         return OrderedSet(
-            Placeholder(body).name for body in re.findall(
-                self.placeholder_pattern, self.content
-            )
+            placeholder.name for placeholder in compile_field(self.content, str)[1]
         )
 
     @property
+    @profiled('Field.replaced')
     def replaced(self):
-        return re.sub(
-            self.placeholder_pattern, self.replace_match, self.sanitizer(self.content)
-        )
+        return self._join(self.replace_placeholder)
 
 
 class PlainTextField(Field):
@@ -203,6 +205,24 @@ class PlainTextField(Field):
     placeholder_tag_redacted = "[hidden]"
 
 
+@lru_cache(maxsize=1024)
+def compile_field(content, sanitizer):
+    """
+    Sanitises some content and splits it into the text between
+    placeholders and the placeholders themselves, so that substituting
+    in a new set of values doesn’t need to find the placeholders again.
+
+    Returns a tuple of literal strings and a tuple of `Placeholder`s.
+    There is always one more literal than placeholder; they alternate,
+    starting and ending with a literal (which may be empty).
+    """
+    parts = Field.placeholder_pattern.split(sanitizer(content) or '')
+    return (
+        tuple(parts[0::2]),
+        tuple(Placeholder(body) for body in parts[1::2]),
+    )
+
+
 def str2bool(value):
     if not value:
         return False
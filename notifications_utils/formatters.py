@@ -10,6 +10,7 @@ import smartypants
 from flask import Markup
 from orderedset import OrderedSet
 
+from notifications_utils.profiling import profiled, span
 from notifications_utils.sanitise_text import SanitiseSMS
 
 from . import email_with_smart_quotes_regex
@@ -149,6 +150,7 @@ def prepend_subject(body, subject):
     return '# {}\n\n{}'.format(subject, body)
 
 
+@profiled('sms_encode')
 def sms_encode(content):
     return SanitiseSMS.encode(content)
 
@@ -583,20 +585,39 @@ class NotifyEmailPreheaderMarkdownRenderer(NotifyPlainTextEmailMarkdownRenderer)
         ))
 
 
-notify_email_markdown = mistune.Markdown(
+class NotifyMarkdown(mistune.Markdown):
+    """
+    Times each time some Markdown is parsed and rendered as a span
+    called `name`
+    """
+
+    def __init__(self, name, **kwargs):
+        self.name = name
+        super().__init__(**kwargs)
+
+    def parse(self, text):
+        with span(self.name):
+            return super().parse(text)
+
+
+notify_email_markdown = NotifyMarkdown(
+    'notify_email_markdown',
     renderer=NotifyEmailMarkdownRenderer(),
     hard_wrap=True,
     use_xhtml=False,
 )
-notify_plain_text_email_markdown = mistune.Markdown(
+notify_plain_text_email_markdown = NotifyMarkdown(
+    'notify_plain_text_email_markdown',
     renderer=NotifyPlainTextEmailMarkdownRenderer(),
     hard_wrap=True,
 )
-notify_email_preheader_markdown = mistune.Markdown(
+notify_email_preheader_markdown = NotifyMarkdown(
+    'notify_email_preheader_markdown',
     renderer=NotifyEmailPreheaderMarkdownRenderer(),
     hard_wrap=True,
 )
-notify_letter_preview_markdown = mistune.Markdown(
+notify_letter_preview_markdown = NotifyMarkdown(
+    'notify_letter_preview_markdown',
     renderer=NotifyLetterMarkdownPreviewRenderer(),
     hard_wrap=True,
     use_xhtml=False,
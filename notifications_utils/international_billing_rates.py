@@ -27,3 +27,7 @@ dir_path = os.path.dirname(os.path.realpath(__file__))
 with open('{}/international_billing_rates.yml'.format(dir_path)) as f:
     INTERNATIONAL_BILLING_RATES = yaml.safe_load(f)
     COUNTRY_PREFIXES = list(reversed(sorted(INTERNATIONAL_BILLING_RATES.keys(), key=len)))
+    # Each length of prefix, longest first, so a number’s prefix can be
+    # found by looking up a slice of each length in
+    # `INTERNATIONAL_BILLING_RATES` instead of checking every prefix
+    COUNTRY_PREFIX_LENGTHS = sorted(set(map(len, INTERNATIONAL_BILLING_RATES)), reverse=True)
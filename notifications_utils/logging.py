@@ -1,9 +1,14 @@
+import json
 import logging
 import logging.handlers
+import os
+import queue
 import re
 import sys
 from itertools import product
 from pathlib import Path
+from threading import Lock
+from weakref import WeakSet
 
 from flask import g, request
 from flask.ctx import has_app_context, has_request_context
@@ -20,15 +25,22 @@ def init_app(app, statsd_client=None):
     app.config.setdefault('NOTIFY_LOG_LEVEL', 'INFO')
     app.config.setdefault('NOTIFY_APP_NAME', 'none')
     app.config.setdefault('NOTIFY_LOG_PATH', './log/application.log')
+    app.config.setdefault('NOTIFY_LOG_QUEUE', False)
+    app.config.setdefault('NOTIFY_LOG_QUEUE_SIZE', 10_000)
+    app.config.setdefault('NOTIFY_LOG_QUEUE_FULL_POLICY', 'drop')
 
     logging.getLogger().addHandler(logging.NullHandler())
 
-    del app.logger.handlers[:]
+    loggers = [app.logger, logging.getLogger('utils')]
+    remove_handlers(app, loggers)
 
     ensure_log_path_exists(app.config['NOTIFY_LOG_PATH'])
     handlers = get_handlers(app)
+    if app.config['NOTIFY_LOG_QUEUE']:
+        handlers = [get_queue_handler(app, handlers, statsd_client)]
+        if send_queue_stats not in app.teardown_appcontext_funcs:
+            app.teardown_appcontext(send_queue_stats)
     loglevel = logging.getLevelName(app.config['NOTIFY_LOG_LEVEL'])
-    loggers = [app.logger, logging.getLogger('utils')]
     for logger_instance, handler in product(loggers, handlers):
         logger_instance.addHandler(handler)
         logger_instance.setLevel(loglevel)
@@ -37,6 +49,31 @@ def init_app(app, statsd_client=None):
     app.logger.info("Logging configured")
 
 
+def remove_handlers(app, loggers):
+    """
+    Closes the handlers from any previous call to `init_app`, and
+    removes them from `loggers`, so that their files and queue threads
+    don’t leak
+    """
+    for handler in app.logger.handlers[:]:
+        for logger_instance in loggers:
+            logger_instance.removeHandler(handler)
+        handler.close()
+        for queued_handler in getattr(handler, 'handlers', []):
+            queued_handler.close()
+
+
+def send_queue_stats(exception=None):
+    """
+    Sends how many records each queue handler which was given a statsd
+    client has dropped. `init_app` calls this whenever an app context
+    ends, which is after each request or task.
+    """
+    for handler in list(_queue_handlers):
+        if handler.statsd_client is not None and handler.dropped:
+            handler.send_stats(handler.statsd_client)
+
+
 def ensure_log_path_exists(path):
     """
     This function assumes you're passing a path to a file and attempts to create
@@ -75,6 +112,34 @@ def get_handlers(app):
     return handlers
 
 
+def get_queue_handler(app, handlers, statsd_client=None):
+    """
+    Returns a handler which passes records to `handlers` on a background
+    thread, so the thread which logged them doesn’t wait for them to be
+    formatted and written. If `statsd_client` is given,
+    `send_queue_stats` uses it to send how many records were dropped.
+    """
+    if app.config['NOTIFY_LOG_QUEUE_FULL_POLICY'] not in NotifyQueueHandler.FULL_POLICIES:
+        raise ValueError('NOTIFY_LOG_QUEUE_FULL_POLICY must be one of {}'.format(
+            ', '.join(NotifyQueueHandler.FULL_POLICIES)
+        ))
+    for handler in handlers:
+        # The filters need the app and request context, which only the
+        # thread that logged the record has, so they’re moved to the
+        # queue handler
+        handler.filters = []
+    return configure_handler(
+        NotifyQueueHandler(
+            handlers,
+            maxsize=app.config['NOTIFY_LOG_QUEUE_SIZE'],
+            block=app.config['NOTIFY_LOG_QUEUE_FULL_POLICY'] == 'block',
+            statsd_client=statsd_client,
+        ),
+        app,
+        formatter=None,
+    )
+
+
 def configure_handler(handler, app, formatter):
     handler.setLevel(logging.getLevelName(app.config['NOTIFY_LOG_LEVEL']))
     handler.setFormatter(formatter)
@@ -125,38 +190,191 @@ class ServiceIdFilter(logging.Filter):
         return record
 
 
-class CustomLogFormatter(logging.Formatter):
+class NotifyQueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # Wait for space, so that stopping the listener when the queue is
+        # full still writes every record already on it
+        self.queue.put(self._sentinel)
+
+
+# Queue handlers which haven’t been closed yet
+_queue_handlers = WeakSet()
+
+
+def _start_queue_handlers_after_fork():
+    # Listener threads don’t survive forking, so each child needs new ones
+    for handler in list(_queue_handlers):
+        handler._start()
+
+
+os.register_at_fork(after_in_child=_start_queue_handlers_after_fork)
+
+
+class NotifyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on a queue of at most `maxsize` records, which a
+    listener thread takes them from to pass to `handlers`.
+
+    When the queue is full records are dropped and counted, or, with
+    `block`, the thread that logged them waits for space. Call
+    `send_stats` periodically to record how many were dropped, or pass
+    a `statsd_client` and `send_queue_stats` does it.
+    """
+
+    FULL_POLICIES = ('drop', 'block')
+
+    def __init__(self, handlers, maxsize=10_000, block=False, statsd_client=None):
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.block = block
+        self.statsd_client = statsd_client
+        self.dropped = 0
+        self._dropped_lock = Lock()
+        super().__init__(None)
+        self._start()
+        _queue_handlers.add(self)
+
+    def _start(self):
+        self.queue = queue.Queue(maxsize=self.maxsize)
+        self.listener = NotifyQueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        # The listener is in the same process, so unlike the default this
+        # doesn’t format the record to make it safe to pickle. The
+        # handlers format it exactly as they would without a queue.
+        return record
+
+    def enqueue(self, record):
+        if self.block:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self):
+        # Called by `logging.shutdown` when the process exits, before the
+        # handlers the listener writes to are closed
+        _queue_handlers.discard(self)
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        super().close()
+
+    def send_stats(self, statsd_client):
+        """
+        Sends the number of records dropped since the last time this was
+        called
+        """
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        statsd_client.incr('logging.dropped-records', count=dropped)
+
+
+def _has_braces(message):
+    return '{' in message or '}' in message
+
+
+class CachedTimeFormatterMixin():
+    """
+    Formats the time of each record with a `datefmt` once per second,
+    rather than once per record. Nothing smaller than a second can be in
+    a `datefmt`, so every record logged in the same second gets the same
+    string.
+    """
+
+    _cached_time = (None, None)
+
+    def formatTime(self, record, datefmt=None):
+        if not datefmt:
+            return super().formatTime(record, datefmt)
+        key = (int(record.created), datefmt)
+        cached_key, formatted_time = self._cached_time
+        if cached_key != key:
+            formatted_time = super().formatTime(record, datefmt)
+            self._cached_time = (key, formatted_time)
+        return formatted_time
+
+
+class CustomLogFormatter(CachedTimeFormatterMixin, logging.Formatter):
     """Accepts a format string for the message and formats it with the extra fields"""
 
     FORMAT_STRING_FIELDS_PATTERN = re.compile(r'\((.+?)\)', re.IGNORECASE)
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._fields = self.FORMAT_STRING_FIELDS_PATTERN.findall(self._fmt)
+
     def add_fields(self, record):
-        for field in self.FORMAT_STRING_FIELDS_PATTERN.findall(self._fmt):
+        for field in self._fields:
             record.__dict__[field] = record.__dict__.get(field)
         return record
 
     def format(self, record):
         record = self.add_fields(record)
-        try:
-            record.msg = str(record.msg).format(**record.__dict__)
-        except (KeyError, IndexError) as e:
-            logger.exception("failed to format log message: {} not found".format(e))
+        message = str(record.msg)
+        if _has_braces(message):
+            try:
+                message = message.format(**record.__dict__)
+            except (KeyError, IndexError) as e:
+                logger.exception("failed to format log message: {} not found".format(e))
+        record.msg = message
         return super(CustomLogFormatter, self).format(record)
 
 
-class JSONFormatter(BaseJSONFormatter):
+class JSONFormatter(CachedTimeFormatterMixin, BaseJSONFormatter):
+    """
+    Builds the same JSON as `BaseJSONFormatter`, with some fields
+    renamed, but with less work for each record:
+    - messages are only formatted a second time if they have braces in
+    - one JSON encoder is made, and reused for every record
+
+    The JSON is encoded by the standard library, which uses its C
+    accelerated encoder. Faster encoders, like orjson, write different
+    whitespace and don’t escape non-ASCII characters, so the logs
+    wouldn’t be byte for byte the same.
+    """
+
+    # Fields which are renamed, in the order they’re moved to the end
+    # of each log
+    RENAMED_FIELDS = (
+        ("asctime", "time"),
+        ("request_id", "requestId"),
+        ("app_name", "application"),
+        ("service_id", "service_id"),
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._encoder = None
+        if self.json_serializer is json.dumps:
+            self._encoder = (self.json_encoder or json.JSONEncoder)(
+                default=self.json_default,
+                ensure_ascii=self.json_ensure_ascii,
+                indent=self.json_indent,
+            )
+
     def process_log_record(self, log_record):
-        rename_map = {
-            "asctime": "time",
-            "request_id": "requestId",
-            "app_name": "application",
-            "service_id": "service_id"
-        }
-        for key, newkey in rename_map.items():
-            log_record[newkey] = log_record.pop(key)
+        for key, newkey in self.RENAMED_FIELDS:
+            # Fields can already have been renamed with `rename_fields`
+            if key in log_record:
+                log_record[newkey] = log_record.pop(key)
         log_record['logType'] = "application"
-        try:
-            log_record['message'] = log_record['message'].format(**log_record)
-        except (KeyError, IndexError) as e:
-            logger.exception("failed to format log message: {} not found".format(e))
+        message = log_record['message']
+        # If a dictionary is logged its items are added to the log and
+        # the message is `None`, so there’s nothing to format
+        if isinstance(message, str) and _has_braces(message):
+            try:
+                log_record['message'] = message.format(**log_record)
+            except (KeyError, IndexError) as e:
+                logger.exception("failed to format log message: {} not found".format(e))
         return log_record
+
+    def jsonify_log_record(self, log_record):
+        if self._encoder is None:
+            return super().jsonify_log_record(log_record)
+        return self._encoder.encode(log_record)
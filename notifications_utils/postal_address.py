@@ -8,6 +8,7 @@ from notifications_utils.formatters import (
     remove_whitespace,
     remove_whitespace_before_punctuation,
 )
+from notifications_utils.profiling import profiled
 
 address_lines_1_to_6_keys = [
     # The API only accepts snake_case placeholders
@@ -113,6 +114,7 @@ class PostalAddress():
         return self.postage != Postage.UK
 
     @property
+    @profiled('PostalAddress.normalised')
     def normalised(self):
         return '\n'.join(self.normalised_lines)
 
@@ -0,0 +1,208 @@
+"""
+Opt-in timing of the stages of rendering a template or processing a
+spreadsheet, without an external profiler.
+
+Wrap the code to profile in `profile`:
+
+    with profile('process-job') as report:
+        RecipientCSV(file_data, template=template).has_errors
+
+    report.log(current_app.logger)
+
+Every `span`, or call to a function decorated with `profiled`, inside the
+`with` block is timed and added to the report, nested inside any span
+it’s called from. Outside a `profile` block each one costs a single
+context variable lookup.
+
+Reports are per thread (or per task, with asyncio), so spans in threads
+started inside the `with` block aren’t counted.
+
+Call `init_app` with `PROFILING_ENABLED` set to profile every request to
+a Flask app.
+"""
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+
+from flask import current_app, g, request
+
+_current_report = ContextVar('profiling_report', default=None)
+
+
+class ProfilingReport():
+    """
+    The number of times each span was entered and the total time spent
+    in it, keyed by the names of the spans it was nested in, starting
+    with the name of the report
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = {}
+        self._stack = [(name, monotonic())]
+        self.elapsed_time = None
+
+    def _start(self, name):
+        self._stack.append((name, monotonic()))
+
+    def _end(self):
+        end_time = monotonic()
+        path = tuple(name for name, _ in self._stack)
+        _, start_time = self._stack.pop()
+        span = self.spans.get(path)
+        if span is None:
+            span = self.spans[path] = [0, 0]
+        span[0] += 1
+        span[1] += end_time - start_time
+        return end_time - start_time
+
+    def _finish(self):
+        self.elapsed_time = self._end()
+
+    @property
+    def totals(self):
+        """
+        The number of calls and total time for each span name, wherever
+        it was nested. Time in a span nested inside another span with
+        the same name is only counted once.
+        """
+        totals = {}
+        for path, (count, elapsed_time) in self.spans.items():
+            name = path[-1]
+            if name in path[:-1]:
+                continue
+            total = totals.setdefault(name, [0, 0])
+            total[0] += count
+            total[1] += elapsed_time
+        return totals
+
+    @property
+    def self_times(self):
+        """
+        The time spent in each span not in any span nested inside it,
+        keyed by path
+        """
+        self_times = {path: elapsed_time for path, (_, elapsed_time) in self.spans.items()}
+        for path, (_, elapsed_time) in self.spans.items():
+            if len(path) > 1:
+                self_times[path[:-1]] -= elapsed_time
+        return self_times
+
+    def __str__(self):
+        return '\n'.join(
+            '{:<60} {:>8} {:>12.3f}ms'.format(
+                '  ' * (len(path) - 1) + path[-1], count, elapsed_time * 1000,
+            )
+            for path, (count, elapsed_time) in sorted(self.spans.items())
+        )
+
+    def log(self, logger):
+        logger.info('Profile of {}:\n{}'.format(self.name, self))
+
+    def send_stats(self, statsd_client, prefix='profiling'):
+        """
+        Sends the total time in each span, as `<prefix>.<span name>`.
+        Spans are sent by name, not by path, so the number of stats
+        doesn’t depend on how the spans were nested.
+        """
+        for name, (_, elapsed_time) in self.totals.items():
+            statsd_client.timing('{}.{}'.format(prefix, name), elapsed_time)
+
+    def collapsed_stacks(self):
+        """
+        Returns the report in the ‘collapsed stack’ format read by
+        flamegraph.pl and speedscope: one line per path, with the time
+        spent in it in microseconds
+        """
+        return '\n'.join(
+            '{} {}'.format(';'.join(path), round(self_time * 1_000_000))
+            for path, self_time in sorted(self.self_times.items())
+        )
+
+
+@contextmanager
+def profile(name):
+    report = ProfilingReport(name)
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+        report._finish()
+
+
+class _Span():
+
+    __slots__ = ('report', 'name')
+
+    def __init__(self, report, name):
+        self.report = report
+        self.name = name
+
+    def __enter__(self):
+        self.report._start(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.report._end()
+
+
+class _NoSpan():
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_no_span = _NoSpan()
+
+
+def span(name):
+    report = _current_report.get()
+    if report is None:
+        return _no_span
+    return _Span(report, name)
+
+
+def profiled(name):
+    """
+    Times every call to the decorated function as a span called `name`
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            report = _current_report.get()
+            if report is None:
+                return func(*args, **kwargs)
+            report._start(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                report._end()
+        return wrapper
+    return decorator
+
+
+def init_app(app):
+    if app.config.get('PROFILING_ENABLED'):
+        app.before_request(start_profiling_request)
+        app.teardown_request(finish_profiling_request)
+
+
+def start_profiling_request():
+    g.profiling_report = ProfilingReport(request.endpoint or 'request')
+    _current_report.set(g.profiling_report)
+
+
+def finish_profiling_request(exception=None):
+    report = g.pop('profiling_report', None)
+    if report is None:
+        return
+    _current_report.set(None)
+    report._finish()
+    report.log(current_app.logger)
+    statsd_client = getattr(current_app, 'statsd_client', None)
+    if statsd_client is not None:
+        report.send_stats(statsd_client)
@@ -0,0 +1,66 @@
+from threading import Lock
+
+from cachetools import LRUCache
+
+
+class RenderCache:
+    """
+    A size-bounded cache of rendered templates, which evicts whatever
+    was least recently used when it’s full.
+
+    To use it, set it as the `render_cache` of a template instance, or
+    of a template class to share it between every template of that
+    type, for example:
+
+        HTMLEmailTemplate.render_cache = RenderCache(maxsize=10_000)
+
+    Call `send_stats` periodically to record the hit rate.
+    """
+
+    def __init__(self, maxsize=1024):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get_or_render(self, key, render):
+        try:
+            hash(key)
+        except TypeError:
+            # Some values, like dictionaries, can’t be part of a key
+            return render()
+
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        rendered = render()
+
+        with self._lock:
+            self._cache[key] = rendered
+
+        return rendered
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def send_stats(self, statsd_client, stat='render-cache'):
+        """
+        Sends the number of hits and misses since the last time this was
+        called, and the current size of the cache
+        """
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            self.hits = self.misses = 0
+
+        statsd_client.incr('{}.hit'.format(stat), count=hits)
+        statsd_client.incr('{}.miss'.format(stat), count=misses)
+        statsd_client.gauge('{}.size'.format(stat), len(self))
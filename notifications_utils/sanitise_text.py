@@ -1,9 +1,32 @@
 import unicodedata
 
 
+class EncodingTable(dict):
+    """
+    A table for `str.translate` which works out how to encode each
+    character the first time it’s seen, and remembers it after that.
+
+    The table stops remembering new characters once it has `max_size`
+    of them, so text with lots of unusual characters can’t make it use
+    an unbounded amount of memory.
+    """
+
+    def __init__(self, encode_char, max_size):
+        self.encode_char = encode_char
+        self.max_size = max_size
+
+    def __missing__(self, codepoint):
+        encoded = self.encode_char(chr(codepoint))
+        if len(self) < self.max_size:
+            self[codepoint] = encoded
+        return encoded
+
+
 class SanitiseText:
     ALLOWED_CHARACTERS = set()
 
+    ENCODING_TABLE_MAX_SIZE = 10_000
+
     REPLACEMENT_CHARACTERS = {
         '–': '-',  # EN DASH (U+2013)
         '—': '-',  # EM DASH (U+2014)
@@ -19,7 +42,15 @@ class SanitiseText:
 
     @classmethod
     def encode(cls, content):
-        return ''.join(cls.encode_char(char) for char in content)
+        return content.translate(cls.get_encoding_table())
+
+    @classmethod
+    def get_encoding_table(cls):
+        # Each subclass has different allowed characters, so needs its
+        # own table rather than inheriting one from its parent
+        if '_encoding_table' not in cls.__dict__:
+            cls._encoding_table = EncodingTable(cls.encode_char, cls.ENCODING_TABLE_MAX_SIZE)
+        return cls._encoding_table
 
     @classmethod
     def get_non_compatible_characters(cls, content):
@@ -28,19 +59,21 @@ class SanitiseText:
 
         This follows the same rules as `cls.encode`, but returns just the characters that encode would replace with `?`
         """
-        return set(c for c in content if c not in cls.ALLOWED_CHARACTERS and cls.downgrade_character(c) is None)
+        return set(
+            c for c in set(content) - cls.ALLOWED_CHARACTERS if cls.downgrade_character(c) is None
+        )
 
     @staticmethod
     def get_unicode_char_from_codepoint(codepoint):
         """
         Given a unicode codepoint (eg 002E for '.', 0061 for 'a', etc), return that actual unicode character.
 
-        unicodedata.decomposition returns strings containing codepoints, so we need to eval them ourselves
+        unicodedata.decomposition returns strings containing codepoints as hexadecimal
         """
         # lets just make sure we aren't evaling anything weird
         if not set(codepoint) <= set('0123456789ABCDEF') or not len(codepoint) == 4:
             raise ValueError('{} is not a valid unicode codepoint'.format(codepoint))
-        return eval('"\\u{}"'.format(codepoint))
+        return chr(int(codepoint, 16))
 
     @classmethod
     def downgrade_character(cls, c):
@@ -1,34 +1,121 @@
 import functools
+import inspect
 import time
 
-from flask import current_app
+from flask import current_app, has_app_context
 
 
-def statsd(namespace):
+class StatsdTimer():
+    """
+    Times the code in a `with` block, then increments a counter and sends
+    the time taken. If the block raises an exception both are sent under
+    `<stat>.failed` instead.
+
+    Uses `client` if it’s given, otherwise the current app’s
+    `statsd_client`. Outside an app context, with no client, nothing is
+    sent.
+
+    With a `rate` of less than 1 only that fraction of counts and timings
+    are sent, sampled by the statsd client.
+    """
+
+    def __init__(self, stat, client=None, rate=1):
+        self.stat = stat
+        self.client = client
+        self.rate = rate
+        self.elapsed_time = None
+        self.failed = False
+
+    def __enter__(self):
+        self.start_time = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.elapsed_time = time.monotonic() - self.start_time
+        # A generator that’s closed before it’s exhausted hasn’t failed
+        self.failed = exc_type is not None and not issubclass(exc_type, GeneratorExit)
+
+        client = self.client or _get_statsd_client()
+        if client is not None:
+            stat = '{}.failed'.format(self.stat) if self.failed else self.stat
+            client.incr(stat, rate=self.rate)
+            client.timing(stat, self.elapsed_time, self.rate)
+
+
+def _get_statsd_client():
+    if has_app_context():
+        return getattr(current_app, 'statsd_client', None)
+    return None
+
+
+def statsd(namespace, client=None, rate=1):
+    """
+    Times every call to the decorated function as
+    `<namespace>.<function name>`, using a `StatsdTimer`.
+
+    Works with `async def` functions, which are timed until they return,
+    and generators, which are timed until they’re exhausted or closed
+    rather than until they’re created.
+    """
     def time_function(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            start_time = time.monotonic()
-            try:
-                res = func(*args, **kwargs)
-                elapsed_time = time.monotonic() - start_time
-                current_app.statsd_client.incr('{namespace}.{func}'.format(
-                    namespace=namespace, func=func.__name__)
-                )
-                current_app.statsd_client.timing('{namespace}.{func}'.format(
-                    namespace=namespace, func=func.__name__), elapsed_time
-                )
-
-            except Exception as e:
-                raise e
-            else:
-                current_app.logger.debug(
-                    "{namespace} call {func} took {time}".format(
-                        namespace=namespace, func=func.__name__, time="{0:.4f}".format(elapsed_time)
-                    )
-                )
-                return res
-        wrapper.__wrapped__.__name__ = func.__name__
-        return wrapper
+        stat = '{namespace}.{func}'.format(namespace=namespace, func=func.__name__)
+        timer = functools.partial(StatsdTimer, stat, client=client, rate=rate)
+        log = functools.partial(_log_elapsed_time, namespace, func.__name__)
+        wrap = next(wrap for is_kind_of_function, wrap in _WRAPPERS if is_kind_of_function(func))
+        return functools.wraps(func)(wrap(func, timer, log))
 
     return time_function
+
+
+def _log_elapsed_time(namespace, func_name, elapsed_time):
+    if has_app_context():
+        current_app.logger.debug(
+            "{namespace} call {func} took {time}".format(
+                namespace=namespace, func=func_name, time="{0:.4f}".format(elapsed_time)
+            )
+        )
+
+
+def _wrap_async_generator(func, timer, log):
+    async def wrapper(*args, **kwargs):
+        with timer() as t:
+            async for item in func(*args, **kwargs):
+                yield item
+        log(t.elapsed_time)
+    return wrapper
+
+
+def _wrap_coroutine(func, timer, log):
+    async def wrapper(*args, **kwargs):
+        with timer() as t:
+            res = await func(*args, **kwargs)
+        log(t.elapsed_time)
+        return res
+    return wrapper
+
+
+def _wrap_generator(func, timer, log):
+    def wrapper(*args, **kwargs):
+        with timer() as t:
+            res = yield from func(*args, **kwargs)
+        log(t.elapsed_time)
+        return res
+    return wrapper
+
+
+def _wrap_function(func, timer, log):
+    def wrapper(*args, **kwargs):
+        with timer() as t:
+            res = func(*args, **kwargs)
+        log(t.elapsed_time)
+        return res
+    return wrapper
+
+
+# The first of these which matches the decorated function is used
+_WRAPPERS = (
+    (inspect.isasyncgenfunction, _wrap_async_generator),
+    (inspect.iscoroutinefunction, _wrap_coroutine),
+    (inspect.isgeneratorfunction, _wrap_generator),
+    (callable, _wrap_function),
+)
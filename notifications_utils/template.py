@@ -1,19 +1,23 @@
 import math
+import re
 from abc import ABC, abstractmethod
+from collections import namedtuple
 from datetime import datetime
-from functools import lru_cache
+from functools import lru_cache, partial, wraps
 from html import unescape
 from os import path
 
 from flask import Markup
 from jinja2 import Environment, FileSystemLoader
+from jinja2 import Template as JinjaTemplate
 
 from notifications_utils import LETTER_MAX_PAGE_COUNT, SMS_CHAR_COUNT_LIMIT
 from notifications_utils.columns import Columns
 from notifications_utils.countries.data import Postage
-from notifications_utils.field import Field, PlainTextField
+from notifications_utils.field import Field, PlainTextField, compile_field
 from notifications_utils.formatters import (
     MAGIC_SEQUENCE,
+    OBSCURE_WHITESPACE,
     add_prefix,
     add_trailing_newline,
     autolink_sms,
@@ -41,22 +45,63 @@ from notifications_utils.postal_address import (
     PostalAddress,
     address_lines_1_to_7_keys,
 )
+from notifications_utils.profiling import profiled
 from notifications_utils.sanitise_text import SanitiseSMS
 from notifications_utils.take import Take
 from notifications_utils.template_change import TemplateChange
 
+
+class ProfiledJinjaTemplate(JinjaTemplate):
+
+    @profiled('jinja.render')
+    def render(self, *args, **kwargs):
+        return super().render(*args, **kwargs)
+
+
 template_env = Environment(loader=FileSystemLoader(
     path.join(
         path.dirname(path.abspath(__file__)),
         'jinja_templates',
     )
 ))
+template_env.template_class = ProfiledJinjaTemplate
+
+
+def cached_render(render):
+    """
+    Looks up the output of `render` in the template’s `render_cache`, if
+    it has one, rather than rendering it again
+    """
+    @wraps(render)
+    def wrapper(self):
+        if self.render_cache is None:
+            return render(self)
+        return self.render_cache.get_or_render(
+            (render.__qualname__, ) + self._render_cache_key,
+            partial(render, self),
+        )
+    return wrapper
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(map(_freeze, value))
+    # Including the type means `1` and `True` don’t share a key, even
+    # though they’re equal
+    return type(value), value
 
 
 class Template(ABC):
 
     encoding = "utf-8"
 
+    # An optional `RenderCache`
+    render_cache = None
+
+    # Attributes which don’t affect how the template is rendered, or
+    # which are already part of the key in another form
+    attributes_not_in_render_cache_key = {'_template', '_values', '_content_count', 'name', 'render_cache'}
+
     def __init__(
         self,
         template,
@@ -107,11 +152,12 @@ class Template(ABC):
         if not value:
             self._values = {}
         else:
-            placeholders = Columns.from_keys(self.placeholders)
+            placeholders = self.placeholders
+            placeholder_keys = Columns.from_keys(placeholders).keys()
             self._values = Columns(value).as_dict_with_keys(
-                self.placeholders | set(
+                placeholders | set(
                     key for key in value.keys()
-                    if Columns.make_key(key) not in placeholders.keys()
+                    if Columns.make_key(key) not in placeholder_keys
                 )
             )
 
@@ -133,6 +179,42 @@ class Template(ABC):
     def get_raw(self, key, default=None):
         return self._template.get(key, default)
 
+    @property
+    def _render_cache_key(self):
+        return (
+            type(self),
+            self.id,
+            self._template.get('version'),
+            frozenset((key, _freeze(value)) for key, value in self.values.items()),
+            tuple(sorted(
+                (key, _freeze(value)) for key, value in vars(self).items()
+                if key not in self.attributes_not_in_render_cache_key
+            )),
+        )
+
+    def render_many(self, values_iterable):
+        """
+        Renders the template once for each set of values, yielding a
+        `rendered_template` each time. It’s a generator, so only one
+        rendered message is held in memory at a time.
+
+        Anything which doesn’t depend on the values, like finding the
+        placeholders or rendering the email branding, is only done once
+        for the whole batch. The template is left with the last set of
+        values.
+        """
+        for values in values_iterable:
+            self.values = values
+            yield self._render()
+
+    def _render(self):
+        return rendered_template(
+            subject=None,
+            plain_text=None,
+            html=str(self),
+            fragment_count=None,
+        )
+
     def compare_to(self, new):
         return TemplateChange(self, new)
 
@@ -223,7 +305,13 @@ class BaseSMSTemplate(Template):
         as in the message `foo ((placeholder))` has a length of 19.
         """
         if self._content_count is None:
-            self._content_count = len(self._get_unsanitised_content())
+            replacements = self._get_replacements_for_counting()
+            if replacements is None:
+                self._content_count = len(self._get_unsanitised_content())
+            else:
+                self._content_count = get_sms_counts_for_fixed_content(
+                    self.content, self.prefix
+                ).character_count + sum(map(len, replacements))
         return self._content_count
 
     @property
@@ -237,6 +325,23 @@ class BaseSMSTemplate(Template):
 
     @property
     def fragment_count(self):
+        # Counting the values separately only matches what `__str__`
+        # returns when it’s rendering the message as it will be sent
+        replacements = (
+            self._get_replacements_for_counting()
+            if type(self).__str__ is SMSMessageTemplate.__str__ else None
+        )
+
+        if replacements is not None:
+            fixed_counts = get_sms_counts_for_fixed_content(self.content, self.prefix)
+            encoded_replacements = [sms_encode(replacement) for replacement in replacements]
+            return get_sms_fragment_count(
+                self.content_count + fixed_counts.extended_gsm_character_count + sum(
+                    map(count_extended_gsm_chars, encoded_replacements)
+                ),
+                fixed_counts.non_gsm_characters.union(*map(non_gsm_characters, encoded_replacements)),
+            )
+
         content_with_placeholders = str(self)
 
         # Extended GSM characters count as 2 characters
@@ -256,6 +361,14 @@ class BaseSMSTemplate(Template):
     def is_message_empty(self):
         return self.content_count_without_prefix == 0
 
+    def _render(self):
+        return rendered_template(
+            subject=None,
+            plain_text=self.content_with_placeholders_filled_in,
+            html=None,
+            fragment_count=self.fragment_count,
+        )
+
     def _get_unsanitised_content(self):
         # This is faster to call than SMSMessageTemplate.__str__ if all
         # you need to know is how many characters are in the message
@@ -265,24 +378,44 @@ class BaseSMSTemplate(Template):
             values = {
                 key: MAGIC_SEQUENCE for key in self.placeholders
             }
-        return Take(PlainTextField(
-            self.content, values, html='passthrough'
-        )).then(
-            add_prefix, self.prefix
-        ).then(
-            remove_whitespace_before_punctuation
-        ).then(
-            normalise_whitespace_and_newlines
-        ).then(
-            normalise_multiple_newlines
-        ).then(
-            str.strip
+        return Take(
+            normalise_sms_content(PlainTextField(self.content, values, html='passthrough'), self.prefix)
         ).then(
             str.replace, MAGIC_SEQUENCE, ''
         )
 
+    def _get_replacements_for_counting(self):
+        """
+        Fills in each placeholder and normalises its value as it would be
+        normalised as part of the whole message. Together with
+        `get_sms_counts_for_fixed_content` this means the message can be
+        counted without rendering it.
+
+        Returns `None` if any of the values could change how the
+        whitespace or punctuation around them is normalised, in which
+        case the message needs rendering in full.
+        """
+        if not self.values:
+            return None
+
+        field = PlainTextField(self.content, self.values, html='passthrough')
+        replacements = [
+            field.replace_placeholder(placeholder)
+            for placeholder in compile_field(self.content, str)[1]
+        ]
+
+        if not all(map(_can_be_counted_in_isolation, replacements)):
+            return None
+
+        return [
+            normalise_sms_content(replacement, None)
+            if needs_normalising.search(replacement) else replacement
+            for replacement in replacements
+        ]
+
 
 class SMSMessageTemplate(BaseSMSTemplate):
+    @cached_render
     def __str__(self):
         return sms_encode(self._get_unsanitised_content())
 
@@ -296,6 +429,7 @@ class SMSBodyPreviewTemplate(BaseSMSTemplate):
     ):
         super().__init__(template, values, show_prefix=False)
 
+    @cached_render
     def __str__(self):
 
         return Markup(Take(Field(
@@ -338,6 +472,7 @@ class SMSPreviewTemplate(BaseSMSTemplate):
         super().__init__(template, values, prefix, show_prefix, sender)
         self.redact_missing_personalisation = redact_missing_personalisation
 
+    @cached_render
     def __str__(self):
 
         return Markup(self.jinja_template.render({
@@ -416,6 +551,7 @@ class BroadcastMessageTemplate(BaseBroadcastTemplate, SMSMessageTemplate):
             values=None,  # events have already done interpolation of any personalisation
         )
 
+    @cached_render
     def __str__(self):
         return Take(Field(
             self.content.strip(),
@@ -444,6 +580,7 @@ class SubjectMixin():
         super().__init__(template, values, **kwargs)
 
     @property
+    @cached_render
     def subject(self):
         return Markup(Take(Field(
             self._subject,
@@ -464,8 +601,18 @@ class SubjectMixin():
 class BaseEmailTemplate(SubjectMixin, Template):
     template_type = 'email'
 
+    # When set, the body is rendered from markdown which has been parsed
+    # once for the template, rather than once per message. See
+    # `compile_email_markdown`
+    compile_markdown = False
+
     @property
+    @cached_render
     def html_body(self):
+        if self.compile_markdown:
+            html_body = self._get_html_body_from_compiled_markdown()
+            if html_body is not None:
+                return html_body
         return Take(Field(
             self.content,
             self.values,
@@ -484,10 +631,43 @@ class BaseEmailTemplate(SubjectMixin, Template):
             do_nice_typography
         )
 
+    def _get_html_body_from_compiled_markdown(self):
+        compiled = compile_email_markdown(self.content)
+        if compiled is None:
+            return None
+        literals, placeholders = compiled
+        if placeholders and not self.values:
+            return None
+        field = Field(
+            self.content,
+            self.values,
+            html='escape',
+            markdown_lists=True,
+            redact_missing_personalisation=self.redact_missing_personalisation,
+        )
+        replacements = [field.replace_placeholder(placeholder) for placeholder in placeholders]
+        if not all(map(inert_placeholder_value.fullmatch, replacements)):
+            return None
+        pieces = [None] * (len(literals) + len(replacements))
+        pieces[0::2] = literals
+        pieces[1::2] = replacements
+        return ''.join(pieces)
+
     @property
     def content_size_in_bytes(self):
         return len(self.content_with_placeholders_filled_in.encode("utf8"))
 
+    def _render(self):
+        # The subject and plain text are always rendered the way
+        # `PlainTextEmailTemplate` renders them, because that’s what
+        # gets sent alongside the HTML version
+        return rendered_template(
+            subject=str(PlainTextEmailTemplate.subject.fget(self)),
+            plain_text=PlainTextEmailTemplate.__str__(self),
+            html=None,
+            fragment_count=None,
+        )
+
     def is_message_too_long(self):
         """
             SES rejects email messages bigger than 10485760 bytes (just over 10 MB per message (after base64 encoding)):
@@ -524,6 +704,7 @@ class BaseEmailTemplate(SubjectMixin, Template):
 
 class PlainTextEmailTemplate(BaseEmailTemplate):
 
+    @cached_render
     def __str__(self):
         return Take(Field(
             self.content, self.values, html='passthrough', markdown_lists=True
@@ -546,6 +727,7 @@ class PlainTextEmailTemplate(BaseEmailTemplate):
         )
 
     @property
+    @cached_render
     def subject(self):
         return Markup(Take(Field(
             self._subject,
@@ -565,6 +747,13 @@ class HTMLEmailTemplate(BaseEmailTemplate):
 
     PREHEADER_LENGTH_IN_CHARACTERS = 256
 
+    # Which attribute fills in each of the gaps in the Jinja template
+    EMAIL_CHROME_ATTRIBUTES = {
+        'subject': 'subject',
+        'body': 'html_body',
+        'preheader': 'preheader',
+    }
+
     def __init__(
         self,
         template,
@@ -575,9 +764,11 @@ class HTMLEmailTemplate(BaseEmailTemplate):
         brand_text=None,
         brand_colour=None,
         brand_banner=False,
-        brand_name=None
+        brand_name=None,
+        compile_markdown=False,
     ):
         super().__init__(template, values)
+        self.compile_markdown = compile_markdown
         self.govuk_banner = govuk_banner
         self.complete_html = complete_html
         self.brand_logo = brand_logo
@@ -587,6 +778,7 @@ class HTMLEmailTemplate(BaseEmailTemplate):
         self.brand_name = brand_name
 
     @property
+    @cached_render
     def preheader(self):
         return " ".join(Take(Field(
             self.content,
@@ -605,6 +797,7 @@ class HTMLEmailTemplate(BaseEmailTemplate):
             do_nice_typography
         ).split())[:self.PREHEADER_LENGTH_IN_CHARACTERS].strip()
 
+    @cached_render
     def __str__(self):
 
         return self.jinja_template.render({
@@ -620,6 +813,26 @@ class HTMLEmailTemplate(BaseEmailTemplate):
             'brand_name': self.brand_name
         })
 
+    def _render(self):
+        # Gives the same output as `str(self)` but reuses the branding,
+        # which is the same for every message in the batch
+        literals, placeholders = get_email_chrome(
+            self.jinja_template,
+            govuk_banner=self.govuk_banner,
+            complete_html=self.complete_html,
+            brand_logo=self.brand_logo,
+            brand_text=self.brand_text,
+            brand_colour=self.brand_colour,
+            brand_banner=self.brand_banner,
+            brand_name=self.brand_name,
+        )
+        pieces = [None] * (len(literals) + len(placeholders))
+        pieces[0::2] = literals
+        pieces[1::2] = (
+            str(getattr(self, self.EMAIL_CHROME_ATTRIBUTES[placeholder])) for placeholder in placeholders
+        )
+        return super()._render()._replace(html=''.join(pieces))
+
 
 class EmailPreviewTemplate(BaseEmailTemplate):
 
@@ -641,6 +854,7 @@ class EmailPreviewTemplate(BaseEmailTemplate):
         self.reply_to = reply_to
         self.show_recipient = show_recipient
 
+    @cached_render
     def __str__(self):
         return Markup(self.jinja_template.render({
             'body': self.html_body,
@@ -653,6 +867,7 @@ class EmailPreviewTemplate(BaseEmailTemplate):
         }))
 
     @property
+    @cached_render
     def subject(self):
         return Take(Field(
             self._subject,
@@ -670,6 +885,10 @@ class BaseLetterTemplate(SubjectMixin, Template):
 
     template_type = 'letter'
 
+    # `date` defaults to the current time, but letters only show the day,
+    # so the key uses the date as it’s shown instead
+    attributes_not_in_render_cache_key = Template.attributes_not_in_render_cache_key | {'date'}
+
     address_block = '\n'.join(
         f'(({line.replace("_", " ")}))' for line in address_lines_1_to_7_keys
     )
@@ -691,6 +910,7 @@ class BaseLetterTemplate(SubjectMixin, Template):
         self.date = date or datetime.utcnow()
 
     @property
+    @cached_render
     def subject(self):
         return Take(Field(
             self._subject,
@@ -711,6 +931,9 @@ class BaseLetterTemplate(SubjectMixin, Template):
     def postal_address(self):
         return PostalAddress.from_personalisation(Columns(self.values))
 
+    def _render(self):
+        return super()._render()._replace(subject=str(self.subject))
+
     @property
     def _address_block(self):
 
@@ -747,6 +970,10 @@ class BaseLetterTemplate(SubjectMixin, Template):
     def _date(self):
         return self.date.strftime('%-d %B %Y')
 
+    @property
+    def _render_cache_key(self):
+        return super()._render_cache_key + (self._date, )
+
     @property
     def _message(self):
         return Take(Field(
@@ -770,6 +997,7 @@ class LetterPreviewTemplate(BaseLetterTemplate):
 
     jinja_template = template_env.get_template('letter_pdf/preview.jinja2')
 
+    @cached_render
     def __str__(self):
         return Markup(self.jinja_template.render({
             'admin_base_url': self.admin_base_url,
@@ -857,6 +1085,7 @@ class LetterImageTemplate(BaseLetterTemplate):
             Postage.REST_OF_WORLD: 'letter-postage-international',
         }.get(self.postage)
 
+    @cached_render
     def __str__(self):
         return Markup(self.jinja_template.render({
             'image_url': self.image_url,
@@ -872,6 +1101,196 @@ class LetterImageTemplate(BaseLetterTemplate):
         }))
 
 
+rendered_template = namedtuple('RenderedTemplate', [
+    'subject',
+    'plain_text',
+    'html',
+    'fragment_count',
+])
+
+EMAIL_CHROME_PLACEHOLDER = re.compile('\uE001([a-z]+)\uE001')
+
+
+@lru_cache(maxsize=128)
+def get_email_chrome(jinja_template, **branding):
+    """
+    Renders the parts of an HTML email which only depend on the branding
+    (everything except the subject, body and preheader) once, and
+    splits it up so each message can be slotted into the gaps.
+
+    Returns a tuple of literal strings and a tuple of the names of the
+    gaps between them, like `compile_field`.
+    """
+    parts = EMAIL_CHROME_PLACEHOLDER.split(jinja_template.render(dict(
+        branding,
+        **{
+            key: '\uE001{}\uE001'.format(key)
+            for key in HTMLEmailTemplate.EMAIL_CHROME_ATTRIBUTES
+        }
+    )))
+    return tuple(parts[0::2]), tuple(parts[1::2])
+
+
+# Each placeholder in a compiled email body is represented by a single
+# character from the private use area, which none of the formatters
+# treat as anything other than text
+FIRST_PLACEHOLDER_TOKEN = 0xE100
+LAST_PLACEHOLDER_TOKEN = 0xF8FF
+placeholder_token = re.compile('([\uE100-\uF8FF])')
+
+# Letters and numbers, with single spaces, hyphens or slashes between
+# them. None of the formatters can treat a value like this differently
+# depending on what’s around it, as long as it’s surrounded by whitespace
+# or punctuation
+inert_placeholder_value = re.compile(r'[^\W_]+(?:[ \-/][^\W_]+)*')
+
+# What can come after a placeholder without affecting how the value
+# is formatted
+inert_placeholder_suffix = re.compile(r'[,.!?;:)]*(?:\s|\Z)')
+
+# The start of a line in a list or quote
+list_or_quote_markers = re.compile(r'[\s*+•>^\-\d.]*')
+
+
+@lru_cache(maxsize=1024)
+def compile_email_markdown(content):
+    """
+    Renders the HTML for the body of an email once, with each placeholder
+    replaced by a token, and splits it up so each message’s values can
+    be slotted into the gaps.
+
+    This only gives the same HTML as rendering the whole message if the
+    values are inert (see `inert_placeholder_value`). Returns `None`
+    for templates where a placeholder is somewhere that even an inert
+    value could change the formatting, for example at the start of a
+    line, next to a quote or inside a link.
+    """
+    literals, placeholders = compile_field(content, escape_html)
+
+    if len(placeholders) > LAST_PLACEHOLDER_TOKEN - FIRST_PLACEHOLDER_TOKEN or placeholder_token.search(content):
+        return None
+
+    tokens = [chr(FIRST_PLACEHOLDER_TOKEN + index) for index in range(len(placeholders))]
+    pieces = [None] * (len(literals) + len(tokens))
+    pieces[0::2] = literals
+    pieces[1::2] = tokens
+
+    markdown = Take(''.join(pieces)).then(
+        unlink_govuk_escaped
+    ).then(
+        strip_unsupported_characters
+    ).then(
+        add_trailing_newline
+    )
+
+    if ']:' in markdown or not all(_token_is_isolated(markdown, token) for token in tokens):
+        return None
+
+    html = Take(markdown).then(notify_email_markdown).then(do_nice_typography)
+
+    if not all(_token_is_in_text(html, token) for token in tokens):
+        return None
+
+    parts = placeholder_token.split(html)
+    return (
+        tuple(parts[0::2]),
+        tuple(placeholders[ord(token) - FIRST_PLACEHOLDER_TOKEN] for token in parts[1::2]),
+    )
+
+
+def _token_is_isolated(markdown, token):
+    index = markdown.find(token)
+    if index != markdown.rfind(token):
+        return False
+    if index > 0 and not markdown[index - 1].isspace():
+        return False
+    if not inert_placeholder_suffix.match(markdown, index + 1):
+        return False
+    start_of_line = markdown.rfind('\n', 0, index) + 1
+    end_of_line = markdown.find('\n', index)
+    if end_of_line == -1:
+        end_of_line = len(markdown)
+    # A number at the start of a line followed by a full stop would
+    # start a numbered list
+    if markdown[index + 1:index + 2] == '.' and not markdown[start_of_line:index].strip():
+        return False
+    # In a list or a quote, even after stacked markers like `--`, a value
+    # could start a nested list
+    if markdown[start_of_line:index].strip() and list_or_quote_markers.fullmatch(markdown, start_of_line, index):
+        return False
+    # Tabs are expanded to the next tab stop, so how much space a tab
+    # after the placeholder takes up depends on the length of the value
+    return '\t' not in markdown[index + 1:end_of_line]
+
+
+def _token_is_in_text(html, token):
+    # Tokens which end up in an attribute, like a link’s `href`, or which
+    # have been dropped or duplicated by the markdown can’t be replaced
+    index = html.find(token)
+    if index == -1 or index != html.rfind(token):
+        return False
+    return html.rfind('<', 0, index) <= html.rfind('>', 0, index)
+
+
+sms_counts = namedtuple('SMSCounts', [
+    'character_count',
+    'extended_gsm_character_count',
+    'non_gsm_characters',
+])
+
+# A private use character, which isn’t whitespace or punctuation, so is
+# left alone by all the normalisation we do to an SMS
+PLACEHOLDER_STAND_IN = '\uE000'
+
+# Whitespace other than single spaces, spaces before punctuation and
+# obscure whitespace are all changed by `normalise_sms_content`
+needs_normalising = re.compile(r'[^\S ]|\s{2}| [,\.]|[' + OBSCURE_WHITESPACE + ']')
+whitespace_at_either_end_or_leading_punctuation = re.compile(
+    r'^[\s,\.' + OBSCURE_WHITESPACE + r']|[\s' + OBSCURE_WHITESPACE + ']$'
+)
+
+
+def normalise_sms_content(content, prefix):
+    return Take(
+        content
+    ).then(
+        add_prefix, prefix
+    ).then(
+        remove_whitespace_before_punctuation
+    ).then(
+        normalise_whitespace_and_newlines
+    ).then(
+        normalise_multiple_newlines
+    ).then(
+        str.strip
+    )
+
+
+@lru_cache(maxsize=1024)
+def get_sms_counts_for_fixed_content(content, prefix):
+    """
+    Counts the characters in an SMS template with its placeholders taken
+    out. Each placeholder is swapped for a single stand-in character so
+    the text around it is normalised as if a value had been filled in.
+    """
+    literals, placeholders = compile_field(content, str)
+    normalised = normalise_sms_content(PLACEHOLDER_STAND_IN.join(literals), prefix)
+    encoded = sms_encode(normalised)
+    return sms_counts(
+        character_count=len(normalised) - len(placeholders),
+        extended_gsm_character_count=count_extended_gsm_chars(encoded),
+        non_gsm_characters=non_gsm_characters(encoded),
+    )
+
+
+def _can_be_counted_in_isolation(replacement):
+    # Empty values, values with whitespace at either end and values
+    # which start with punctuation can change how the text either side
+    # of them is normalised. Any other value is normalised the same
+    # whether it’s on its own or surrounded by the rest of the message.
+    return replacement and not whitespace_at_either_end_or_leading_punctuation.search(replacement)
+
+
 def get_sms_fragment_count(character_count, non_gsm_characters):
     if non_gsm_characters:
         return 1 if character_count <= 70 else math.ceil(float(character_count) / 67)
@@ -894,6 +1313,7 @@ def count_extended_gsm_chars(content):
     )
 
 
+@profiled('do_nice_typography')
 def do_nice_typography(value):
     return Take(
         value
@@ -0,0 +1,140 @@
+from hashlib import sha256
+from threading import Lock
+
+from cachetools import LRUCache
+
+from notifications_utils.version import __version__
+
+
+class TieredCache:
+    """
+    Caches the results of a function which takes a string and returns a
+    string. Results are kept in a size-bounded, in-process LRU cache and,
+    optionally, in Redis so that every process can share them.
+
+    Looking something up in Redis takes a round trip, which costs more
+    than most of the functions worth caching, so only `get_many` uses
+    Redis. It looks up every key that isn’t cached locally with an MGET
+    for each `REDIS_CHUNK_SIZE` keys, and stores the new results with a
+    pipeline.
+
+    Configure it with `init_app`, which reads `<config_prefix>_SIZE` and
+    `<config_prefix>_TTL` from the app’s config. Call `send_stats`
+    periodically to record the hit rates.
+    """
+
+    TTL = 7 * 24 * 60 * 60
+
+    # The most keys to get or set with each round trip to Redis
+    REDIS_CHUNK_SIZE = 1000
+
+    def __init__(self, function, name, config_prefix, maxsize=1024):
+        self.function = function
+        self.name = name
+        self.config_prefix = config_prefix
+        self.ttl = self.TTL
+        self.redis_client = None
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+    def init_app(self, app, redis_client=None):
+        with self._lock:
+            self._cache = LRUCache(maxsize=app.config.get(
+                '{}_SIZE'.format(self.config_prefix), self._cache.maxsize
+            ))
+        self.ttl = app.config.get('{}_TTL'.format(self.config_prefix), self.TTL)
+        self.redis_client = redis_client
+
+    def get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+            self.misses += 1
+
+        value = self.function(key)
+
+        with self._lock:
+            self._cache[key] = value
+
+        return value
+
+    def get_many(self, keys):
+        """
+        Returns a list of results, in the same order as `keys`
+        """
+        keys = list(keys)
+        unique_keys = dict.fromkeys(keys)
+
+        with self._lock:
+            values = {key: self._cache[key] for key in unique_keys if key in self._cache}
+            self.hits += len(values)
+
+        missing = [key for key in unique_keys if key not in values]
+
+        if missing:
+            new_values = self._get_many_from_redis_or_function(missing)
+            with self._lock:
+                self._cache.update(new_values)
+            values.update(new_values)
+
+        return [values[key] for key in keys]
+
+    def _get_many_from_redis_or_function(self, keys):
+        use_redis = self.redis_client is not None and self.redis_client.active
+        from_redis = {}
+
+        if use_redis:
+            redis_keys = [self.redis_key(key) for key in keys]
+            redis_values = self.redis_client.get_many(redis_keys, chunk_size=self.REDIS_CHUNK_SIZE)
+            for key, value in zip(keys, redis_values):
+                if value is not None:
+                    from_redis[key] = value.decode('utf-8')
+
+        from_function = {key: self.function(key) for key in keys if key not in from_redis}
+
+        if use_redis and from_function:
+            self.redis_client.set_many(
+                {self.redis_key(key): value for key, value in from_function.items()},
+                ex=self.ttl,
+                chunk_size=self.REDIS_CHUNK_SIZE,
+            )
+
+        with self._lock:
+            self.redis_hits += len(from_redis)
+            self.misses += len(from_function)
+
+        return {**from_redis, **from_function}
+
+    def redis_key(self, key):
+        # Keys are hashed so they’re a fixed length and don’t contain
+        # personal data. The version is part of the key so that results
+        # from an older version of this code aren’t reused.
+        return '{}-{}-{}'.format(self.name, __version__, sha256(key.encode('utf-8')).hexdigest())
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.redis_hits = 0
+            self.misses = 0
+
+    def send_stats(self, statsd_client):
+        """
+        Sends the number of hits in each tier and misses since the last
+        time this was called, and the current size of the local cache
+        """
+        with self._lock:
+            hits, redis_hits, misses = self.hits, self.redis_hits, self.misses
+            self.hits = self.redis_hits = self.misses = 0
+
+        statsd_client.incr('{}.hit'.format(self.name), count=hits)
+        statsd_client.incr('{}.redis-hit'.format(self.name), count=redis_hits)
+        statsd_client.incr('{}.miss'.format(self.name), count=misses)
+        statsd_client.gauge('{}.size'.format(self.name), len(self))
@@ -1 +1 @@
-__version__ = '43.8.1'
+__version__ = '43.32.0'
@@ -1,8 +1,9 @@
 from functools import partial
+from unittest.mock import Mock
 
 import pytest
 
-from notifications_utils.columns import Cell, Columns, Row
+from notifications_utils.columns import Cell, Columns, Row, RowValidator
 
 
 def test_columns_as_dict_with_keys():
@@ -72,3 +73,32 @@ def test_set_item(key_in, lookup_key):
     columns = Columns({})
     columns[key_in] = 'bar'
     assert columns[lookup_key] == 'bar'
+
+
+def test_row_validator_only_validates_each_value_once(mocker):
+    error_fn = Mock(side_effect=lambda key, value: None if value else Cell.missing_field_error)
+    mocker.patch.object(RowValidator, 'max_values_remembered', 2)
+    validator = RowValidator(
+        ['Name', 'name', 'phone number'],
+        error_fn=error_fn,
+        recipient_column_headers=['phone number'],
+        template=None,
+        allow_international_letters=False,
+    )
+
+    for name in ('Jo', 'Jo', None, 'Alex', 'Alex'):
+        validator.get_flags({'Name': 'ignored', 'name': name, 'phone number': '07700900460'})
+
+    # Only the last of the columns with the same key is checked, like
+    # `Row`, and once 2 values are remembered new ones are checked
+    # every time
+    assert [args for args, kwargs in error_fn.call_args_list if args[0] == 'name'] == [
+        ('name', 'Jo'), ('name', None), ('name', 'Alex'), ('name', 'Alex'),
+    ]
+    assert validator.get_flags({'Name': None, 'name': None, 'phone number': '07700900460'}) == {
+        'has_error': True,
+        'has_bad_recipient': False,
+        'has_missing_data': True,
+        'message_too_long': False,
+        'message_empty': False,
+    }
@@ -1,6 +1,6 @@
 import pytest
 
-from notifications_utils.field import Field, str2bool
+from notifications_utils.field import Field, compile_field, str2bool
 
 
 @pytest.mark.parametrize("content", [
@@ -310,3 +310,35 @@ def test_what_will_trigger_conditional_placeholder(value):
 def test_field_renders_lists_as_strings(values, expected, expected_as_markdown):
     assert str(Field("list: ((placeholder))", values, markdown_lists=True)) == expected_as_markdown
     assert str(Field("list: ((placeholder))", values)) == expected
+
+
+@pytest.mark.parametrize('content, expected_literals, expected_placeholders', (
+    ('', ('',), ()),
+    ('no placeholders', ('no placeholders',), ()),
+    ('((a))', ('', ''), ('a',)),
+    ('hello ((name)), ((show??yes)) bye', ('hello ', ', ', ' bye'), ('name', 'show??yes')),
+    ('((a))((b))', ('', '', ''), ('a', 'b')),
+    ('the (()) brown (((fox)))', ('the (()) brown (', ')'), ('fox',)),
+))
+def test_compile_field(content, expected_literals, expected_placeholders):
+    literals, placeholders = compile_field(content, str)
+    assert literals == expected_literals
+    assert tuple(placeholder.body for placeholder in placeholders) == expected_placeholders
+
+
+def test_compile_field_sanitises_content_first():
+    literals, placeholders = compile_field('<em>((name))</em>', Field('').sanitizer)
+    assert literals == ('', '')
+    assert placeholders[0].name == 'name'
+
+
+def test_field_only_finds_placeholders_once_for_the_same_content(mocker):
+    compile_field.cache_clear()
+    split_mock = mocker.patch.object(Field, 'placeholder_pattern', wraps=Field.placeholder_pattern)
+
+    for name in ('Jo', 'Chris', 'Alex'):
+        assert str(Field('hello ((name))((show?? and bye))', {'name': name, 'show': 'yes'})) == (
+            f'hello {name} and bye'
+        )
+
+    assert split_mock.split.call_count == 1
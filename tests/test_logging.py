@@ -1,6 +1,12 @@
+import io
 import json
 import logging as builtin_logging
 import logging.handlers as builtin_logging_handlers
+import sys
+from unittest.mock import Mock, call
+
+import pytest
+from flask import g
 
 from notifications_utils import logging
 
@@ -58,3 +64,239 @@ def test_base_json_formatter_contains_service_id(tmpdir):
     service_id_filter = logging.ServiceIdFilter()
     assert json.loads(logging.BaseJSONFormatter().format(record))['message'] == 'message to log'
     assert service_id_filter.filter(record).service_id == "no-service-id"
+
+
+def _get_queue_app(tmpdir, **config):
+    class App:
+        debug = False
+
+    App.config = dict({
+        'NOTIFY_LOG_PATH': str(tmpdir / 'foo'),
+        'NOTIFY_APP_NAME': 'bar',
+        'NOTIFY_LOG_LEVEL': 'INFO',
+        'NOTIFY_LOG_QUEUE_SIZE': 10,
+        'NOTIFY_LOG_QUEUE_FULL_POLICY': 'drop',
+    }, **config)
+    return App()
+
+
+def test_queue_handler_runs_filters_on_logging_thread_and_formats_on_listener(app, tmpdir):
+    stream = io.StringIO()
+    stream_handler = logging.configure_handler(
+        builtin_logging.StreamHandler(stream), _get_queue_app(tmpdir), logging.JSONFormatter(logging.LOG_FORMAT)
+    )
+    queue_handler = logging.get_queue_handler(_get_queue_app(tmpdir), [stream_handler])
+    logger = builtin_logging.getLogger('test_queue_handler')
+    logger.addHandler(queue_handler)
+
+    g.request_id = 'abc'
+    g.service_id = '123'
+    logger.warning('message to log')
+    queue_handler.close()
+    logger.removeHandler(queue_handler)
+
+    assert stream_handler.filters == []
+    assert [type(log_filter) for log_filter in queue_handler.filters] == [
+        logging.AppNameFilter, logging.RequestIdFilter, logging.ServiceIdFilter,
+    ]
+    log = json.loads(stream.getvalue())
+    assert log['message'] == 'message to log'
+    assert (log['application'], log['requestId'], log['service_id']) == ('bar', 'abc', '123')
+
+
+def test_queue_handler_drops_and_counts_records_when_queue_is_full():
+    queue_handler = logging.NotifyQueueHandler([], maxsize=1)
+    queue_handler.listener.stop()
+    queue_handler.listener = None
+    statsd_client = Mock()
+
+    for _ in range(3):
+        queue_handler.handle(builtin_logging.makeLogRecord({'msg': 'message to log', 'levelno': builtin_logging.INFO}))
+
+    queue_handler.send_stats(statsd_client)
+    queue_handler.send_stats(statsd_client)
+    queue_handler.close()
+
+    assert statsd_client.incr.call_args_list == [
+        call('logging.dropped-records', count=2),
+        call('logging.dropped-records', count=0),
+    ]
+
+
+def test_queue_handler_waits_for_space_when_queue_is_full():
+    target_handler = Mock(level=builtin_logging.NOTSET)
+    queue_handler = logging.NotifyQueueHandler([target_handler], maxsize=1, block=True)
+
+    for _ in range(100):
+        queue_handler.handle(builtin_logging.makeLogRecord({'msg': 'message to log', 'levelno': builtin_logging.INFO}))
+    queue_handler.close()
+
+    assert queue_handler.dropped == 0
+    assert target_handler.handle.call_count == 100
+
+
+def test_get_queue_handler_rejects_unknown_policy(tmpdir):
+    with pytest.raises(ValueError):
+        logging.get_queue_handler(_get_queue_app(tmpdir, NOTIFY_LOG_QUEUE_FULL_POLICY='retry'), [])
+
+
+def test_init_app_uses_queue_handler_if_configured(app, tmpdir):
+    app.config['NOTIFY_LOG_PATH'] = str(tmpdir / 'foo')
+    app.config['NOTIFY_LOG_QUEUE'] = True
+
+    logging.init_app(app)
+    queue_handler, = app.logger.handlers
+
+    assert isinstance(queue_handler, logging.NotifyQueueHandler)
+    assert [type(handler) for handler in queue_handler.handlers] == [
+        builtin_logging.StreamHandler, builtin_logging_handlers.WatchedFileHandler,
+    ]
+    for logger_instance in (app.logger, builtin_logging.getLogger('utils')):
+        logger_instance.removeHandler(queue_handler)
+    queue_handler.close()
+
+
+def test_init_app_closes_handlers_from_last_time(app, tmpdir):
+    app.config['NOTIFY_LOG_PATH'] = str(tmpdir / 'foo')
+    app.config['NOTIFY_LOG_QUEUE'] = True
+    utils_logger = builtin_logging.getLogger('utils')
+
+    logging.init_app(app)
+    first_queue_handler, = app.logger.handlers
+    logging.init_app(app)
+    queue_handler, = app.logger.handlers
+
+    assert first_queue_handler.listener is None
+    assert first_queue_handler not in logging._queue_handlers
+    assert first_queue_handler.handlers[1].stream is None
+    assert first_queue_handler not in utils_logger.handlers
+    assert queue_handler in utils_logger.handlers
+    assert app.teardown_appcontext_funcs == [logging.send_queue_stats]
+
+    logging.remove_handlers(app, [app.logger, utils_logger])
+    assert queue_handler.listener is None
+
+
+def test_queue_handler_starts_new_listener_after_fork():
+    queue_handler = logging.NotifyQueueHandler([])
+    parent_listener = queue_handler.listener
+
+    # What `os.register_at_fork` calls in the child process
+    logging._start_queue_handlers_after_fork()
+
+    assert queue_handler.listener is not parent_listener
+    queue_handler.close()
+    parent_listener.stop()
+
+
+def test_dropped_records_are_sent_when_app_context_ends(app):
+    statsd_client = Mock()
+    queue_handler = logging.NotifyQueueHandler([], statsd_client=statsd_client)
+    app.teardown_appcontext(logging.send_queue_stats)
+
+    with app.app_context():
+        pass
+    queue_handler.dropped = 2
+    with app.app_context():
+        pass
+    queue_handler.close()
+
+    statsd_client.incr.assert_called_once_with('logging.dropped-records', count=2)
+
+
+def _make_record(msg, exc_info=None, **extra):
+    record = builtin_logging.LogRecord(
+        name='log thing', level=builtin_logging.INFO, pathname='path', lineno=123, msg=msg, args=None,
+        exc_info=exc_info,
+    )
+    record.__dict__.update(dict({'app_name': 'api', 'request_id': 'abc', 'service_id': '123'}, **extra))
+    return record
+
+
+@pytest.mark.parametrize('record', [
+    _make_record('message to log'),
+    _make_record('message with {requestId} in'),
+    _make_record('message with {unknown} in'),
+    _make_record('ünicode “quotes”', extra_field={'a': 1}),
+    _make_record('message with a {} in it'),
+])
+def test_json_formatter_encodes_the_same_as_base_formatter(record):
+    formatter = logging.JSONFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+    log_record = json.loads(formatter.format(record))
+    assert formatter.jsonify_log_record(log_record) == logging.BaseJSONFormatter.jsonify_log_record(
+        formatter, log_record
+    )
+
+
+def test_json_formatter_logs_dictionary_messages():
+    formatter = logging.JSONFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+
+    log = json.loads(formatter.format(_make_record({'event': 'sent {thing}', 'count': 1})))
+
+    assert log['message'] is None
+    assert (log['event'], log['count']) == ('sent {thing}', 1)
+
+
+def test_json_formatter_uses_base_formatter_options():
+    formatter = logging.JSONFormatter(
+        logging.LOG_FORMAT, logging.TIME_FORMAT, rename_fields={'levelname': 'level'}, timestamp=True,
+    )
+
+    log = json.loads(formatter.format(_make_record('message to log')))
+
+    assert log['level'] == 'INFO'
+    assert 'levelname' not in log
+    assert 'timestamp' in log
+
+
+def test_json_formatter_output_schema():
+    formatter = logging.JSONFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+
+    log = json.loads(formatter.format(_make_record('request {requestId} for {service_id}', extra='value')))
+
+    assert list(log) == [
+        'name', 'levelname', 'message', 'pathname', 'lineno', 'extra',
+        'time', 'requestId', 'application', 'service_id', 'logType',
+    ]
+    assert log['message'] == 'request abc for 123'
+    assert (log['application'], log['logType']) == ('api', 'application')
+
+
+def test_json_formatter_includes_exception():
+    formatter = logging.JSONFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+    try:
+        raise ValueError('oops')
+    except ValueError:
+        record = _make_record('failed', exc_info=sys.exc_info())
+
+    log = json.loads(formatter.format(record))
+
+    assert 'ValueError: oops' in log['exc_info']
+    assert list(log)[5] == 'exc_info'
+
+
+def test_messages_without_braces_are_not_formatted_again(mocker):
+    mock_has_braces = mocker.patch.object(logging, '_has_braces', return_value=False)
+    formatter = logging.JSONFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+
+    assert json.loads(formatter.format(_make_record('message to log')))['message'] == 'message to log'
+    mock_has_braces.assert_called_once_with('message to log')
+
+
+def test_formatters_only_format_the_time_once_a_second(mocker):
+    mock_strftime = mocker.patch('time.strftime', return_value='2020-01-01T00:00:00')
+    formatter = logging.CustomLogFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+
+    for created in (1600000000.1, 1600000000.9, 1600000001.0):
+        record = _make_record('message to log')
+        record.created = created
+        formatter.format(record)
+
+    assert mock_strftime.call_count == 2
+
+
+def test_custom_log_formatter_formats_message_with_fields():
+    formatter = logging.CustomLogFormatter(logging.LOG_FORMAT, logging.TIME_FORMAT)
+
+    assert '"message for 123"' in formatter.format(_make_record('message for {service_id}'))
+    assert '"message with {unknown}"' in formatter.format(_make_record('message with {unknown}'))
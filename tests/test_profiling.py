@@ -0,0 +1,143 @@
+from unittest.mock import Mock, call
+
+import pytest
+
+from notifications_utils import profiling
+from notifications_utils.profiling import profile, profiled, span
+from notifications_utils.recipients import RecipientCSV
+from notifications_utils.template import HTMLEmailTemplate, SMSMessageTemplate
+
+
+@pytest.fixture
+def mocked_monotonic(mocker):
+    return mocker.patch('notifications_utils.profiling.monotonic', side_effect=range(100))
+
+
+@profiled('outer')
+def outer():
+    inner()
+    with span('inner'):
+        pass
+
+
+@profiled('inner')
+def inner():
+    pass
+
+
+def test_spans_are_nested_in_report(mocked_monotonic):
+    with profile('job') as report:
+        outer()
+
+    assert report.spans == {
+        ('job',): [1, 7],
+        ('job', 'outer'): [1, 5],
+        ('job', 'outer', 'inner'): [2, 2],
+    }
+    assert report.elapsed_time == 7
+    assert report.totals == {'job': [1, 7], 'outer': [1, 5], 'inner': [2, 2]}
+
+
+def test_spans_arent_recorded_outside_profile(mocked_monotonic):
+    outer()
+    with span('inner'):
+        pass
+    assert mocked_monotonic.call_count == 0
+
+
+def test_span_is_ended_if_function_raises(mocked_monotonic):
+
+    @profiled('fails')
+    def fails():
+        raise ValueError
+
+    with profile('job') as report:
+        with pytest.raises(ValueError):
+            fails()
+
+    assert report.spans[('job', 'fails')] == [1, 1]
+    assert profiling._current_report.get() is None
+
+
+def test_collapsed_stacks_use_time_not_in_nested_spans(mocked_monotonic):
+    with profile('job') as report:
+        outer()
+
+    assert report.collapsed_stacks() == '\n'.join([
+        'job 2000000',
+        'job;outer 3000000',
+        'job;outer;inner 2000000',
+    ])
+
+
+def test_send_stats(mocked_monotonic):
+    statsd_client = Mock()
+    with profile('job') as report:
+        outer()
+
+    report.send_stats(statsd_client)
+
+    assert sorted(statsd_client.timing.call_args_list) == [
+        call('profiling.inner', 2),
+        call('profiling.job', 7),
+        call('profiling.outer', 5),
+    ]
+
+
+def test_log(mocked_monotonic):
+    logger = Mock()
+    with profile('job') as report:
+        inner()
+
+    report.log(logger)
+
+    message = logger.info.call_args[0][0]
+    assert message.startswith('Profile of job:\njob ')
+    assert '\n  inner ' in message
+
+
+def test_rendering_and_validation_stages_are_profiled():
+    with profile('job') as report:
+        str(HTMLEmailTemplate(
+            {'content': '# Hello ((name))', 'subject': 'Hi ((name))', 'template_type': 'email'},
+            {'name': 'Jo'},
+        ))
+        RecipientCSV(
+            'phone number,name\n07700900001,Jo',
+            template=SMSMessageTemplate({'content': 'Hello ((name))', 'template_type': 'sms'}),
+        ).has_errors
+
+    assert set(report.totals) >= {
+        'job',
+        'jinja.render',
+        'notify_email_markdown',
+        'do_nice_typography',
+        'Field.replaced',
+        'RecipientCSV.has_errors',
+    }
+
+
+def test_init_app_profiles_each_request(app, mocker):
+    app.config['PROFILING_ENABLED'] = True
+    app.statsd_client = Mock()
+    mock_logger = mocker.patch('flask.Flask.logger')
+    profiling.init_app(app)
+
+    @app.route('/profiled')
+    def profiled_view():
+        inner()
+        return 'ok'
+
+    response = app.test_client().get('/profiled')
+
+    assert response.status_code == 200
+    assert mock_logger.info.call_args[0][0].startswith('Profile of profiled_view:')
+    assert {args[0] for args, kwargs in app.statsd_client.timing.call_args_list} == {
+        'profiling.profiled_view', 'profiling.inner',
+    }
+    assert profiling._current_report.get() is None
+
+
+def test_init_app_does_nothing_unless_enabled(app):
+    profiling.init_app(app)
+    assert not app.before_request_funcs
@@ -1,3 +1,4 @@
+import csv
 import itertools
 import string
 import unicodedata
@@ -9,10 +10,12 @@ import pytest
 from orderedset import OrderedSet
 
 from notifications_utils import SMS_CHAR_COUNT_LIMIT
+from notifications_utils.columns import ColumnarRows
 from notifications_utils.countries import Country
 from notifications_utils.recipients import (
     Cell,
     RecipientCSV,
+    RecipientWhitelist,
     Row,
     first_column_headings,
 )
@@ -842,6 +845,18 @@ def test_recipient_whitelist(file_contents, template_type, whitelist, count_of_r
     assert recipients.allowed_to_send_to
 
 
+def test_recipient_whitelist_can_be_reused():
+    whitelist = RecipientWhitelist(['07700900460', 'test@example.com'])
+
+    for file_contents, allowed_to_send_to in (
+        ('phone number\n07700 900460', True),
+        ('phone number\n07700 900461', False),
+    ):
+        recipients = RecipientCSV(file_contents, template=_sample_template('sms'), whitelist=whitelist)
+        assert recipients.whitelist is whitelist
+        assert recipients.allowed_to_send_to is allowed_to_send_to
+
+
 def test_detects_rows_which_result_in_overly_long_messages():
     template = SMSMessageTemplate(
         {'content': '((placeholder))', 'template_type': 'sms'},
@@ -1269,3 +1284,255 @@ def test_email_validation_speed():
     )
     for row in recipients:
         assert not row.has_error
+
+
+@pytest.mark.parametrize('file_contents, template_type, whitelist', (
+    (
+        """
+            phone number, name
+            07700900460, Jo
+            07700900461,
+            12345, Chris
+            , Alex
+        """,
+        'sms',
+        None,
+    ),
+    (
+        """
+            email address, name
+            a@b.com, Jo
+            not an email, Chris
+            a@b.com,
+            c@d.com, Alex
+        """,
+        'email',
+        ['a@b.com'],
+    ),
+    (
+        """
+            address line 1, address line 2, address line 3, name
+            First Lastname, 123 Example St, SW1A 1AA, Jo
+            First Lastname, 123 Example St, Fiji, Chris
+            First Lastname, , , Alex
+        """,
+        'letter',
+        None,
+    ),
+    (
+        """
+            phone number, name, Name, phone_number, name
+            07700900460, Jo, Jo, 07700900461, Jo
+            07700900461,,,, Chris
+            12345, Chris,
+            , Alex, , , , , extra, cells
+        """,
+        'sms',
+        ['07700900460', '07700900461'],
+    ),
+))
+@pytest.mark.parametrize('mode', (
+    {'streaming': True},
+    {'columnar': True},
+    {'max_workers': 2},
+))
+def test_alternative_modes_give_same_results_as_materialising_rows(
+    file_contents, template_type, whitelist, mode,
+):
+    recipients, streamed_recipients = (
+        RecipientCSV(
+            file_contents,
+            template=_sample_template(template_type, 'hello ((name))'),
+            whitelist=whitelist,
+            max_errors_shown=2,
+            max_initial_rows_shown=3,
+            **kwargs
+        )
+        for kwargs in ({}, mode)
+    )
+
+    assert len(streamed_recipients) == len(recipients)
+    assert streamed_recipients.has_errors == recipients.has_errors
+    assert streamed_recipients.allowed_to_send_to == recipients.allowed_to_send_to
+    for attr in (
+        'initial_rows',
+        'initial_rows_with_errors',
+        'displayed_rows',
+    ):
+        assert _index_rows(getattr(streamed_recipients, attr)) == _index_rows(getattr(recipients, attr))
+    for attr in (
+        'count_of_rows_with_errors',
+        'count_of_rows_with_bad_recipients',
+        'count_of_rows_with_missing_data',
+        'count_of_rows_with_message_too_long',
+        'count_of_rows_with_empty_message',
+    ):
+        assert getattr(streamed_recipients, attr) == getattr(recipients, attr)
+
+
+def test_streaming_keeps_only_the_rows_it_needs_to_display():
+    recipients = RecipientCSV(
+        "phone number\n" + ("07700900460\n" * 50) + ("12345\n" * 50),
+        template=_sample_template('sms'),
+        max_errors_shown=5,
+        max_initial_rows_shown=3,
+        streaming=True,
+    )
+
+    assert recipients.has_errors
+    assert len(recipients) == 100
+    assert recipients.count_of_rows_with_bad_recipients == 50
+    assert _index_rows(recipients.initial_rows) == {0, 1, 2}
+    assert _index_rows(recipients.initial_rows_with_errors) == {50, 51, 52, 53, 54}
+    assert recipients.rows_as_list is None
+
+
+def test_streaming_only_makes_rows_it_keeps(mocker):
+    mock_row = mocker.patch('notifications_utils.recipients.Row', wraps=Row)
+
+    recipients = RecipientCSV(
+        "phone number\n" + ("07700900460\n" * 50) + ("12345\n" * 50),
+        template=_sample_template('sms'),
+        max_errors_shown=5,
+        max_initial_rows_shown=3,
+        streaming=True,
+    )
+
+    assert recipients.count_of_rows_with_errors == 50
+    assert mock_row.call_count == 3 + 5
+
+
+def test_streaming_only_parses_the_file_once(mocker):
+    reader_mock = mocker.patch('notifications_utils.recipients.csv.reader', wraps=csv.reader)
+
+    recipients = RecipientCSV(
+        """
+            phone number, name
+            07700900460, Jo
+            07700900461, Chris
+        """,
+        template=_sample_template('sms', 'hello ((name))'),
+        streaming=True,
+    )
+
+    assert not recipients.has_errors
+    assert list(recipients.column_headers) == ['phone number', 'name']
+    assert reader_mock.call_count == 1
+
+
+def test_columnar_rows_are_the_same_as_materialised_rows():
+    file_contents = """
+        phone number, name, Name, phone_number, name
+        07700900460, Jo, Jo, 07700900461, Jo
+        07700900461,,,, Chris
+        12345, Chris,
+        , Alex, , , , , extra, cells
+    """
+    recipients = RecipientCSV(file_contents, template=_sample_template('sms', 'hello ((name))'))
+    columnar_recipients = RecipientCSV(
+        file_contents,
+        template=_sample_template('sms', 'hello ((name))'),
+        columnar=True,
+    )
+
+    assert len(columnar_recipients.rows) == len(recipients.rows) == 4
+    assert list(columnar_recipients.rows) == list(recipients.rows)
+    assert columnar_recipients[-1] == recipients[-1]
+    assert columnar_recipients.rows[1:3] == recipients.rows[1:3]
+    for attr in (
+        'rows_with_errors',
+        'rows_with_bad_recipients',
+        'rows_with_missing_data',
+    ):
+        assert _index_rows(getattr(columnar_recipients, attr)) == _index_rows(getattr(recipients, attr))
+
+
+def test_columnar_rows_are_only_created_when_asked_for(mocker):
+    row_mock = mocker.patch('notifications_utils.columns.Row')
+    row_mock.check_message.return_value = (False, False)
+
+    recipients = RecipientCSV(
+        "phone number, name\n" + ("07700900460, Jo\n" * 100),
+        template=_sample_template('sms', 'hello ((name))'),
+        columnar=True,
+    )
+
+    assert len(recipients) == 100
+    assert not recipients.has_errors
+    assert row_mock.call_count == 0
+
+    recipients[50]
+    assert row_mock.call_count == 1
+    assert row_mock.call_args[1]['index'] == 50
+
+
+def test_columnar_validates_each_value_once_per_column(mocker):
+    validate_recipient_mock = mocker.patch(
+        'notifications_utils.recipients.validate_recipient',
+    )
+
+    recipients = RecipientCSV(
+        "phone number\n" + ("07700900460\n" * 50) + ("07700900461\n" * 50),
+        template=_sample_template('sms'),
+        columnar=True,
+    )
+
+    assert not recipients.has_errors
+    assert validate_recipient_mock.call_count == 2
+
+
+def test_columnar_stops_keeping_rows_after_max_rows(mocker):
+    mocker.patch.object(RecipientCSV, 'max_rows', 2)
+
+    recipients = RecipientCSV(
+        "phone number\n" + ("07700900460\n" * 3),
+        template=_sample_template('sms'),
+        columnar=True,
+    )
+
+    assert len(recipients) == 3
+    assert recipients.too_many_rows
+    assert recipients[1]['phone number'].data == '07700900460'
+    assert recipients[2] is None
+
+
+@pytest.mark.parametrize('template_type, file_contents', (
+    (
+        'letter',
+        'address line 1, address line 2, address line 3\n' + (
+            'First Lastname, 123 Example St, SW1A 1AA\n'
+            'First Lastname, 123 Example St, Fiji\n'
+            'First Lastname, 123 Example St,\n'
+        ) * 5,
+    ),
+    (
+        'sms',
+        'phone number, name\n' + (
+            '07700900460, Jo\n'
+            '07700900460, ' + ('x' * (SMS_CHAR_COUNT_LIMIT + 1)) + '\n'
+            '07700900460,\n'
+        ) * 5,
+    ),
+))
+def test_validating_in_parallel_keeps_rows_in_order(mocker, template_type, file_contents):
+    mocker.patch.object(ColumnarRows, 'chunk_size', 2)
+
+    serial, parallel = (
+        RecipientCSV(
+            file_contents,
+            template=_sample_template(template_type, '((name))'),
+            max_workers=max_workers,
+        )
+        for max_workers in (1, 2)
+    )
+
+    assert parallel.columnar is True
+    for attr in (
+        'rows_with_errors',
+        'rows_with_bad_recipients',
+        'rows_with_missing_data',
+        'rows_with_message_too_long',
+        'rows_with_empty_message',
+    ):
+        assert _index_rows(getattr(parallel, attr)) == _index_rows(getattr(serial, attr))
+    assert parallel.has_errors == serial.has_errors
@@ -2,20 +2,28 @@ from functools import partial
 
 import pytest
 
+from notifications_utils.international_billing_rates import COUNTRY_PREFIXES
 from notifications_utils.recipients import (
     InvalidEmailError,
     InvalidPhoneError,
+    RecipientWhitelist,
     allowed_to_send_to,
     format_phone_number_human_readable,
     format_recipient,
+    format_recipients,
     get_international_phone_info,
+    get_international_prefix,
     international_phone_info,
     is_uk_phone_number,
+    is_valid_hostname,
     normalise_phone_number,
+    recipient_cache,
     try_validate_and_format_phone_number,
     validate_and_format_phone_number,
     validate_email_address,
+    validate_email_addresses,
     validate_phone_number,
+    validate_phone_numbers,
     validate_recipient,
 )
 
@@ -225,6 +233,8 @@ def test_get_international_info(phone_number, expected_info):
 @pytest.mark.parametrize('phone_number', [
     'abcd',
     '079OO900123',
+    '07123²456789',
+    '07123\u2003456789',
     pytest.param('', marks=pytest.mark.xfail),
     pytest.param('12345', marks=pytest.mark.xfail),
     pytest.param('+12345', marks=pytest.mark.xfail),
@@ -237,6 +247,27 @@ def test_normalise_phone_number_raises_if_unparseable_characters(phone_number):
         normalise_phone_number(phone_number)
 
 
+@pytest.mark.parametrize('phone_number', [
+    prefix + suffix
+    for prefix in COUNTRY_PREFIXES
+    for suffix in ('', '0', '1234567890')
+] + ['', '0', '21', '999', '8012347890'])
+def test_get_international_prefix_finds_the_longest_matching_prefix(phone_number):
+    assert get_international_prefix(phone_number) == next(
+        (prefix for prefix in COUNTRY_PREFIXES if phone_number.startswith(prefix)),
+        None
+    )
+
+
+@pytest.mark.parametrize('phone_number, expected_normalised_number', [
+    ('+44 (0)7123\u200B456\t789', '4407123456789'),
+    ('\u00A007123-456-789\n', '7123456789'),
+    ('', ''),
+])
+def test_normalise_phone_number(phone_number, expected_normalised_number):
+    assert normalise_phone_number(phone_number) == expected_normalised_number
+
+
 @pytest.mark.parametrize('phone_number', [
     '+21 4321 0987',
     '00997 1234 7890',
@@ -354,6 +385,32 @@ def test_validates_against_whitelist_of_email_addresses(email_address):
     assert not allowed_to_send_to(email_address, ['very_special_and_unique@example.com'])
 
 
+@pytest.mark.parametrize("recipient", [*valid_uk_phone_numbers, *valid_email_addresses, "not a recipient"])
+def test_recipient_whitelist_matches_list_of_recipients(recipient):
+    recipients = ['07123456789', 'Email@Example.com', ' not a recipient ', 'test@example.com']
+    whitelist = RecipientWhitelist(recipients)
+    assert (recipient in whitelist) == allowed_to_send_to(recipient, recipients)
+    assert allowed_to_send_to(recipient, whitelist) == allowed_to_send_to(recipient, recipients)
+
+
+def test_recipient_whitelist_only_formats_its_recipients_once(mocker):
+    whitelist = RecipientWhitelist(['07700900460', 'test@example.com'])
+    format_recipient = mocker.patch(
+        'notifications_utils.recipients.format_recipient',
+        side_effect=lambda recipient: recipient,
+    )
+
+    assert 'test@example.com' in whitelist
+    assert '07700900461' not in whitelist
+
+    assert format_recipient.call_args_list == [
+        mocker.call('test@example.com'),
+        mocker.call('07700900461'),
+    ]
+    assert list(whitelist) == ['07700900460', 'test@example.com']
+    assert len(whitelist) == 2
+
+
 @pytest.mark.parametrize("phone_number, expected_formatted", [
     ('07900900123', '07900 900123'),  # UK
     ('+44(0)7900900123', '07900 900123'),  # UK
@@ -385,9 +442,129 @@ def test_format_recipient(recipient, expected_formatted):
     assert format_recipient(recipient) == expected_formatted
 
 
+def test_format_recipients():
+    recipients = [True, None, 'foo', 'TeSt@ExAmPl3.com', '+4407900 900 123', 'foo', '+1 800 555 5555']
+    assert format_recipients(iter(recipients)) == [format_recipient(recipient) for recipient in recipients]
+
+
+def test_format_recipients_shares_formatted_recipients_with_redis(mocker):
+    redis_client = mocker.Mock(active=True)
+    redis_client.get_many.side_effect = lambda keys, chunk_size: [b'formatted elsewhere', None]
+    mocker.patch.object(recipient_cache, 'redis_client', redis_client)
+    recipient_cache.clear()
+
+    assert format_recipients(['a@b.com', 'C@D.COM']) == ['formatted elsewhere', 'c@d.com']
+
+    redis_client.set_many.assert_called_once_with(
+        {recipient_cache.redis_key('C@D.COM'): 'c@d.com'}, ex=recipient_cache.ttl, chunk_size=1000,
+    )
+    recipient_cache.clear()
+
+
 def test_try_format_recipient_doesnt_throw():
     assert try_validate_and_format_phone_number('ALPHANUM3R1C') == 'ALPHANUM3R1C'
 
 
 def test_format_phone_number_human_readable_doenst_throw():
     assert format_phone_number_human_readable('ALPHANUM3R1C') == 'ALPHANUM3R1C'
+
+
+@pytest.mark.parametrize('international', (True, False))
+def test_validate_phone_numbers_matches_validating_one_at_a_time(international):
+    phone_numbers = valid_phone_numbers + [number for number, _ in invalid_phone_numbers]
+
+    results = validate_phone_numbers(iter(phone_numbers), international=international)
+
+    for index, phone_number in enumerate(phone_numbers):
+        try:
+            expected_number, expected_error = validate_phone_number(phone_number, international=international), None
+        except InvalidPhoneError as error:
+            expected_number, expected_error = None, str(error)
+        assert results.phone_numbers[index] == expected_number
+        assert results.errors[index] == expected_error
+        if expected_number:
+            info = get_international_phone_info(expected_number)
+            assert results.country_prefixes[index] == info.country_prefix
+            assert results.billable_units[index] == info.billable_units
+        else:
+            assert results.country_prefixes[index] is None
+            assert results.billable_units[index] == 0
+
+
+def test_validate_phone_numbers_returns_lists_in_order():
+    assert validate_phone_numbers(['+20 1212341234', 'abc', '07700 900123'], international=True) == (
+        ['201212341234', None, '447700900123'],
+        [None, 'Must not contain letters or symbols', None],
+        ['20', None, '44'],
+        [3, 0, 1],
+    )
+
+
+@pytest.mark.parametrize('phone_number', (None, 7700900123, ['07700900123']))
+def test_validate_phone_numbers_gives_error_for_items_which_arent_strings(phone_number):
+    assert validate_phone_numbers([phone_number, '07700 900123']) == (
+        [None, '447700900123'],
+        ['Not enough digits', None],
+        [None, '44'],
+        [0, 1],
+    )
+
+
+def test_validate_email_addresses_matches_validating_one_at_a_time():
+    email_addresses = valid_email_addresses + invalid_email_addresses
+
+    results = validate_email_addresses(iter(email_addresses))
+
+    for index, email_address in enumerate(email_addresses):
+        try:
+            expected_email_address, expected_error = validate_email_address(email_address), None
+        except InvalidEmailError as error:
+            expected_email_address, expected_error = None, str(error)
+        assert results.email_addresses[index] == expected_email_address
+        assert results.errors[index] == expected_error
+
+
+def test_validate_email_addresses_returns_lists_in_order():
+    assert validate_email_addresses([' jo@example.com ', 'jo@example', 'jo@例え.テスト']) == (
+        ['jo@example.com', None, 'jo@例え.テスト'],
+        [None, 'Not a valid email address', None],
+    )
+
+
+@pytest.mark.parametrize('email_address', (None, 1, ['jo@example.com']))
+def test_validate_email_addresses_gives_error_for_items_which_arent_strings(email_address):
+    assert validate_email_addresses([email_address, 'jo@example.com']) == (
+        [None, 'jo@example.com'],
+        ['Not a valid email address', None],
+    )
+
+
+def test_validate_email_address_checks_each_hostname_once():
+    is_valid_hostname.cache_clear()
+
+    validate_email_addresses(['jo@例え.テスト', 'alex@例え.テスト', 'chris@example.com', 'jo@example.com'])
+
+    assert is_valid_hostname.cache_info().misses == 2
+    assert is_valid_hostname.cache_info().hits == 2
+
+
+@pytest.mark.parametrize('hostname, expected_valid', (
+    ('example.com', True),
+    ('EXAMPLE.COM', True),
+    ('xn--r8jz45g.xn--zckzah', True),
+    ('例え.テスト', True),
+    ('{}.com'.format('a' * 63), True),
+    ('{}.com'.format('a' * 64), False),
+    ('example.{}'.format('a' * 63), True),
+    ('example.{}'.format('a' * 64), False),
+    ('{}.com'.format('.'.join(['abcdefghi'] * 25)), True),
+    ('{}.com'.format('.'.join(['abcdefghi'] * 26)), False),
+    ('example', False),
+    ('example.com.', False),
+    ('-example.com', False),
+    ('example-.com', False),
+    ('example.c', False),
+    ('example.123', False),
+))
+def test_is_valid_hostname(hostname, expected_valid):
+    assert is_valid_hostname(hostname) is expected_valid
@@ -1,3 +1,4 @@
+import math
 import uuid
 from datetime import datetime
 from unittest.mock import Mock, call
@@ -11,6 +12,7 @@ from notifications_utils.clients.redis import (
 )
 from notifications_utils.clients.redis.redis_client import (
     RedisClient,
+    deleted_keys,
     prepare_value,
 )
 
@@ -130,6 +132,202 @@ def test_should_call_get_if_enabled(mocked_redis_client):
     mocked_redis_client.redis_store.get.assert_called_with('key')
 
 
+def test_get_many(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.return_value = [[b'1', None]]
+
+    assert mocked_redis_client.get_many(['a', uuid.UUID(int=0)]) == [b'1', None]
+
+    mocked_redis_client.redis_store.pipeline.assert_called_once_with(transaction=False)
+    mocked_redis_pipeline.mget.assert_called_once_with(['a', '00000000-0000-0000-0000-000000000000'])
+
+
+def test_get_many_in_chunks(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.side_effect = [[[b'1', b'2']], [[b'3', None]], [[b'5']]]
+
+    assert mocked_redis_client.get_many('abcde', chunk_size=2) == [b'1', b'2', b'3', None, b'5']
+
+    assert mocked_redis_pipeline.mget.call_args_list == [call(['a', 'b']), call(['c', 'd']), call(['e'])]
+    assert mocked_redis_pipeline.execute.call_count == 3
+
+
+@pytest.mark.parametrize('method, args', (
+    ('get_many', (['a', 'b'],)),
+    ('incr_many', (['a', 'b'],)),
+    ('increment_hash_values', ([('a', 'x'), ('b', 'y')],)),
+))
+def test_batch_methods_return_none_for_each_key_if_not_enabled(mocked_redis_client, method, args):
+    mocked_redis_client.active = False
+    assert getattr(mocked_redis_client, method)(*args) == [None, None]
+    mocked_redis_client.redis_store.pipeline.assert_not_called()
+
+
+@pytest.mark.parametrize('method', ('get_many', 'incr_many', 'increment_hash_values', 'set_many'))
+def test_batch_methods_dont_call_redis_with_nothing_to_do(mocked_redis_client, method):
+    assert getattr(mocked_redis_client, method)({}) in ([], None)
+    mocked_redis_client.redis_store.pipeline.assert_not_called()
+
+
+def test_set_many(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_client.set_many({'a': 1, uuid.UUID(int=0): 'b'}, ex=100)
+    mocked_redis_client.redis_store.pipeline.assert_called_once_with(transaction=False)
+    assert mocked_redis_pipeline.set.call_args_list == [
+        call('a', 1, ex=100),
+        call('00000000-0000-0000-0000-000000000000', 'b', ex=100),
+    ]
+    mocked_redis_pipeline.execute.assert_called_once_with()
+
+
+def test_set_many_with_expiry_for_each_key(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.return_value = [True, True]
+    mocked_redis_client.set_many(
+        {'a': 1, uuid.UUID(int=0): 2, 'c': 3},
+        ex={'a': 10, uuid.UUID(int=0): 20},
+        chunk_size=2,
+    )
+    assert mocked_redis_pipeline.set.call_args_list == [
+        call('a', 1, ex=10),
+        call('00000000-0000-0000-0000-000000000000', 2, ex=20),
+        call('c', 3, ex=None),
+    ]
+    assert mocked_redis_pipeline.execute.call_count == 2
+
+
+def test_set_many_doesnt_call_redis_if_not_enabled(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_client.active = False
+    mocked_redis_client.set_many({'a': 1})
+    mocked_redis_client.redis_store.pipeline.assert_not_called()
+
+
+def test_incr_many(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.side_effect = [[1, 5], [2]]
+
+    assert mocked_redis_client.incr_many(['a', uuid.UUID(int=0), 'a'], chunk_size=2) == [1, 5, 2]
+
+    assert mocked_redis_pipeline.incr.call_args_list == [
+        call('a'), call('00000000-0000-0000-0000-000000000000'), call('a'),
+    ]
+
+
+def test_increment_hash_values(mocked_redis_client, mocked_redis_pipeline):
+    mocked_redis_pipeline.execute.return_value = [3, 1]
+
+    assert mocked_redis_client.increment_hash_values(
+        iter([('12345', 'template-1111'), (uuid.UUID(int=0), 'template-2222')]),
+        incr_by=2,
+    ) == [3, 1]
+
+    mocked_redis_client.redis_store.pipeline.assert_called_once_with(transaction=False)
+    assert mocked_redis_pipeline.hincrby.call_args_list == [
+        call('12345', 'template-1111', 2),
+        call('00000000-0000-0000-0000-000000000000', 'template-2222', 2),
+    ]
+
+
+def test_batch_methods_log_errors(mocked_redis_client, mocked_redis_pipeline, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_pipeline.execute.side_effect = Exception()
+
+    assert mocked_redis_client.get_many(['a', 'b']) == [None, None]
+    assert mocked_redis_client.set_many({'a': 1, 'b': 2}) is None
+    assert mocked_redis_client.incr_many(['a', 'b']) == [None, None]
+    assert mocked_redis_client.increment_hash_values([('a', 'x'), ('b', 'y')]) == [None, None]
+    assert mock_logger.mock_calls == [
+        call.exception('Redis error performing get_many on a, b'),
+        call.exception('Redis error performing set_many on a, b'),
+        call.exception('Redis error performing incr_many on a, b'),
+        call.exception('Redis error performing increment_hash_values on a, b'),
+    ]
+
+
+def test_batch_methods_stop_at_the_first_chunk_with_an_error(mocked_redis_client, mocked_redis_pipeline, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_pipeline.execute.side_effect = [[1, 1], Exception(), [1, 1]]
+
+    assert mocked_redis_client.incr_many('abcdef', chunk_size=2) == [None] * 6
+
+    assert mocked_redis_pipeline.execute.call_count == 2
+    assert mock_logger.mock_calls == [call.exception('Redis error performing incr_many on c, d')]
+
+
+@pytest.mark.parametrize('method, args', (
+    ('get_many', (['a'],)),
+    ('set_many', ({'a': 1},)),
+    ('incr_many', (['a'],)),
+    ('increment_hash_values', ([('a', 'x')],)),
+))
+def test_batch_methods_raise_exception_if_raise_set_to_true(mocked_redis_client, mocked_redis_pipeline, method, args):
+    mocked_redis_pipeline.execute.side_effect = Exception('pipeline failed')
+    with pytest.raises(Exception) as e:
+        getattr(mocked_redis_client, method)(*args, raise_exception=True)
+    assert str(e.value) == 'pipeline failed'
+
+
+def test_acquire_lock_sets_random_token(mocked_redis_client):
+    mocked_redis_client.redis_store.set.return_value = True
+
+    token = mocked_redis_client.acquire_lock('lock-key', 2000)
+
+    assert len(token) == 32
+    mocked_redis_client.redis_store.set.assert_called_once_with('lock-key', token, px=2000, nx=True)
+    assert mocked_redis_client.acquire_lock('lock-key', 2000) != token
+
+
+def test_acquire_lock_returns_none_if_lock_is_held(mocked_redis_client):
+    mocked_redis_client.redis_store.set.return_value = None
+    assert mocked_redis_client.acquire_lock('lock-key', 2000) is None
+
+
+def test_acquire_lock_returns_token_if_not_enabled(mocked_redis_client):
+    mocked_redis_client.active = False
+    assert mocked_redis_client.acquire_lock('lock-key', 2000) is not None
+    mocked_redis_client.redis_store.set.assert_not_called()
+
+
+def test_acquire_lock_returns_token_if_redis_errors(mocked_redis_client, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_client.redis_store.set.side_effect = Exception('set failed')
+
+    assert mocked_redis_client.acquire_lock('lock-key', 2000) is not None
+    mock_logger.exception.assert_called_once_with('Redis error performing acquire_lock on lock-key')
+
+    with pytest.raises(Exception) as e:
+        mocked_redis_client.acquire_lock('lock-key', 2000, raise_exception=True)
+    assert str(e.value) == 'set failed'
+
+
+@pytest.mark.parametrize('script_result, expected_result', (
+    (1, True),
+    (0, False),
+))
+def test_release_lock(mocked_redis_client, mocker, script_result, expected_result):
+    mocked_redis_client.scripts = {'release-lock': mocker.Mock(return_value=script_result)}
+
+    assert mocked_redis_client.release_lock('lock-key', 'token') is expected_result
+
+    mocked_redis_client.scripts['release-lock'].assert_called_once_with(keys=['lock-key'], args=['token'])
+
+
+def test_release_lock_does_nothing_if_not_enabled(mocked_redis_client, mocker):
+    mocked_redis_client.active = False
+    mocked_redis_client.scripts = {'release-lock': mocker.Mock()}
+
+    assert mocked_redis_client.release_lock('lock-key', 'token') is False
+
+    assert mocked_redis_client.scripts['release-lock'].called is False
+
+
+def test_release_lock_logs_if_redis_errors(mocked_redis_client, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_client.scripts = {'release-lock': mocker.Mock(side_effect=Exception('script failed'))}
+
+    assert mocked_redis_client.release_lock('lock-key', 'token') is False
+    mock_logger.exception.assert_called_once_with('Redis error performing release_lock on lock-key')
+
+    with pytest.raises(Exception) as e:
+        mocked_redis_client.release_lock('lock-key', 'token', raise_exception=True)
+    assert str(e.value) == 'script failed'
+
+
 def test_should_build_cache_key_service_and_action(sample_service):
     with freeze_time("2016-01-01 12:00:00.000000"):
         assert daily_limit_cache_key(sample_service.id) == '{}-2016-01-01-count'.format(sample_service.id)
@@ -213,6 +411,141 @@ def test_should_not_call_rate_limit_if_not_enabled(mocked_redis_client, mocked_r
     assert not mocked_redis_client.redis_store.pipeline.called
 
 
+@pytest.mark.parametrize('algorithm, script_name', (
+    ('gcra', 'gcra-rate-limit'),
+    ('sliding-window', 'sliding-window-rate-limit'),
+))
+@pytest.mark.parametrize('script_result, expected_result', (
+    (0, False),
+    (1, True),
+))
+@freeze_time("2001-01-01 12:00:00.000000")
+def test_exceeded_scripted_rate_limit(
+    mocked_redis_client, algorithm, script_name, script_result, expected_result,
+):
+    mocked_redis_client.scripts = {script_name: Mock(return_value=script_result)}
+
+    assert mocked_redis_client.exceeded_scripted_rate_limit(
+        uuid.UUID(int=0), 100, 60, algorithm=algorithm,
+    ) is expected_result
+
+    mocked_redis_client.scripts[script_name].assert_called_once_with(
+        keys=['00000000-0000-0000-0000-000000000000'],
+        args=[100, 60, 978350400.0],
+    )
+
+
+def test_exceeded_scripted_rate_limit_defaults_to_gcra(mocked_redis_client):
+    mocked_redis_client.scripts = {'gcra-rate-limit': Mock(return_value=1)}
+    assert mocked_redis_client.exceeded_scripted_rate_limit('key', 100, 60) is True
+
+
+def test_exceeded_scripted_rate_limit_rejects_unknown_algorithm(mocked_redis_client):
+    with pytest.raises(ValueError) as e:
+        mocked_redis_client.exceeded_scripted_rate_limit('key', 100, 60, algorithm='leaky-bucket')
+    assert str(e.value) == 'algorithm must be one of gcra, sliding-window'
+
+
+def test_exceeded_scripted_rate_limit_allows_request_if_not_enabled(mocked_redis_client):
+    mocked_redis_client.active = False
+    mocked_redis_client.scripts = {'gcra-rate-limit': Mock()}
+    assert mocked_redis_client.exceeded_scripted_rate_limit('key', 100, 60) is False
+    assert mocked_redis_client.scripts['gcra-rate-limit'].called is False
+
+
+def test_exceeded_scripted_rate_limit_allows_request_if_script_fails(mocked_redis_client, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_client.scripts = {'sliding-window-rate-limit': Mock(side_effect=Exception('script failed'))}
+
+    assert mocked_redis_client.exceeded_scripted_rate_limit('key', 100, 60, algorithm='sliding-window') is False
+    mock_logger.exception.assert_called_once_with('Redis error performing sliding-window-rate-limit on key')
+
+    with pytest.raises(Exception) as e:
+        mocked_redis_client.exceeded_scripted_rate_limit(
+            'key', 100, 60, algorithm='sliding-window', raise_exception=True,
+        )
+    assert str(e.value) == 'script failed'
+
+
+def test_register_scripts_registers_rate_limit_scripts(mocked_redis_client, mocker):
+    mocked_redis_client.scripts = {}
+    mocker.patch.object(mocked_redis_client.redis_store, 'register_script', side_effect=lambda script: script)
+
+    mocked_redis_client.register_scripts()
+
+    assert "redis.call('hmset', KEYS[1]" in mocked_redis_client.scripts['gcra-rate-limit']
+    assert "redis.call('hmset', KEYS[1]" in mocked_redis_client.scripts['sliding-window-rate-limit']
+
+
+def _run_lua_script(script, keys, args, store):
+    # Runs a script the way Redis would, against a dictionary instead of
+    # a Redis server. Only implements the commands the scripts use.
+    lupa = pytest.importorskip('lupa')
+    lua = getattr(lupa, 'lua51', lupa).LuaRuntime()
+
+    def call(command, key, *command_args):
+        if command == 'get':
+            return store.get(key, False)
+        if command == 'del':
+            return int(store.pop(key, None) is not None)
+        if command == 'hmget':
+            return lua.table(*[store.get(key, {}).get(field, False) for field in command_args])
+        if command == 'hmset':
+            store.setdefault(key, {}).update(zip(command_args[0::2], command_args[1::2]))
+            return 'OK'
+        if command == 'pexpire':
+            assert command_args[0] >= 1
+            return 1
+        raise ValueError(command)
+
+    return lua.eval('function(KEYS, ARGV, redis) {} end'.format(script))(
+        lua.table(*keys), lua.table(*map(str, args)), lua.table(call=call),
+    )
+
+
+@pytest.mark.parametrize('interval', [1, 60, 3600])
+@pytest.mark.parametrize('limit', [1, 3, 6, 7, 10, 49, 100, 3000])
+def test_gcra_script_allows_a_burst_of_exactly_limit_requests(mocked_redis_client, mocker, limit, interval):
+    mocked_redis_client.scripts = {}
+    mocker.patch.object(mocked_redis_client.redis_store, 'register_script', side_effect=lambda script: script)
+    mocked_redis_client.register_scripts()
+    script = mocked_redis_client.scripts['gcra-rate-limit']
+    store = {}
+    now = 1_600_000_000.1234565
+
+    assert [
+        _run_lua_script(script, ['key'], [limit, interval, now], store) for _ in range(limit + 1)
+    ] == [0] * limit + [1]
+
+    # After a burst requests are spaced out evenly. Half a microsecond
+    # is added so the times don’t depend on how floats are rounded.
+    spacing = math.ceil(interval * 1_000_000 / limit) / 1_000_000
+    assert _run_lua_script(script, ['key'], [limit, interval, now + spacing - 0.0000015], store) == 1
+    assert _run_lua_script(script, ['key'], [limit, interval, now + spacing + 0.0000005], store) == 0
+
+    # A whole interval after that the whole burst is allowed again
+    assert [
+        _run_lua_script(script, ['key'], [limit, interval, now + spacing + interval + 0.0000005], store)
+        for _ in range(limit + 1)
+    ] == [0] * limit + [1]
+
+
+def test_release_lock_script_only_deletes_lock_with_matching_token(mocked_redis_client, mocker):
+    mocked_redis_client.scripts = {}
+    mocker.patch.object(mocked_redis_client.redis_store, 'register_script', side_effect=lambda script: script)
+    mocked_redis_client.register_scripts()
+    script = mocked_redis_client.scripts['release-lock']
+    store = {'lock-key': 'token-from-another-process'}
+
+    assert _run_lua_script(script, ['lock-key'], ['expired-token'], store) == 0
+    assert store == {'lock-key': 'token-from-another-process'}
+
+    assert _run_lua_script(script, ['lock-key'], ['token-from-another-process'], store) == 1
+    assert store == {}
+
+    assert _run_lua_script(script, ['lock-key'], ['token-from-another-process'], store) == 0
+
+
 def test_expire(mocked_redis_client):
     key = 'hash-key'
     mocked_redis_client.expire(key, 1)
@@ -262,3 +595,73 @@ def test_delete_cache_keys_returns_zero_when_redis_disabled(mocked_redis_client)
 
     assert delete_mock.called is False
     assert ret == 0
+
+
+@pytest.fixture
+def mocked_scan(mocked_redis_client, mocked_redis_pipeline, mocker):
+    mocker.patch.object(mocked_redis_client.redis_store, 'scan', return_value=(5, [b'a', b'b']))
+    mocked_redis_pipeline.execute.side_effect = [
+        [2, (9, [])],
+        [(0, [b'c'])],
+        [1],
+    ]
+    return mocked_redis_client.redis_store.scan
+
+
+def test_scan_and_delete_cache_keys(mocked_redis_client, mocked_redis_pipeline, mocked_scan, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+
+    result = mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo-*', count=2)
+
+    assert result.count == 3
+    assert result.seconds >= 0
+    mocked_scan.assert_called_once_with(0, match='foo-*', count=2)
+    mocked_redis_client.redis_store.pipeline.assert_called_with(transaction=False)
+    assert mocked_redis_pipeline.mock_calls == [
+        call.unlink(b'a', b'b'),
+        call.scan(5, match='foo-*', count=2),
+        call.execute(),
+        call.scan(9, match='foo-*', count=2),
+        call.execute(),
+        call.unlink(b'c'),
+        call.execute(),
+    ]
+    mock_logger.info.assert_called_once_with(
+        'Deleted 3 keys matching foo-* in {:.3f} seconds'.format(result.seconds)
+    )
+
+
+def test_scan_and_delete_cache_keys_when_nothing_matches(mocked_redis_client, mocked_redis_pipeline, mocker):
+    mocker.patch.object(mocked_redis_client.redis_store, 'scan', return_value=(0, []))
+
+    assert mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo-*').count == 0
+    mocked_redis_client.redis_store.pipeline.assert_not_called()
+
+
+def test_scan_and_delete_cache_keys_in_background(mocked_redis_client, mocked_scan, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+
+    thread = mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo-*', in_background=True)
+    thread.join()
+
+    assert mock_logger.info.call_args[0][0].startswith('Deleted 3 keys matching foo-* in ')
+
+
+def test_scan_and_delete_cache_keys_logs_errors(mocked_redis_client, mocked_scan, mocked_redis_pipeline, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocked_redis_pipeline.execute.side_effect = [[2, (9, [])], Exception('scan failed')]
+
+    assert mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo-*').count == 2
+    mock_logger.exception.assert_called_once_with('Redis error performing scan-and-delete on foo-*')
+
+    mocked_redis_pipeline.execute.side_effect = Exception('scan failed')
+    with pytest.raises(Exception) as e:
+        mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo-*', raise_exception=True)
+    assert str(e.value) == 'scan failed'
+
+
+def test_scan_and_delete_cache_keys_does_nothing_when_redis_disabled(mocked_redis_client, mocked_scan):
+    mocked_redis_client.active = False
+
+    assert mocked_redis_client.scan_and_delete_cache_keys_by_pattern('foo') == deleted_keys(0, 0.0)
+    assert mocked_scan.called is False
@@ -0,0 +1,188 @@
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from freezegun import freeze_time
+
+from notifications_utils.render_cache import RenderCache
+from notifications_utils.template import (
+    HTMLEmailTemplate,
+    LetterPreviewTemplate,
+    PlainTextEmailTemplate,
+    SMSMessageTemplate,
+)
+
+
+def test_get_or_render_only_renders_once_per_key():
+    cache = RenderCache()
+    render = mock.Mock(return_value='rendered')
+
+    assert cache.get_or_render(('a', 1), render) == 'rendered'
+    assert cache.get_or_render(('a', 1), render) == 'rendered'
+    assert cache.get_or_render(('a', 2), render) == 'rendered'
+
+    assert render.call_count == 2
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 2)
+
+
+def test_least_recently_used_key_is_evicted():
+    cache = RenderCache(maxsize=2)
+
+    cache.get_or_render('a', lambda: 'A')
+    cache.get_or_render('b', lambda: 'B')
+    cache.get_or_render('a', lambda: 'A')
+    cache.get_or_render('c', lambda: 'C')
+
+    assert len(cache) == 2
+    assert cache.get_or_render('a', lambda: 'new A') == 'A'
+    assert cache.get_or_render('b', lambda: 'new B') == 'new B'
+
+
+def test_unhashable_keys_arent_cached():
+    cache = RenderCache()
+
+    assert cache.get_or_render(('a', {}), lambda: 'A') == 'A'
+    assert cache.get_or_render(('a', {}), lambda: 'new A') == 'new A'
+    assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+
+def test_send_stats_sends_counts_since_last_sent():
+    cache = RenderCache()
+    statsd_client = mock.Mock()
+
+    for key in 'aab':
+        cache.get_or_render(key, str)
+
+    cache.send_stats(statsd_client)
+    cache.send_stats(statsd_client, stat='email-cache')
+
+    assert statsd_client.mock_calls == [
+        mock.call.incr('render-cache.hit', count=1),
+        mock.call.incr('render-cache.miss', count=2),
+        mock.call.gauge('render-cache.size', 2),
+        mock.call.incr('email-cache.hit', count=0),
+        mock.call.incr('email-cache.miss', count=0),
+        mock.call.gauge('email-cache.size', 2),
+    ]
+
+
+def test_templates_without_a_render_cache_dont_use_one():
+    with mock.patch.object(RenderCache, 'get_or_render') as get_or_render:
+        str(SMSMessageTemplate({'content': 'hello', 'template_type': 'sms'}))
+    assert get_or_render.called is False
+
+
+@pytest.mark.parametrize('template_class, template, extra_args, attributes', (
+    (
+        SMSMessageTemplate,
+        {'content': 'Your code is ((code))', 'template_type': 'sms', 'id': 1, 'version': 2},
+        {'prefix': 'Service'},
+        ('__str__',),
+    ),
+    (
+        HTMLEmailTemplate,
+        {'content': '# Your code is ((code))', 'subject': 'Code ((code))', 'template_type': 'email'},
+        {'brand_name': 'Brand'},
+        ('__str__', 'subject', 'html_body', 'preheader'),
+    ),
+    (
+        PlainTextEmailTemplate,
+        {'content': 'Your code is ((code))', 'subject': 'Code', 'template_type': 'email'},
+        {},
+        ('__str__', 'subject'),
+    ),
+    (
+        LetterPreviewTemplate,
+        {'content': 'Your code is ((code))', 'subject': 'Code', 'template_type': 'letter'},
+        {'contact_block': 'Contact us', 'date': datetime(2012, 12, 12)},
+        ('__str__', 'subject'),
+    ),
+))
+def test_templates_render_the_same_with_a_render_cache(template_class, template, extra_args, attributes):
+
+    def render(template, attribute):
+        if attribute == '__str__':
+            return str(template)
+        return getattr(template, attribute)
+
+    cached_template = template_class(template, **extra_args)
+    cached_template.render_cache = RenderCache()
+
+    for code in ('1234', '5678', '1234'):
+        misses = cached_template.render_cache.misses
+        uncached_template = template_class(template, {'code': code}, **extra_args)
+        cached_template.values = {'code': code}
+        for attribute in attributes:
+            assert render(cached_template, attribute) == render(uncached_template, attribute)
+
+    # Nothing new needed rendering the second time round
+    assert cached_template.render_cache.misses == misses
+
+
+def test_render_cache_can_be_shared_by_a_template_class(mocker):
+    mocker.patch.object(SMSMessageTemplate, 'render_cache', RenderCache())
+
+    for _ in range(3):
+        assert str(SMSMessageTemplate({'content': 'hello', 'template_type': 'sms'})) == 'hello'
+
+    assert (SMSMessageTemplate.render_cache.hits, SMSMessageTemplate.render_cache.misses) == (2, 1)
+
+
+@pytest.mark.parametrize('first_values, second_values', (
+    ({'code': 1}, {'code': True}),
+    ({'code': 1}, {'code': '1'}),
+    ({'code': ['a', 'b']}, {'code': ['a', 'b', 'c']}),
+    ({'code': ['a', 'b']}, {'code': ('a', 'b')}),
+    ({'code': 'a'}, {}),
+))
+def test_render_cache_key_distinguishes_between_values(first_values, second_values):
+    cache = RenderCache()
+    template = SMSMessageTemplate({'content': 'code ((code))', 'template_type': 'sms'})
+    template.render_cache = cache
+
+    template.values = first_values
+    str(template)
+    template.values = second_values
+    str(template)
+
+    assert cache.misses == 2
+
+
+@pytest.mark.parametrize('change', (
+    lambda template: setattr(template, 'prefix', 'Service'),
+    lambda template: setattr(template, 'show_prefix', False),
+    lambda template: setattr(template, 'content', 'different'),
+    lambda template: setattr(template, 'id', 'different'),
+    lambda template: template._template.update(version=2),
+))
+def test_render_cache_key_includes_render_options(change):
+    cache = RenderCache()
+    template = SMSMessageTemplate({'content': 'hello', 'template_type': 'sms', 'version': 1}, prefix='Prefix')
+    template.render_cache = cache
+
+    before = str(template)
+    change(template)
+
+    assert cache.misses == 1
+    assert str(template) == str(SMSMessageTemplate(
+        dict(template._template, content=template.content),
+        prefix=template.prefix,
+        show_prefix=template.show_prefix,
+    ))
+    assert cache.misses == 2
+    assert before == 'Prefix: hello'
+
+
+def test_letters_made_without_a_date_share_a_render_cache(mocker):
+    mocker.patch.object(LetterPreviewTemplate, 'render_cache', RenderCache())
+    template = {'content': 'hello', 'subject': 'subject', 'template_type': 'letter'}
+
+    with freeze_time('2020-01-01 12:00:00'):
+        first = str(LetterPreviewTemplate(template))
+    with freeze_time('2020-01-01 12:00:01'):
+        assert str(LetterPreviewTemplate(template)) == first
+    with freeze_time('2020-01-02 12:00:00'):
+        assert '2 January 2020' in str(LetterPreviewTemplate(template))
+
+    # The subject is cached separately, but only looked up on a miss
+    assert (LetterPreviewTemplate.render_cache.hits, LetterPreviewTemplate.render_cache.misses) == (1, 4)
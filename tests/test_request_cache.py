@@ -1,3 +1,6 @@
+from threading import Event, Thread
+from unittest.mock import call
+
 import pytest
 
 from notifications_utils.clients.redis import RequestCache
@@ -125,3 +128,276 @@ def test_deletes_from_cache_even_if_call_raises(mocker, mocked_redis_client):
         foo()
 
     mock_redis_delete.assert_called_once_with('bar')
+
+
+@pytest.fixture
+def mocked_monotonic(mocker):
+    return mocker.patch('notifications_utils.clients.redis.monotonic', return_value=1000)
+
+
+@pytest.fixture
+def mocked_redis_get(mocker, mocked_redis_client):
+    return mocker.patch.object(mocked_redis_client, 'get', return_value=None)
+
+
+@pytest.fixture
+def mocked_redis_set(mocker, mocked_redis_client):
+    return mocker.patch.object(mocked_redis_client, 'set')
+
+
+def test_local_cache_returns_decoded_response_without_calling_redis(
+    mocked_redis_client, mocked_redis_get, mocked_redis_set, mocked_monotonic,
+):
+    cache = RequestCache(mocked_redis_client, local_ttl=5)
+    mocked_redis_get.return_value = b'{"bar": "baz"}'
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    assert foo(1) == {'bar': 'baz'}
+    mocked_monotonic.return_value = 1004.9
+    assert foo(1) == {'bar': 'baz'}
+    assert foo(a=1) is foo(1)
+
+    mocked_redis_get.assert_called_once_with('1')
+
+    mocked_monotonic.return_value = 1005
+    mocked_redis_get.return_value = b'"changed"'
+    assert foo(1) == 'changed'
+    assert mocked_redis_get.call_count == 2
+
+
+def test_local_cache_stores_responses_from_client_method(
+    mocked_redis_client, mocked_redis_get, mocked_redis_set, mocked_monotonic,
+):
+    cache = RequestCache(mocked_redis_client, local_ttl=5)
+
+    @cache.set('{a}')
+    def foo(a):
+        return {'a': a}
+
+    assert foo(1) == foo(1) == {'a': 1}
+    assert foo(2) == {'a': 2}
+
+    assert mocked_redis_get.call_args_list == [call('1'), call('2')]
+    mocked_redis_set.assert_any_call('1', '{"a": 1}', ex=604_800)
+
+
+def test_local_cache_is_size_bounded(mocked_redis_client, mocked_redis_get, mocked_redis_set):
+    cache = RequestCache(mocked_redis_client, local_ttl=5, local_maxsize=2)
+
+    @cache.set('{a}')
+    def foo(a):
+        return a
+
+    for a in (1, 2, 3, 1):
+        foo(a)
+
+    assert len(cache.local_cache) == 2
+    assert mocked_redis_get.call_count == 4
+
+
+def test_delete_removes_response_from_local_cache(
+    mocker, mocked_redis_client, mocked_redis_get, mocked_redis_set,
+):
+    mocker.patch.object(mocked_redis_client, 'delete')
+    cache = RequestCache(mocked_redis_client, local_ttl=5)
+
+    @cache.set('{a}')
+    def get_foo(a):
+        return 'bar'
+
+    @cache.delete('{a}')
+    def update_foo(a):
+        pass
+
+    get_foo(1)
+    get_foo(2)
+    update_foo(1)
+
+    assert list(cache.local_cache) == ['2']
+    get_foo(1)
+    assert mocked_redis_get.call_count == 3
+
+
+def test_only_one_thread_refreshes_a_response(mocked_redis_client, mocked_redis_get, mocked_redis_set):
+    cache = RequestCache(mocked_redis_client, local_ttl=5)
+    client_method_called = Event()
+    finish_client_method = Event()
+    calls = []
+
+    @cache.set('{a}')
+    def foo(a):
+        calls.append(a)
+        client_method_called.set()
+        finish_client_method.wait(timeout=5)
+        return 'bar'
+
+    results = []
+    threads = [Thread(target=lambda: results.append(foo(1))) for _ in range(5)]
+    threads[0].start()
+    client_method_called.wait(timeout=5)
+    for thread in threads[1:]:
+        thread.start()
+    finish_client_method.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == ['bar'] * 5
+    assert calls == [1]
+    mocked_redis_get.assert_called_once_with('1')
+
+
+@pytest.mark.parametrize('age, refresh_in_progress, expected_response, expected_redis_calls', (
+    (6, True, 'stale', 0),
+    (6, False, 'fresh', 1),
+    (9.9, True, 'stale', 0),
+    (9.9, False, 'fresh', 1),
+))
+def test_stale_response_is_returned_while_another_thread_refreshes_it(
+    mocked_redis_client,
+    mocked_redis_get,
+    mocked_monotonic,
+    age,
+    refresh_in_progress,
+    expected_response,
+    expected_redis_calls,
+):
+    cache = RequestCache(mocked_redis_client, local_ttl=5, stale_ttl=5)
+    cache.local_cache['1'] = ('stale', 1000)
+    mocked_monotonic.return_value = 1000 + age
+    mocked_redis_get.return_value = b'"fresh"'
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    if refresh_in_progress:
+        cache._refresh_locks[hash('1') % len(cache._refresh_locks)].acquire()
+
+    assert foo(1) == expected_response
+    assert mocked_redis_get.call_count == expected_redis_calls
+
+
+@pytest.mark.parametrize('age, expected_local_cache_result', (
+    (4.9, ('response', True)),
+    (5, ('response', False)),
+    (9.9, ('response', False)),
+    (10, (None, False)),
+))
+def test_get_from_local_cache(mocked_redis_client, mocked_monotonic, age, expected_local_cache_result):
+    cache = RequestCache(mocked_redis_client, local_ttl=5, stale_ttl=5)
+    cache.local_cache['1'] = ('response', 1000)
+    mocked_monotonic.return_value = 1000 + age
+
+    assert cache._get_from_local_cache('1') == expected_local_cache_result
+    assert cache._get_from_local_cache('2') == (None, False)
+
+
+def test_redis_lock_is_taken_while_calling_client_method(
+    mocker, mocked_redis_client, mocked_redis_get, mocked_redis_set,
+):
+    acquire_lock = mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value='token')
+    release_lock = mocker.patch.object(mocked_redis_client, 'release_lock')
+    cache = RequestCache(mocked_redis_client, lock_timeout=2)
+
+    @cache.set('{a}')
+    def foo(a):
+        assert release_lock.called is False
+        return 'bar'
+
+    assert foo(1) == 'bar'
+
+    acquire_lock.assert_called_once_with('1-lock', 2000)
+    mocked_redis_set.assert_called_once_with('1', '"bar"', ex=604_800)
+    release_lock.assert_called_once_with('1-lock', 'token')
+
+
+def test_redis_lock_is_released_if_client_method_raises(mocker, mocked_redis_client, mocked_redis_get):
+    mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value='token')
+    release_lock = mocker.patch.object(mocked_redis_client, 'release_lock')
+    cache = RequestCache(mocked_redis_client, lock_timeout=2)
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        foo(1)
+
+    release_lock.assert_called_once_with('1-lock', 'token')
+
+
+def test_waits_for_process_holding_redis_lock(mocker, mocked_redis_client, mocked_redis_get):
+    mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value=None)
+    release_lock = mocker.patch.object(mocked_redis_client, 'release_lock')
+    mock_sleep = mocker.patch('notifications_utils.clients.redis.sleep')
+    mocked_redis_get.side_effect = [None, None, None, b'"from another process"']
+    cache = RequestCache(mocked_redis_client, lock_timeout=2)
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    assert foo(1) == 'from another process'
+    assert mock_sleep.call_args_list == [call(0.05)] * 3
+    assert release_lock.called is False
+
+
+def test_calls_client_method_if_process_holding_redis_lock_takes_too_long(
+    mocker, mocked_redis_client, mocked_redis_get, mocked_redis_set, mocked_monotonic,
+):
+    mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value=None)
+    release_lock = mocker.patch.object(mocked_redis_client, 'release_lock')
+    mocker.patch('notifications_utils.clients.redis.sleep')
+    mocked_monotonic.side_effect = [1000, 1001, 1002]
+    cache = RequestCache(mocked_redis_client, lock_timeout=2)
+
+    @cache.set('{a}')
+    def foo(a):
+        return 'bar'
+
+    assert foo(1) == 'bar'
+    assert mocked_redis_get.call_count == 2
+    mocked_redis_set.assert_called_once_with('1', '"bar"', ex=604_800)
+    # The lock belongs to the other process
+    assert release_lock.called is False
+
+
+def test_returns_stale_response_while_another_process_holds_redis_lock(
+    mocker, mocked_redis_client, mocked_redis_get, mocked_monotonic,
+):
+    mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value=None)
+    cache = RequestCache(mocked_redis_client, local_ttl=5, stale_ttl=5, lock_timeout=2)
+    cache.local_cache['1'] = ('stale', 1000)
+    mocked_monotonic.return_value = 1006
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    assert foo(1) == 'stale'
+    mocked_redis_get.assert_called_once_with('1')
+    # Still stored at the same time, so it doesn’t become fresh again
+    assert cache.local_cache['1'] == ('stale', 1000)
+
+
+def test_stale_response_is_replaced_once_another_process_puts_new_one_in_redis(
+    mocker, mocked_redis_client, mocked_redis_get, mocked_monotonic,
+):
+    mocker.patch.object(mocked_redis_client, 'acquire_lock', return_value=None)
+    cache = RequestCache(mocked_redis_client, local_ttl=10, stale_ttl=10, lock_timeout=2)
+    cache.local_cache['1'] = ('stale', 1000)
+
+    @cache.set('{a}')
+    def foo(a):
+        raise RuntimeError
+
+    mocked_monotonic.return_value = 1015
+    assert foo(1) == 'stale'
+
+    mocked_redis_get.return_value = b'"new"'
+    mocked_monotonic.return_value = 1016
+    assert foo(1) == 'new'
+    assert cache.local_cache['1'] == ('new', 1016)
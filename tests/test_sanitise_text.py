@@ -1,6 +1,7 @@
 import pytest
 
 from notifications_utils.sanitise_text import (
+    EncodingTable,
     SanitiseASCII,
     SanitiseSMS,
     SanitiseText,
@@ -94,3 +95,34 @@ def test_encode_string(content, expected):
 ])
 def test_sms_encoding_get_non_compatible_characters(content, cls, expected):
     assert cls.get_non_compatible_characters(content) == expected
+
+
+@pytest.mark.parametrize('cls', [SanitiseSMS, SanitiseASCII])
+def test_encode_matches_encoding_each_character_for_whole_basic_multilingual_plane(cls):
+    every_character, expected = '😬🚀', '??'
+    for character in map(chr, range(0x10000)):
+        try:
+            expected += cls.encode_char(character)
+            every_character += character
+        except ValueError:
+            # Some characters decompose to codepoints outside the basic
+            # multilingual plane, which we can’t downgrade
+            continue
+    assert cls.encode(every_character) == expected
+
+
+def test_encoding_tables_are_separate_for_each_class():
+    assert SanitiseSMS.encode('à€') == 'à€'
+    assert SanitiseASCII.encode('à€') == 'a?'
+    assert SanitiseSMS.get_encoding_table() is not SanitiseASCII.get_encoding_table()
+
+
+def test_encoding_table_stops_remembering_characters_when_full(mocker):
+    # The table is only created the first time it’s needed, so it might
+    # not exist yet if this test runs on its own
+    mocker.patch.object(
+        SanitiseSMS, '_encoding_table', EncodingTable(SanitiseSMS.encode_char, max_size=2), create=True,
+    )
+
+    assert SanitiseSMS.encode('abcdç') == 'abcdc'
+    assert SanitiseSMS.get_encoding_table() == {ord('a'): 'a', ord('b'): 'b'}
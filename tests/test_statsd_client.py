@@ -1,9 +1,15 @@
+import random
+import time
 from datetime import datetime, timedelta
-from unittest.mock import Mock, patch
+from threading import Thread
+from unittest.mock import Mock, call, patch
 
 import pytest
 
+from notifications_utils.clients.statsd import statsd_client
+from notifications_utils.clients.statsd.histogram import Histogram
 from notifications_utils.clients.statsd.statsd_client import (
+    BufferedNotifyStatsClient,
     NotifyStatsClient,
     StatsdClient,
 )
@@ -149,3 +155,238 @@ def test_should_cache_none_if_dns_fails(app, mocker):
     with patch.object(stats_client, '_resolve') as mock_dns_lookup:
         assert stats_client._cached_host() is None
         assert mock_dns_lookup.called is False
+
+
+@pytest.fixture
+def buffered_stats_client(app, mocker):
+    stats_client = BufferedNotifyStatsClient('localhost', 8125, 'prefix', app=app, flush_interval=3600)
+    mocker.patch.object(stats_client, '_send')
+    yield stats_client
+    stats_client.close()
+
+
+def test_buffered_client_is_used_if_configured(app):
+    app.config['STATSD_ENABLED'] = True
+    app.config['STATSD_BUFFERED'] = True
+    client = StatsdClient()
+    client.init_app(app)
+
+    assert isinstance(client.statsd_client, BufferedNotifyStatsClient)
+    client.statsd_client.close()
+
+
+def test_buffered_client_adds_up_counters(buffered_stats_client):
+    for _ in range(3):
+        buffered_stats_client.incr('a')
+    buffered_stats_client.incr('b', 2)
+    buffered_stats_client.decr('b')
+
+    assert buffered_stats_client._send.called is False
+    buffered_stats_client.flush()
+
+    buffered_stats_client._send.assert_called_once_with('prefix.a:3|c\nprefix.b:1|c')
+
+
+def test_buffered_client_doesnt_add_up_sampled_counters(buffered_stats_client, mocker):
+    mocker.patch('random.random', return_value=0)
+
+    buffered_stats_client.incr('a', rate=0.5)
+    buffered_stats_client.incr('a', rate=0.5)
+    buffered_stats_client.flush()
+
+    buffered_stats_client._send.assert_called_once_with('prefix.a:1|c|@0.5\nprefix.a:1|c|@0.5')
+
+
+def test_buffered_client_buffers_timings_and_gauges(buffered_stats_client):
+    buffered_stats_client.timing('a', 1000)
+    buffered_stats_client.gauge('b', 5)
+    buffered_stats_client.incr('c')
+    buffered_stats_client.flush()
+    buffered_stats_client.flush()
+
+    buffered_stats_client._send.assert_called_once_with('prefix.c:1|c\nprefix.a:1000.000000|ms\nprefix.b:5|g')
+
+
+def test_buffered_client_packs_lines_into_datagrams(buffered_stats_client):
+    buffered_stats_client._max_datagram_size = 40
+    for stat in ('a', 'b', 'c', 'd', 'e'):
+        buffered_stats_client.incr(stat, 1000)
+
+    buffered_stats_client.flush()
+
+    # Each line is 15 bytes, so only 2 fit with the newline between them
+    assert buffered_stats_client._send.call_args_list == [
+        call('prefix.a:1000|c\nprefix.b:1000|c'),
+        call('prefix.c:1000|c\nprefix.d:1000|c'),
+        call('prefix.e:1000|c'),
+    ]
+    assert all(len(args[0]) <= 40 for args, _ in buffered_stats_client._send.call_args_list)
+
+
+def test_buffered_client_sends_when_theres_more_than_a_datagram(buffered_stats_client):
+    buffered_stats_client._max_datagram_size = 40
+
+    buffered_stats_client.timing('a', 1)
+    buffered_stats_client.incr('b')
+    assert buffered_stats_client._send.called is False
+
+    buffered_stats_client.timing('c', 1)
+    assert buffered_stats_client._send.call_args_list == [
+        call('prefix.b:1|c\nprefix.a:1.000000|ms'),
+        call('prefix.c:1.000000|ms'),
+    ]
+
+
+def test_buffered_client_flushes_every_interval(app, mocker):
+    stats_client = BufferedNotifyStatsClient('localhost', 8125, 'prefix', app=app, flush_interval=0.01)
+    mocker.patch.object(stats_client, '_send')
+
+    stats_client.incr('a')
+
+    for _ in range(100):
+        if stats_client._send.called:
+            break
+        time.sleep(0.01)
+
+    stats_client._send.assert_called_once_with('prefix.a:1|c')
+    stats_client.close()
+
+
+def test_buffered_client_flushes_and_stops_when_closed(buffered_stats_client):
+    buffered_stats_client.incr('a')
+    buffered_stats_client.close()
+
+    buffered_stats_client._send.assert_called_once_with('prefix.a:1|c')
+    buffered_stats_client._flusher.join(timeout=1)
+    assert not buffered_stats_client._flusher.is_alive()
+
+
+def test_buffered_client_logs_send_errors_from_background_thread(buffered_stats_client, mocker):
+    mock_logger = mocker.patch('flask.Flask.logger')
+    mocker.patch.object(buffered_stats_client, '_send', wraps=NotifyStatsClient._send.__get__(buffered_stats_client))
+    mocker.patch.object(buffered_stats_client, '_cached_host', return_value='1.2.3.4')
+    mocker.patch.object(buffered_stats_client, '_sock')
+    buffered_stats_client._sock.sendto.side_effect = Exception('Mock Exception')
+
+    buffered_stats_client.incr('a')
+    flush_thread = Thread(target=buffered_stats_client.flush)
+    flush_thread.start()
+    flush_thread.join()
+
+    mock_logger.warning.assert_called_once_with('Error sending statsd metric: Mock Exception')
+
+
+def test_buffered_client_starts_again_with_an_empty_buffer_after_fork(buffered_stats_client):
+    buffered_stats_client.incr('a')
+    parent_flusher, parent_closed = buffered_stats_client._flusher, buffered_stats_client._closed
+
+    # What `os.register_at_fork` calls in the child process
+    statsd_client._start_buffered_clients_after_fork()
+
+    assert buffered_stats_client._counters == {}
+    assert buffered_stats_client._flusher is not parent_flusher
+    assert buffered_stats_client._flusher.is_alive()
+    parent_closed.set()
+
+
+def test_closed_buffered_clients_are_not_started_after_fork(buffered_stats_client, mocker):
+    mock_start = mocker.patch.object(buffered_stats_client, '_start')
+    buffered_stats_client.close()
+
+    statsd_client._start_buffered_clients_after_fork()
+    statsd_client._close_buffered_clients()
+
+    assert buffered_stats_client not in statsd_client._buffered_clients
+    assert mock_start.called is False
+
+
+def test_buffered_client_is_closed_when_replaced(app):
+    app.config['STATSD_ENABLED'] = True
+    app.config['STATSD_BUFFERED'] = True
+    client = StatsdClient()
+    client.init_app(app)
+    first_buffered_client = client.statsd_client
+
+    client.init_app(app)
+
+    first_buffered_client._flusher.join(timeout=1)
+    assert not first_buffered_client._flusher.is_alive()
+    assert first_buffered_client not in statsd_client._buffered_clients
+    assert client.statsd_client in statsd_client._buffered_clients
+    client.statsd_client.close()
+
+
+@pytest.mark.parametrize('percentile', [1, 50, 95, 99, 100])
+def test_histogram_percentiles_are_accurate(percentile):
+    generator = random.Random(1)
+    values = sorted(generator.lognormvariate(3, 2) for _ in range(10_000))
+    histogram = Histogram()
+    for value in values:
+        histogram.add(value)
+
+    expected = values[max(int(len(values) * percentile / 100) - 1, 0)]
+    assert histogram.percentile(percentile) == pytest.approx(expected, rel=0.01)
+    assert (histogram.count, histogram.sum) == (10_000, pytest.approx(sum(values)))
+
+
+def test_histogram_percentiles_are_never_outside_the_values_seen():
+    histogram = Histogram()
+    histogram.add(0)
+    histogram.add(10_000_000)
+
+    assert histogram.percentile(50) == 0
+    assert histogram.percentile(100) == 10_000_000
+    assert len(histogram.buckets) == 2
+
+
+def test_histogram_with_no_values():
+    assert Histogram().percentile(50) is None
+
+
+def test_aggregating_client_is_used_if_configured(app):
+    app.config['STATSD_ENABLED'] = True
+    app.config['STATSD_AGGREGATE_TIMINGS'] = True
+    client = StatsdClient()
+    client.init_app(app)
+
+    assert isinstance(client.statsd_client, BufferedNotifyStatsClient)
+    assert client.statsd_client._aggregate_timings is True
+    client.statsd_client.close()
+
+
+def test_buffered_client_aggregates_timings(buffered_stats_client):
+    buffered_stats_client._aggregate_timings = True
+
+    for delta in (10, 20, 30, 40):
+        buffered_stats_client.timing('a', delta)
+    buffered_stats_client.timing('b', timedelta(seconds=1))
+    buffered_stats_client.flush()
+
+    buffered_stats_client._send.assert_called_once_with('\n'.join([
+        'prefix.a.count:4|c',
+        'prefix.a.sum:100.000000|c',
+        'prefix.a.p50:{:.6f}|g'.format(Histogram().lowest * 1.02 ** (Histogram()._index(20) - 0.5)),
+        'prefix.a.p95:40.000000|g',
+        'prefix.a.p99:40.000000|g',
+        'prefix.b.count:1|c',
+        'prefix.b.sum:1000.000000|c',
+        'prefix.b.p50:1000.000000|g',
+        'prefix.b.p95:1000.000000|g',
+        'prefix.b.p99:1000.000000|g',
+    ]))
+    assert buffered_stats_client._histograms == {}
+
+
+def test_buffered_client_only_aggregates_a_limited_number_of_stats(buffered_stats_client, mocker):
+    mocker.patch('random.random', return_value=0)
+    buffered_stats_client._aggregate_timings = True
+    buffered_stats_client._max_aggregated_stats = 1
+
+    buffered_stats_client.timing('a', 10)
+    buffered_stats_client.timing('b', 20)
+    buffered_stats_client.timing('a', 30, rate=0.5)
+    buffered_stats_client.flush()
+
+    lines = buffered_stats_client._send.call_args[0][0].split('\n')
+    assert lines[:2] == ['prefix.b:20.000000|ms', 'prefix.a:30.000000|ms|@0.5']
+    assert lines[2:4] == ['prefix.a.count:1|c', 'prefix.a.sum:10.000000|c']
@@ -1,6 +1,9 @@
-from unittest.mock import ANY, Mock
+import asyncio
+from unittest.mock import ANY, Mock, call
 
-from notifications_utils.statsd_decorators import statsd
+import pytest
+
+from notifications_utils.statsd_decorators import StatsdTimer, statsd
 
 
 class AnyStringWith(str):
@@ -24,5 +27,117 @@ def test_should_call_statsd(app, mocker):
 
     assert test_function()
     mock_logger.assert_called_once_with(AnyStringWith("test call test_function took "))
-    app.statsd_client.incr.assert_called_once_with("test.test_function")
-    app.statsd_client.timing.assert_called_once_with("test.test_function", ANY)
+    app.statsd_client.incr.assert_called_once_with("test.test_function", rate=1)
+    app.statsd_client.timing.assert_called_once_with("test.test_function", ANY, 1)
+
+
+def test_should_call_statsd_with_failed_stat_if_function_raises(app):
+    app.statsd_client = Mock()
+
+    @statsd(namespace="test")
+    def test_function():
+        raise ValueError('oops')
+
+    with pytest.raises(ValueError):
+        test_function()
+
+    app.statsd_client.incr.assert_called_once_with("test.test_function.failed", rate=1)
+    app.statsd_client.timing.assert_called_once_with("test.test_function.failed", ANY, 1)
+
+
+def test_should_use_client_and_rate_if_given_outside_app_context():
+    client = Mock()
+
+    @statsd(namespace="test", client=client, rate=0.1)
+    def test_function():
+        return True
+
+    assert test_function()
+    assert client.mock_calls == [
+        call.incr("test.test_function", rate=0.1),
+        call.timing("test.test_function", ANY, 0.1),
+    ]
+
+
+def test_should_do_nothing_outside_app_context_without_client():
+
+    @statsd(namespace="test")
+    def test_function():
+        return True
+
+    assert test_function()
+
+
+def test_should_time_generators_until_exhausted(mocker):
+    mocker.patch('time.monotonic', side_effect=[1, 5])
+    client = Mock()
+
+    @statsd(namespace="test", client=client)
+    def test_generator():
+        yield 1
+        yield 2
+
+    generator = test_generator()
+    assert client.mock_calls == []
+    assert list(generator) == [1, 2]
+    assert client.mock_calls == [
+        call.incr("test.test_generator", rate=1),
+        call.timing("test.test_generator", 4, 1),
+    ]
+
+
+def test_closing_a_generator_early_isnt_a_failure():
+    client = Mock()
+
+    @statsd(namespace="test", client=client)
+    def test_generator():
+        yield 1
+        yield 2
+
+    generator = test_generator()
+    next(generator)
+    generator.close()
+
+    client.incr.assert_called_once_with("test.test_generator", rate=1)
+
+
+def test_should_time_async_functions():
+    client = Mock()
+
+    @statsd(namespace="test", client=client)
+    async def test_function():
+        await asyncio.sleep(0.01)
+        raise ValueError('oops')
+
+    with pytest.raises(ValueError):
+        asyncio.run(test_function())
+
+    client.incr.assert_called_once_with("test.test_function.failed", rate=1)
+    assert client.timing.call_args[0][1] >= 0.01
+
+
+def test_should_time_async_generators():
+    client = Mock()
+
+    @statsd(namespace="test", client=client)
+    async def test_generator():
+        yield 1
+        await asyncio.sleep(0)
+        yield 2
+
+    async def consume():
+        return [item async for item in test_generator()]
+
+    assert asyncio.run(consume()) == [1, 2]
+    client.incr.assert_called_once_with("test.test_generator", rate=1)
+
+
+def test_statsd_timer():
+    client = Mock()
+
+    with StatsdTimer('test.block', client=client) as timer:
+        pass
+
+    assert timer.failed is False
+    assert timer.elapsed_time >= 0
+    client.timing.assert_called_once_with('test.block', timer.elapsed_time, 1)
@@ -1,6 +1,7 @@
 import datetime
 import os
 from functools import partial
+from random import Random
 from time import process_time
 from unittest import mock
 
@@ -10,6 +11,7 @@ from flask import Markup
 from freezegun import freeze_time
 from orderedset import OrderedSet
 
+from notifications_utils import template as template_module
 from notifications_utils.formatters import unlink_govuk_escaped
 from notifications_utils.template import (
     BaseBroadcastTemplate,
@@ -28,6 +30,12 @@ from notifications_utils.template import (
     SMSPreviewTemplate,
     SubjectMixin,
     Template,
+    compile_email_markdown,
+    count_extended_gsm_chars,
+    get_email_chrome,
+    get_sms_counts_for_fixed_content,
+    get_sms_fragment_count,
+    non_gsm_characters,
 )
 
 
@@ -2541,3 +2549,223 @@ def test_broadcast_message_single_counts_diacritics_in_gsm(
     })
     assert template.encoded_content_count == 1
     assert template.max_content_count == 1_395
+
+
+@pytest.mark.parametrize('template_class', (
+    SMSMessageTemplate,
+    SMSPreviewTemplate,
+    BroadcastMessageTemplate,
+))
+def test_sms_counts_from_compiled_content_match_rendering_whole_message(template_class):
+    random = Random(0)
+    pieces = (
+        'a', 'Hello', ' ', '  ', '\n', '\n\n\n', '\t', ',', '.', ' ,', ' .', '^', '€', '[x]', 'â', 'ŵ', 'ÿ', '…',
+        '“quotes”', '🚀', '\u200B', '\u00A0', 'http://example.com', '((name))', '((other))', '((show??yes ))',
+    )
+    values = (
+        None, '', 'Jo', ' Jo', 'Jo ', ',', '.Jo', 'Jo.', 'J,o', '\n', '^^', 'ŵâ', 'ÿ', '…', '🚀', '\u200B', 5,
+        ['a', 'b'], 'yes', 'no', 'Jo Smith', 'a  b', 'a\n\n\n\nb', 'a\n  b', 'x ,y', 'x\t.', 'a\u200Bb',
+        'a \u200B b', 'a\x1cb', 'ŵ … ^',
+    )
+
+    for _ in range(500):
+        template = template_class(
+            {
+                'content': ''.join(random.choice(pieces) for _ in range(random.randrange(1, 10))),
+                'template_type': template_class.template_type,
+            },
+        )
+        template.prefix = random.choice((None, 'Service', 'A  service '))
+        template.values = {
+            key: random.choice(values) for key in ('name', 'other', 'show') if random.random() > 0.2
+        }
+
+        rendered = template._get_unsanitised_content()
+        assert template.content_count == len(rendered), repr(template)
+        assert template.fragment_count == get_sms_fragment_count(
+            len(rendered) + count_extended_gsm_chars(str(template)),
+            non_gsm_characters(str(template)),
+        ), repr(template)
+
+
+def test_sms_counts_for_fixed_content_are_only_worked_out_once(mocker):
+    get_sms_counts_for_fixed_content.cache_clear()
+    render_mock = mocker.patch(
+        'notifications_utils.template.BaseSMSTemplate._get_unsanitised_content',
+    )
+    template = SMSMessageTemplate({'content': 'Hello ((name)), bye', 'template_type': 'sms'})
+
+    for name, expected_count in (('Jo', 13), ('Chris', 16), ('Alex', 15)):
+        template.values = {'name': name}
+        assert template.content_count == expected_count
+        assert template.fragment_count == 1
+
+    assert render_mock.called is False
+    assert get_sms_counts_for_fixed_content.cache_info().misses == 1
+
+
+BATCH_OF_VALUES = (
+    {'name': 'Jo', 'colour': 'red'},
+    {'name': '<em>Chris</em>', 'colour': 'a very long\n\n\ncolour ' * 50},
+    {'name': 'Alex'},
+    {},
+)
+
+
+@pytest.mark.parametrize('extra_args', (
+    {},
+    {'govuk_banner': False, 'complete_html': False},
+    {'brand_logo': 'http://example.com/{logo}.png', 'brand_text': 'Brand (( text ))', 'brand_banner': True},
+    {'brand_name': 'Brand & co', 'brand_colour': '#000000'},
+))
+def test_render_many_html_email_matches_rendering_one_at_a_time(extra_args):
+    template = HTMLEmailTemplate(
+        {
+            'content': 'Hello ((name))\n\n* your colour is ((colour))',
+            'subject': 'Hi ((name))',
+            'template_type': 'email',
+        },
+        **extra_args
+    )
+    rendered = list(template.render_many(BATCH_OF_VALUES))
+
+    assert len(rendered) == len(BATCH_OF_VALUES)
+
+    for values, (subject, plain_text, html, fragment_count) in zip(BATCH_OF_VALUES, rendered):
+        plain_text_template = PlainTextEmailTemplate(
+            {'content': template.content, 'subject': template._subject, 'template_type': 'email'},
+            values,
+        )
+        assert subject == plain_text_template.subject
+        assert plain_text == str(plain_text_template)
+        assert html == str(HTMLEmailTemplate(
+            {'content': template.content, 'subject': template._subject, 'template_type': 'email'},
+            values,
+            **extra_args
+        ))
+        assert fragment_count is None
+
+
+def test_render_many_renders_email_branding_once(mocker):
+    get_email_chrome.cache_clear()
+    jinja_mock = mocker.spy(HTMLEmailTemplate.jinja_template, 'render')
+    template = HTMLEmailTemplate(
+        {'content': 'Hello ((name))', 'subject': 'Hi', 'template_type': 'email'},
+        brand_name='unique to this test',
+    )
+
+    for _ in template.render_many(BATCH_OF_VALUES):
+        pass
+
+    assert jinja_mock.call_count == 1
+
+
+@pytest.mark.parametrize('template_class', (
+    SMSMessageTemplate,
+    SMSPreviewTemplate,
+))
+def test_render_many_sms_matches_rendering_one_at_a_time(template_class):
+    template = template_class({'content': 'Hello ((name)), ((colour))', 'template_type': 'sms'}, prefix='Service')
+
+    for values, (subject, plain_text, html, fragment_count) in zip(
+        BATCH_OF_VALUES, template.render_many(BATCH_OF_VALUES)
+    ):
+        one_at_a_time = SMSMessageTemplate(
+            {'content': template.content, 'template_type': 'sms'}, values, prefix='Service'
+        )
+        assert subject is None
+        assert plain_text == str(one_at_a_time)
+        assert html is None
+        assert fragment_count == one_at_a_time.fragment_count
+
+
+def test_render_many_is_lazy():
+    template = PlainTextEmailTemplate({'content': 'Hello ((name))', 'subject': 'Hi', 'template_type': 'email'})
+
+    def values():
+        yield {'name': 'Jo'}
+        raise AssertionError('Should not be consumed')
+
+    assert next(template.render_many(values())) == (
+        'Hi', 'Hello Jo\n', None, None,
+    )
+
+
+@pytest.mark.parametrize('content, values', [
+    ('* ((n)). Done', {'n': '1'}),
+    ('1. ((b))\t\n---', {'b': 'Jo Smith'}),
+    ('-- ((code)). Thanks', {'code': '2020'}),
+    ('-* ((code)). Thanks', {'code': '2020'}),
+])
+def test_html_body_from_compiled_markdown_matches_rendering_whole_message_for_lists_and_tabs(content, values):
+    template = HTMLEmailTemplate({'content': content, 'subject': 'subject', 'template_type': 'email'}, values)
+    expected = template.html_body
+    template.compile_markdown = True
+    assert template.html_body == expected
+
+
+def test_html_body_from_compiled_markdown_matches_rendering_whole_message():
+    random = Random(0)
+    pieces = (
+        'a', 'Hello', ' ', '  ', '\n', '\n\n', '# ', '* ', '1. ', '- ', '+ ', '^ ', '---', '    ', '\t', ',', '.',
+        '. Done', ':', ')', '(', '--', '-*', '2020', '>',
+        '"', "'", '‘', '@', 'x@y.com', '[link](https://example.com/', ']', '[', '](', 'https://www.gov.uk/', 'GOV',
+        '.UK', ' - ', '<b>', '&amp;', '|', '![img](', '[^1]', '\\', '((name))', '((other))', '((show??yes sir))',
+        '((show??"q"))', '((list))',
+    )
+    values = (
+        'Jo', 'Jo Smith', '12', '1', 'GOV', 'UK', 'a-b', 'a/b', 'http', 'x@y', "O'Brien", '', None, '"', 'A  B',
+        '---', ['a', 'b'], 'yes', 'no', 'é', 'a_b',
+    )
+
+    for _ in range(2_000):
+        template = HTMLEmailTemplate(
+            {
+                'content': ''.join(random.choice(pieces) for _ in range(random.randrange(1, 14))),
+                'subject': 'subject',
+                'template_type': 'email',
+            },
+            {key: random.choice(values) for key in ('name', 'other', 'show', 'list') if random.random() > 0.1},
+        )
+        expected = template.html_body
+        template.compile_markdown = True
+        assert template.html_body == expected, repr(template)
+
+
+@pytest.mark.parametrize('content, values, expected_compiled', (
+    ('Dear ((name)),\n\nYour reference is ((ref)).', {'name': 'Jo Smith', 'ref': 'ABC-123'}, True),
+    ('No placeholders', {}, True),
+    ('Dear ((name))', {}, False),
+    ('Dear ((name))', {'name': 'Jo'}, True),
+    ('Dear ((name))', {'name': '<b>Jo</b>'}, False),
+    ('Dear ((name))', {'name': ''}, False),
+    ('Dear ((name))', {'name': ['Jo', 'Chris']}, False),
+    ('Dear ((name))’s', {'name': 'Jo'}, False),
+    ('((number)). thing', {'number': '1'}, False),
+    ('[Click here](https://example.com/((path)))', {'path': 'foo'}, False),
+    ('Visit ((name)).UK', {'name': 'GOV'}, False),
+))
+def test_html_body_only_uses_compiled_markdown_for_inert_values(content, values, expected_compiled):
+    template = HTMLEmailTemplate(
+        {'content': content, 'subject': 'subject', 'template_type': 'email'}, values, compile_markdown=True
+    )
+    assert template.html_body == HTMLEmailTemplate(
+        {'content': content, 'subject': 'subject', 'template_type': 'email'}, values
+    ).html_body
+    assert (template._get_html_body_from_compiled_markdown() is not None) == expected_compiled
+
+
+def test_compiled_markdown_is_only_parsed_once(mocker):
+    compile_email_markdown.cache_clear()
+    markdown_mock = mocker.spy(template_module, 'notify_email_markdown')
+    template = HTMLEmailTemplate(
+        {'content': '# Hello ((name))\n\n* one\n* two', 'subject': 'subject', 'template_type': 'email'},
+        compile_markdown=True,
+    )
+
+    for name in ('Jo', 'Chris', 'Alex'):
+        template.values = {'name': name}
+        assert '<h2 style="Margin: 0 0 20px 0; padding: 0; font-size: 27px; line-height: 35px; font-weight: bold; ' \
+            'color: #0B0C0C;">Hello {}</h2>'.format(name) in template.html_body
+
+    assert markdown_mock.call_count == 1
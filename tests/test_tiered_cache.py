@@ -0,0 +1,135 @@
+from unittest import mock
+
+import pytest
+
+from notifications_utils.tiered_cache import TieredCache
+from notifications_utils.version import __version__
+
+
+@pytest.fixture
+def function():
+    return mock.Mock(side_effect=str.upper)
+
+
+@pytest.fixture
+def redis_client():
+    redis_client = mock.Mock(active=True)
+    redis_client.get_many.side_effect = lambda keys, chunk_size: [None for key in keys]
+    return redis_client
+
+
+def test_get_only_calls_function_once_per_key(function):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+
+    assert [cache.get(key) for key in 'aab'] == ['A', 'A', 'B']
+
+    assert function.call_args_list == [mock.call('a'), mock.call('b')]
+    assert (cache.hits, cache.redis_hits, cache.misses, len(cache)) == (1, 0, 2, 2)
+
+
+def test_get_doesnt_use_redis(function, redis_client):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.redis_client = redis_client
+
+    assert cache.get('a') == 'A'
+    assert redis_client.mock_calls == []
+
+
+def test_get_many_without_redis(function):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.get('a')
+
+    assert cache.get_many(['b', 'a', 'b', 'c']) == ['B', 'A', 'B', 'C']
+    assert cache.get_many(iter('cab')) == ['C', 'A', 'B']
+
+    assert function.call_args_list == [mock.call('a'), mock.call('b'), mock.call('c')]
+    assert (cache.hits, cache.redis_hits, cache.misses, len(cache)) == (4, 0, 3, 3)
+
+
+def test_get_many_looks_up_keys_not_cached_locally_in_redis(function, redis_client):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.redis_client = redis_client
+    cache.get('a')
+    redis_client.get_many.side_effect = lambda keys, chunk_size: [b'B from redis', None]
+
+    assert cache.get_many(['a', 'b', 'c', 'b']) == ['A', 'B from redis', 'C', 'B from redis']
+
+    redis_client.get_many.assert_called_once_with([cache.redis_key('b'), cache.redis_key('c')], chunk_size=1000)
+    redis_client.set_many.assert_called_once_with({cache.redis_key('c'): 'C'}, ex=TieredCache.TTL, chunk_size=1000)
+    assert function.call_args_list == [mock.call('a'), mock.call('c')]
+    assert (cache.hits, cache.redis_hits, cache.misses) == (1, 1, 2)
+
+    # Everything is now cached locally
+    assert cache.get_many(['a', 'b', 'c']) == ['A', 'B from redis', 'C']
+    assert redis_client.get_many.call_count == 1
+
+
+def test_get_many_doesnt_use_redis_if_not_active(function, redis_client):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.redis_client = redis_client
+    redis_client.active = False
+
+    assert cache.get_many(['a']) == ['A']
+    assert redis_client.mock_calls == []
+
+
+def test_redis_keys_are_hashed_and_versioned():
+    cache = TieredCache(str.upper, name='upper', config_prefix='UPPER')
+    key = cache.redis_key('test@example.com')
+
+    assert key.startswith('upper-{}-'.format(__version__))
+    assert 'example' not in key
+    assert len(key) == len(cache.redis_key('a'))
+    assert key != cache.redis_key('Test@example.com')
+
+
+def test_init_app_reads_config(app, redis_client):
+    app.config['UPPER_SIZE'] = 2
+    app.config['UPPER_TTL'] = 60
+    cache = TieredCache(str.upper, name='upper', config_prefix='UPPER')
+
+    cache.init_app(app, redis_client)
+    cache.get_many('abc')
+
+    assert len(cache) == 2
+    assert cache.redis_client == redis_client
+    redis_client.set_many.assert_called_once_with(mock.ANY, ex=60, chunk_size=1000)
+
+
+def test_init_app_uses_defaults_without_config(app):
+    cache = TieredCache(str.upper, name='upper', config_prefix='UPPER', maxsize=5)
+    cache.init_app(app)
+    assert (cache._cache.maxsize, cache.ttl, cache.redis_client) == (5, TieredCache.TTL, None)
+
+
+def test_send_stats_sends_counts_since_last_sent(function, redis_client):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.redis_client = redis_client
+    redis_client.get_many.side_effect = lambda keys, chunk_size: [b'C'] * len(keys)
+    statsd_client = mock.Mock()
+
+    cache.get('a')
+    cache.get('a')
+    cache.get('b')
+    cache.get_many(['c'])
+
+    cache.send_stats(statsd_client)
+    cache.send_stats(statsd_client)
+
+    assert statsd_client.mock_calls == [
+        mock.call.incr('upper.hit', count=1),
+        mock.call.incr('upper.redis-hit', count=1),
+        mock.call.incr('upper.miss', count=2),
+        mock.call.gauge('upper.size', 3),
+        mock.call.incr('upper.hit', count=0),
+        mock.call.incr('upper.redis-hit', count=0),
+        mock.call.incr('upper.miss', count=0),
+        mock.call.gauge('upper.size', 3),
+    ]
+
+
+def test_clear(function):
+    cache = TieredCache(function, name='upper', config_prefix='UPPER')
+    cache.get('a')
+    cache.clear()
+    assert (cache.hits, cache.redis_hits, cache.misses, len(cache)) == (0, 0, 0, 0)